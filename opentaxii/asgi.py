@@ -0,0 +1,7 @@
+from .common.asgi import ASGIAdapter
+from .http import app as wsgi_app
+from .http import config_obj
+
+# ASGI application, served with e.g. ``uvicorn opentaxii.asgi:app``.
+# Requests run in a pool of threads, see ``ASGIAdapter``.
+app = ASGIAdapter(wsgi_app, **(config_obj.get("asgi") or {}))
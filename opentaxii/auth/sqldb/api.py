@@ -1,3 +1,7 @@
+import copy
+import hashlib
+import hmac
+import os
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -6,6 +10,7 @@ import structlog
 from sqlalchemy.orm import exc
 
 from opentaxii.auth import OpenTAXIIAuthAPI
+from opentaxii.common.cache import TTLCache
 from opentaxii.common.sqldb import BaseSQLDatabaseAPI
 from opentaxii.entities import Account as AccountEntity
 
@@ -27,6 +32,10 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIAuthAPI):
         create_tables: bool = False,
         secret: Optional[str] = None,
         token_ttl_secs: Optional[int] = None,
+        account_cache_size: int = 1024,
+        account_cache_ttl_secs: int = 60,
+        credentials_cache_size: int = 1024,
+        credentials_cache_ttl_secs: int = 60,
         **engine_parameters,
     ):
         """Naive SQL database implementation of OpenTAXII Auth API.
@@ -39,6 +48,18 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIAuthAPI):
         :param create_tables=False: if True, tables will be created in the DB.
         :param secret: secret string used for token generation
         :param token_ttl_secs: TTL for JWT token, in seconds.
+        :param account_cache_size: max number of tokens to keep the account for
+        :param account_cache_ttl_secs: time accounts are kept for a token, in
+            seconds. Accounts changed by other processes can be served
+            for this long. 0 disables the cache.
+        :param credentials_cache_size: max number of username/password pairs
+            to keep the issued token for
+        :param credentials_cache_ttl_secs: time issued tokens are reused for
+            the same username and password, in seconds. 0 disables the cache.
+        :param pool: connection pool settings, see
+            :func:`opentaxii.sqldb_helper.get_engine`
+        :param statement_timeout_secs: if defined, statements running longer
+            are cancelled, on PostgreSQL and MySQL
         :param engine_parameters=None: if defined, these arguments would be passed
             to sqlalchemy.create_engine
         """
@@ -50,15 +71,35 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIAuthAPI):
             )
         self.secret = secret
         self.token_ttl_secs = token_ttl_secs or 60 * 60  # 60min
+        self.account_cache = TTLCache(account_cache_size, account_cache_ttl_secs)
+        self.credentials_cache = TTLCache(
+            credentials_cache_size, credentials_cache_ttl_secs
+        )
+        # Credentials are cached under a keyed digest, so that neither
+        # passwords nor plain password hashes are kept in memory.
+        self._credentials_key = os.urandom(32)
 
     def authenticate(self, username: str, password: str) -> str | None:
+        credentials_digest = hmac.new(
+            self._credentials_key,
+            f"{len(username)}:{username}:{password}".encode("utf-8"),
+            hashlib.sha256,
+        ).digest()
+        token = self.credentials_cache.get(credentials_digest)
+        if token is not None:
+            return token
         try:
             account = self.db.session.query(Account).filter_by(username=username).one()
         except exc.NoResultFound:
             return None
         if not account.is_password_valid(password):
             return None
-        return self._generate_token(account.id, ttl=self.token_ttl_secs)
+        token = self._generate_token(account.id, ttl=self.token_ttl_secs)
+        payload = self._decode_token(token)
+        self.credentials_cache.set(
+            credentials_digest, token, expires_at=payload and payload.get('exp')
+        )
+        return token
 
     def create_account(
         self, username: str, password: str, is_admin: bool = False
@@ -72,13 +113,21 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIAuthAPI):
         return account_to_account_entity(account)
 
     def get_account(self, token: str) -> AccountEntity | None:
-        account_id = self._get_account_id(token)
-        if not account_id:
+        cached = self.account_cache.get(token)
+        if cached is not None:
+            # callers may change the entity, keep the cached one to ourselves
+            return copy.deepcopy(cached)
+        payload = self._decode_token(token)
+        if not payload or not payload.get('account_id'):
             return None
-        account = self.db.session.query(Account).get(account_id)
+        account = self.db.session.query(Account).get(payload['account_id'])
         if not account:
             return None
-        return account_to_account_entity(account)
+        entity = account_to_account_entity(account)
+        self.account_cache.set(
+            token, copy.deepcopy(entity), expires_at=payload.get('exp')
+        )
+        return entity
 
     def delete_account(self, username: str):
         account = (
@@ -87,6 +136,8 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIAuthAPI):
         if account:
             self.db.session.delete(account)
             self.db.session.commit()
+        self.account_cache.clear()
+        self.credentials_cache.clear()
 
     def get_accounts(self):
         return [
@@ -110,6 +161,8 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIAuthAPI):
         account.permissions = obj.permissions
         account.is_admin = obj.is_admin
         self.db.session.commit()
+        self.account_cache.clear()
+        self.credentials_cache.clear()
         return account_to_account_entity(account)
 
     def _generate_token(self, account_id, ttl=None):
@@ -121,9 +174,9 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIAuthAPI):
             algorithm="HS256",
         )
 
-    def _get_account_id(self, token):
+    def _decode_token(self, token):
         try:
-            payload = jwt.decode(token, self.secret, algorithms=["HS256"])
+            return jwt.decode(token, self.secret, algorithms=["HS256"])
         except jwt.ExpiredSignatureError:
             log.warning('Invalid token used', token=token)
             return
@@ -131,8 +184,6 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIAuthAPI):
             log.warning('Can not decode a token', token=token)
             return
 
-        return payload.get('account_id')
-
 
 def account_to_account_entity(account: Account) -> AccountEntity:
     return AccountEntity(
@@ -1,4 +1,6 @@
 import argparse
+import threading
+import time
 import uuid
 
 import structlog
@@ -175,3 +177,109 @@ def job_cleanup():
     """CLI command to clean up taxii2 job logs that are >24h old."""
     number_removed = app.taxii_server.servers.taxii2.persistence.api.job_cleanup()
     print(f"{number_removed} removed")
+
+
+def upgrade_db():
+    """CLI command to add the columns and indexes missing from older databases."""
+    added = app.taxii_server.servers.taxii2.persistence.api.upgrade_schema()
+    for name in added:
+        print(f"{name} added")
+    print(f"{len(added)} columns and indexes added")
+
+
+def backfill_version_flags():
+    """CLI command to (re)compute taxii2 first/last version flags of stix objects."""
+    number_processed = (
+        app.taxii_server.servers.taxii2.persistence.api.backfill_version_flags()
+    )
+    print(f"{number_processed} objects processed")
+
+
+def backfill_watermarks():
+    """CLI command to (re)compute the change watermarks of all collections."""
+    servers = app.taxii_server.servers
+    with app.app_context():
+        if servers.taxii1:
+            number_processed = servers.taxii1.persistence.api.backfill_watermarks()
+            print(f"{number_processed} taxii1 collections processed")
+        if servers.taxii2:
+            number_processed = servers.taxii2.persistence.api.backfill_watermarks()
+            print(f"{number_processed} taxii2 collections processed")
+
+
+def recompress():
+    """CLI command to rewrite stored payloads with the configured compression."""
+    parser = argparse.ArgumentParser(
+        description=(
+            "Rewrite stored taxii1 content blocks and taxii2 stix objects with "
+            "the compression configured for their persistence api."
+        ),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="number of rows rewritten per transaction",
+    )
+    args = parser.parse_args()
+    servers = app.taxii_server.servers
+    with app.app_context():
+        if servers.taxii1:
+            number_rewritten = servers.taxii1.persistence.api.recompress_content_blocks(
+                batch_size=args.batch_size
+            )
+            print(f"{number_rewritten} content blocks rewritten")
+        if servers.taxii2:
+            number_rewritten = servers.taxii2.persistence.api.recompress_objects(
+                batch_size=args.batch_size
+            )
+            print(f"{number_rewritten} stix objects rewritten")
+
+
+def run_job_worker():
+    """CLI command to process taxii2 jobs queued in ``async_jobs`` mode."""
+    parser = argparse.ArgumentParser(
+        description=(
+            "Process pending taxii2 jobs. "
+            "Multiple workers can run side by side, also on different hosts."
+        ),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-t", "--threads", type=int, default=1, help="number of worker threads"
+    )
+    parser.add_argument(
+        "-i",
+        "--poll-interval",
+        type=float,
+        default=1.0,
+        help="seconds to wait before polling again when there are no pending jobs",
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="exit when there are no pending jobs left",
+    )
+    args = parser.parse_args()
+    server = app.taxii_server.servers.taxii2
+
+    def work():
+        while True:
+            try:
+                with app.app_context():
+                    job_id = server.process_pending_job()
+            except Exception:
+                log.exception("job_worker.failed")
+                job_id = None
+            if job_id is None:
+                if args.once:
+                    return
+                time.sleep(args.poll_interval)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
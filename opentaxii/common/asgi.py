@@ -0,0 +1,303 @@
+"""Serve the WSGI application to ASGI servers, see :class:`ASGIAdapter`."""
+
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import unquote_to_bytes
+
+import structlog
+
+log = structlog.get_logger(__name__)
+
+# messages from the worker thread to the event loop
+_START = "start"
+_BODY = "body"
+_END = "end"
+_ERROR = "error"
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class ASGIAdapter:
+    """
+    ASGI application that runs a WSGI application in a pool of threads.
+
+    Request bodies are received on the event loop before a thread is used,
+    and responses are sent from the event loop, so slow clients do not hold
+    a thread while they upload or download. A thread runs one request at a
+    time: it calls the WSGI application and produces the response body, up to
+    ``response_buffer`` chunks ahead of the client. Responses that are built
+    in memory release their thread before they are sent.
+
+    Database sessions and the request context stay scoped to the thread
+    that runs the request, as with a threaded WSGI server.
+
+    :param app: the WSGI application to serve
+    :param int threads: number of threads that run requests
+    :param int max_request_size: maximum size of a request body in bytes,
+        larger requests are answered with 413
+    :param int response_buffer: number of response chunks produced ahead of
+        the client
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        threads: int = 32,
+        max_request_size: Optional[int] = None,
+        response_buffer: int = 16,
+    ):
+        self.app = app
+        self.threads = threads
+        self.max_request_size = max_request_size
+        self.response_buffer = response_buffer
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="opentaxii-asgi"
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        """Wait for running requests and stop the threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle_http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await asyncio.get_running_loop().run_in_executor(None, self.shutdown)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive) -> bytes:
+        """
+        Receive the whole request body.
+
+        :raises RequestTooLarge: if the body exceeds ``max_request_size``
+        """
+        chunks: List[bytes] = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ConnectionAbortedError()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if self.max_request_size is not None and size > self.max_request_size:
+                raise RequestTooLarge()
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+        return b"".join(chunks)
+
+    async def handle_http(self, scope, receive, send):
+        try:
+            body = await self.read_body(receive)
+        except RequestTooLarge:
+            await send_plain_response(send, 413, b"Request Entity Too Large")
+            return
+        except ConnectionAbortedError:
+            return
+        environ = build_environ(scope, body)
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        slots = threading.Semaphore(self.response_buffer)
+        cancelled = threading.Event()
+
+        def put(*message):
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+        future = loop.run_in_executor(
+            self.executor, run_wsgi_app, self.app, environ, put, slots, cancelled
+        )
+        disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+        started = False
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                await asyncio.wait(
+                    [get, disconnect], return_when=asyncio.FIRST_COMPLETED
+                )
+                if not get.done():
+                    get.cancel()
+                    break
+                kind, value = get.result()
+                if kind == _START:
+                    status, headers = value
+                    started = True
+                    await send(
+                        {
+                            "type": "http.response.start",
+                            "status": status,
+                            "headers": headers,
+                        }
+                    )
+                elif kind == _BODY:
+                    await send(
+                        {"type": "http.response.body", "body": value, "more_body": True}
+                    )
+                    slots.release()
+                elif kind == _ERROR:
+                    log.error("asgi.request.failed", exc_info=value)
+                    if not started:
+                        await send_plain_response(send, 500, b"Internal Server Error")
+                    break
+                else:
+                    await send({"type": "http.response.body", "body": b""})
+                    break
+        finally:
+            disconnect.cancel()
+            cancelled.set()
+            # let a worker that waits for a slot see the cancellation
+            slots.release()
+        await future
+
+
+async def wait_for_disconnect(receive) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def send_plain_response(send, status: int, body: bytes) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def build_environ(scope, body: bytes) -> dict:
+    """Build the WSGI environ of an ASGI http ``scope``."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    # WSGI strings are bytes decoded as latin-1, PATH_INFO is percent-decoded
+    raw_path = scope.get("raw_path")
+    if raw_path:
+        path = unquote_to_bytes(raw_path.split(b"?", 1)[0])
+    else:
+        path = scope["path"].encode("utf-8")
+    root_path = scope.get("root_path", "").encode("utf-8")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path) :]
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root_path.decode("latin-1"),
+        "PATH_INFO": path.decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name == "CONTENT_LENGTH":
+            # the body is complete already
+            continue
+        if name != "CONTENT_TYPE":
+            name = f"HTTP_{name}"
+        if name in environ:
+            value = f"{environ[name]},{value}"
+        environ[name] = value
+    return environ
+
+
+def run_wsgi_app(
+    app: Callable,
+    environ: dict,
+    put: Callable,
+    slots: threading.Semaphore,
+    cancelled: threading.Event,
+) -> None:
+    """
+    Run a WSGI request and pass the response to the event loop with ``put``.
+
+    Runs in a worker thread. Every body chunk takes one of ``slots``, which
+    the event loop gives back once the chunk is sent.
+    """
+    response: List[Tuple[int, list]] = []
+    sent_start = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and sent_start:
+            raise exc_info[1].with_traceback(exc_info[2])
+        response[:] = [
+            (
+                int(status.split(" ", 1)[0]),
+                [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            )
+        ]
+        return write
+
+    def send_start():
+        if not sent_start:
+            sent_start.append(True)
+            put(_START, response[0])
+
+    def write(data: bytes) -> bool:
+        send_start()
+        if data:
+            slots.acquire()
+            if cancelled.is_set():
+                return False
+            put(_BODY, data)
+        return True
+
+    try:
+        app_iter = app(environ, start_response)
+        try:
+            for chunk in app_iter:
+                if not write(chunk):
+                    return
+            send_start()
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+    except BaseException as error:
+        put(_ERROR, error)
+    else:
+        put(_END, None)
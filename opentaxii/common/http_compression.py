@@ -0,0 +1,252 @@
+"""Content-Encoding of HTTP requests and responses, see :class:`CompressionMiddleware`."""
+
+import importlib
+import zlib
+from io import BytesIO
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import structlog
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import (
+    BadRequest,
+    HTTPException,
+    RequestEntityTooLarge,
+    UnsupportedMediaType,
+)
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import get_content_length, get_input_stream
+
+log = structlog.get_logger(__name__)
+
+GZIP = "gzip"
+DEFLATE = "deflate"
+BROTLI = "br"
+
+# Response encodings, preferred first when the client accepts several
+# with the same quality.
+RESPONSE_ENCODINGS = (BROTLI, GZIP, DEFLATE)
+# Request encodings, brotli is left out as its decoder cannot bound the size of
+# the output of a single chunk.
+REQUEST_ENCODINGS = (GZIP, DEFLATE)
+
+ZLIB_WBITS = {GZIP: 16 + zlib.MAX_WBITS, DEFLATE: zlib.MAX_WBITS}
+READ_CHUNK_SIZE = 64 * 1024
+
+COMPRESSIBLE_MIMETYPES = ("application/xml", "application/json", "text/")
+COMPRESSIBLE_SUFFIXES = ("+xml", "+json")
+
+
+def _brotli():
+    for name in ("brotli", "brotlicffi"):
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            continue
+    return None
+
+
+class _ZlibCompressor:
+    def __init__(self, encoding: str, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, ZLIB_WBITS[encoding])
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, brotli, level: int):
+        # brotli qualities go up to 11, map zlib levels onto the same range
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """Check if responses of ``content_type`` are worth compressing."""
+    if not content_type:
+        return False
+    mimetype = content_type.split(";", 1)[0].strip().lower()
+    return mimetype.startswith(COMPRESSIBLE_MIMETYPES) or mimetype.endswith(
+        COMPRESSIBLE_SUFFIXES
+    )
+
+
+class CompressionMiddleware:
+    """
+    WSGI middleware that handles ``Content-Encoding`` for the TAXII services.
+
+    Responses are compressed with the best encoding the client lists in
+    ``Accept-Encoding``: ``br`` (if ``brotli`` is installed), ``gzip`` or
+    ``deflate``. Streamed responses are compressed as they are written.
+    Request bodies sent with ``Content-Encoding: gzip`` or ``deflate``
+    are decompressed before they reach the application, so size limits
+    of the services apply to the decompressed body.
+
+    :param app: the WSGI application to wrap
+    :param bool responses: compress responses
+    :param bool requests: decompress request bodies
+    :param int min_size: responses with a smaller ``Content-Length`` are
+        not compressed
+    :param int level: compression level, from 1 (fastest) to 9 (smallest)
+    :param int max_request_size: maximum size of a request body in bytes,
+        before and after decompression
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        responses: bool = False,
+        requests: bool = True,
+        min_size: int = 1024,
+        level: int = 6,
+        max_request_size: Optional[int] = None,
+    ):
+        self.app = app
+        self.responses = responses
+        self.requests = requests
+        self.min_size = min_size
+        self.level = level
+        self.max_request_size = max_request_size
+        self._brotli = _brotli()
+        self.response_encodings = tuple(
+            encoding
+            for encoding in RESPONSE_ENCODINGS
+            if encoding != BROTLI or self._brotli is not None
+        )
+
+    def __call__(self, environ, start_response):
+        if self.requests and environ.get("HTTP_CONTENT_ENCODING"):
+            try:
+                self.decode_request(environ)
+            except HTTPException as error:
+                return error(environ, start_response)
+        encoding = None
+        if self.responses and environ.get("REQUEST_METHOD") != "HEAD":
+            encoding = self.choose_encoding(environ.get("HTTP_ACCEPT_ENCODING"))
+        if encoding is None:
+            return self.app(environ, start_response)
+        return self.encode_response(environ, start_response, encoding)
+
+    def choose_encoding(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """Pick the response encoding for an ``Accept-Encoding`` header value."""
+        if not accept_encoding:
+            return None
+        accept = parse_accept_header(accept_encoding)
+        best, best_quality = None, 0.0
+        for encoding in self.response_encodings:
+            quality = accept.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def decode_request(self, environ) -> None:
+        """
+        Replace the request body in ``environ`` with the decompressed body.
+
+        :raises UnsupportedMediaType: if the encoding is not supported
+        :raises BadRequest: if the body cannot be decompressed
+        :raises RequestEntityTooLarge: if the body is larger than
+            ``max_request_size``, before or after decompression
+        """
+        encoding = environ["HTTP_CONTENT_ENCODING"].strip().lower()
+        if encoding == "identity":
+            return
+        if encoding not in REQUEST_ENCODINGS:
+            raise UnsupportedMediaType(f"Unsupported Content-Encoding {encoding!r}")
+        limit = self.max_request_size
+        length = get_content_length(environ)
+        if limit is not None and length is not None and length > limit:
+            raise RequestEntityTooLarge()
+        stream = get_input_stream(environ)
+        decompressor = zlib.decompressobj(ZLIB_WBITS[encoding])
+        body: List[bytes] = []
+        size = 0
+        try:
+            while not decompressor.eof:
+                chunk = decompressor.unconsumed_tail or stream.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    raise BadRequest("Truncated request body")
+                max_length = 0 if limit is None else limit - size + 1
+                data = decompressor.decompress(chunk, max_length)
+                size += len(data)
+                if limit is not None and size > limit:
+                    raise RequestEntityTooLarge()
+                body.append(data)
+        except zlib.error as e:
+            raise BadRequest(f"Invalid {encoding} request body") from e
+        decoded = b"".join(body)
+        log.debug(
+            "http.request.decompressed",
+            encoding=encoding,
+            size=len(decoded),
+        )
+        environ["wsgi.input"] = BytesIO(decoded)
+        environ["CONTENT_LENGTH"] = str(len(decoded))
+        environ.pop("wsgi.input_terminated", None)
+        environ.pop("HTTP_TRANSFER_ENCODING", None)
+        del environ["HTTP_CONTENT_ENCODING"]
+
+    def make_compressor(self, encoding: str):
+        if encoding == BROTLI:
+            return _BrotliCompressor(self._brotli, self.level)
+        return _ZlibCompressor(encoding, self.level)
+
+    def should_encode(self, status: str, headers: Headers) -> bool:
+        code = int(status.split(" ", 1)[0])
+        if code < 200 or code in (204, 304):
+            return False
+        if "Content-Encoding" in headers:
+            return False
+        if not is_compressible(headers.get("Content-Type")):
+            return False
+        length = headers.get("Content-Length")
+        return length is None or int(length) >= self.min_size
+
+    def encode_response(self, environ, start_response, encoding: str):
+        started: List[Tuple[str, Headers, Optional[tuple]]] = []
+
+        def delayed_start_response(status, headers, exc_info=None):
+            started[:] = [(status, Headers(headers), exc_info)]
+            # the deprecated write callable is not supported
+            return None
+
+        app_iter = self.app(environ, delayed_start_response)
+        status, headers, exc_info = started[0]
+        if not self.should_encode(status, headers):
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return app_iter
+
+        headers.add("Vary", "Accept-Encoding")
+        headers["Content-Encoding"] = encoding
+        compressor = self.make_compressor(encoding)
+        if "Content-Length" in headers:
+            # the body is in memory already, compress it in one go
+            try:
+                body = compressor.compress(b"".join(app_iter)) + compressor.flush()
+            finally:
+                if hasattr(app_iter, "close"):
+                    app_iter.close()
+            headers["Content-Length"] = str(len(body))
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return [body]
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return _compress_stream(app_iter, compressor)
+
+
+def _compress_stream(app_iter: Iterable[bytes], compressor) -> Iterator[bytes]:
+    try:
+        for chunk in app_iter:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(app_iter, "close"):
+            app_iter.close()
@@ -1,6 +1,9 @@
+import functools
 from typing import ClassVar, Type
 
-from opentaxii.sqldb_helper import SQLAlchemyDB
+from sqlalchemy.exc import DBAPIError
+
+from opentaxii.sqldb_helper import SQLAlchemyDB, get_pool_stats
 
 try:
     from sqlalchemy.orm import DeclarativeMeta  # type: ignore[attr-defined]
@@ -27,3 +30,37 @@ class BaseSQLDatabaseAPI:
 
     def init_app(self, app):
         self.db.init_app(app)
+
+    def get_pool_stats(self):
+        """Get the usage of the connection pool, see :func:`.get_pool_stats`."""
+        return get_pool_stats(self.db.engine)
+
+
+def read_from_replica(method):
+    """
+    Run a read-only API method on a replica, if replicas are configured.
+
+    A replica that cannot be reached is marked down and the method is run
+    again on the next replica, or on the primary when no replica is up.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.db.get_read_bind() is not None:
+            # called from another read-only method
+            return method(self, *args, **kwargs)
+        while True:
+            replica = self.db.choose_replica()
+            if replica is None:
+                return method(self, *args, **kwargs)
+            try:
+                with self.db.read_from(replica):
+                    return method(self, *args, **kwargs)
+            except DBAPIError as error:
+                # errors without statement are raised while connecting
+                if not error.connection_invalidated and error.statement is not None:
+                    raise
+                self.db.session.rollback()
+                self.db.mark_replica_down(replica)
+
+    return wrapper
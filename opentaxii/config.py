@@ -46,6 +46,10 @@ class ServerConfig(dict):
         "return_server_error_details",
         "logging",
         "auth_api",
+        "http_compression",
+        "asgi",
+        "metrics",
+        "query_profiler",
         "taxii1",
         "taxii2",
     )
@@ -55,6 +59,7 @@ class ServerConfig(dict):
         "xml_parser_supports_huge_tree",
         "count_blocks_in_poll_responses",
         "unauthorized_status",
+        "services_cache_ttl",
         "hooks",
     )
     VALID_TAXII2_OPTIONS = (
@@ -64,6 +69,14 @@ class ServerConfig(dict):
         "title",
         "public_discovery",
         "allow_custom_properties",
+        "async_jobs",
+        "job_batch_size",
+        "job_max_attempts",
+        "stream_objects",
+        "validation_processes",
+        "validation_parallel_threshold",
+        "validation_level",
+        "json_codec",
     )
     ALL_VALID_OPTIONS = VALID_BASE_OPTIONS + VALID_TAXII_OPTIONS + VALID_TAXII1_OPTIONS
 
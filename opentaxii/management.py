@@ -1,5 +1,6 @@
-from flask import Blueprint, abort, jsonify, request
+from flask import Blueprint, Response, abort, jsonify, request
 
+from . import metrics as metrics_registry
 from .local import context
 
 management = Blueprint('management', __name__)
@@ -26,3 +27,13 @@ def auth():
 @management.route('/health', methods=['GET'])
 def health():
     return jsonify(alive=True)
+
+
+@management.route('/metrics', methods=['GET'])
+def metrics():
+    if not context.server.config.get('metrics'):
+        abort(404)
+    return Response(
+        metrics_registry.registry.render(context.server),
+        content_type=metrics_registry.CONTENT_TYPE,
+    )
@@ -0,0 +1,288 @@
+"""
+In-process metrics, exported in the Prometheus text format by the
+``/management/metrics`` endpoint.
+
+Metrics are kept per process: with several worker processes every
+scrape sees the metrics of the worker that answers it.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        formatted = ",".join(
+            f'{label}="{_escape(str(label_value))}"'
+            for label, label_value in labels.items()
+        )
+        name = f"{name}{{{formatted}}}"
+    return f"{name} {value}"
+
+
+class Metric:
+    """A metric family with values per combination of label values."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels.get(label, "")) for label in self.labelnames)
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A value that only goes up, like the number of requests."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            (self.name, dict(zip(self.labelnames, key)), value) for key, value in values
+        ]
+
+
+class Histogram(Metric):
+    """Counts of observed values in buckets, with their count and sum."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # bucket counts, the last one for values above all buckets, and sum
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if key not in self._values:
+                self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = self._values[key]
+            counts[index] += 1
+            total[0] += value
+
+    def get_count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            values = [
+                (key, list(counts), total[0])
+                for key, (counts, total) in self._values.items()
+            ]
+        samples: List[Sample] = []
+        for key, counts, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                samples.append(
+                    (f"{self.name}_bucket", {**labels, "le": le}, cumulative)
+                )
+            samples.append((f"{self.name}_count", labels, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Metrics of the process, and collectors of metrics read when exported.
+
+    Collectors are called with the :class:`opentaxii.server.TAXIIServer` and
+    return ``(name, type, documentation, samples)`` tuples.
+    """
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable] = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable) -> Callable:
+        self.collectors.append(func)
+        return func
+
+    def render(self, server=None) -> str:
+        """Export all metrics in the Prometheus text format."""
+        families: List[Tuple[str, str, str, Iterable[Sample]]] = [
+            (metric.name, metric.type, metric.documentation, metric.samples())
+            for metric in self.metrics
+        ]
+        for collector in self.collectors:
+            families.extend(collector(server))
+        lines = []
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(
+                _format_sample(sample_name, labels, value)
+                for sample_name, labels, value in samples
+            )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter(
+    "opentaxii_requests_total",
+    "Requests by handler, method, status and TAXII2 collection.",
+    ("handler", "method", "status", "collection"),
+)
+REQUEST_DURATION = registry.histogram(
+    "opentaxii_request_duration_seconds",
+    "Time until the response is returned by the application, in seconds.",
+    ("handler", "method"),
+)
+RESPONSE_SIZE = registry.histogram(
+    "opentaxii_response_size_bytes",
+    "Size of responses with a known length, in bytes.",
+    ("handler",),
+    buckets=SIZE_BUCKETS,
+)
+REQUEST_DB_QUERIES = registry.histogram(
+    "opentaxii_request_db_queries",
+    "Database queries per request.",
+    ("handler",),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_DURATION = registry.histogram(
+    "opentaxii_request_db_duration_seconds",
+    "Time spent in database queries per request, in seconds.",
+    ("handler",),
+)
+TAXII2_OBJECTS_ADDED = registry.counter(
+    "opentaxii_taxii2_objects_added_total",
+    "TAXII2 objects stored, by collection id.",
+    ("collection",),
+)
+TAXII1_CONTENT_BLOCKS_CREATED = registry.counter(
+    "opentaxii_taxii1_content_blocks_created_total",
+    "TAXII1 content blocks stored, by inbox service id.",
+    ("service",),
+)
+
+_request = threading.local()
+
+
+def start_request() -> None:
+    """Start measuring the request handled by the current thread."""
+    _request.start = time.perf_counter()
+    _request.queries = 0
+    _request.query_duration = 0.0
+
+
+def record_query(duration: float) -> None:
+    """Count a database query of ``duration`` seconds for the current request."""
+    if getattr(_request, "start", None) is not None:
+        _request.queries += 1
+        _request.query_duration += duration
+
+
+def finish_request(
+    handler: str,
+    method: str,
+    status: int,
+    collection: str = "",
+    size: Optional[int] = None,
+) -> None:
+    """Record the metrics of the request handled by the current thread."""
+    start = getattr(_request, "start", None)
+    if start is None:
+        return
+    _request.start = None
+    REQUESTS.inc(
+        handler=handler, method=method, status=str(status), collection=collection
+    )
+    REQUEST_DURATION.observe(
+        time.perf_counter() - start, handler=handler, method=method
+    )
+    if size is not None:
+        RESPONSE_SIZE.observe(size, handler=handler)
+    REQUEST_DB_QUERIES.observe(_request.queries, handler=handler)
+    REQUEST_DB_DURATION.observe(_request.query_duration, handler=handler)
+
+
+@registry.collector
+def collect_auth_cache_stats(server):
+    if server is None:
+        return []
+    hits = []
+    misses = []
+    for cache_name in ("account", "credentials"):
+        cache = getattr(server.auth.api, f"{cache_name}_cache", None)
+        if cache is None or not hasattr(cache, "hits"):
+            continue
+        hits.append(
+            ("opentaxii_auth_cache_hits_total", {"cache": cache_name}, cache.hits)
+        )
+        misses.append(
+            ("opentaxii_auth_cache_misses_total", {"cache": cache_name}, cache.misses)
+        )
+    return [
+        (
+            "opentaxii_auth_cache_hits_total",
+            "counter",
+            "Lookups answered from the auth API caches.",
+            hits,
+        ),
+        (
+            "opentaxii_auth_cache_misses_total",
+            "counter",
+            "Lookups missing from the auth API caches.",
+            misses,
+        ),
+    ]
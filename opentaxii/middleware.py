@@ -5,6 +5,8 @@ from flask import Flask, request
 from marshmallow.exceptions import ValidationError as MarshmallowValidationError
 from werkzeug.exceptions import HTTPException
 
+from . import metrics, profiler
+from .common.http_compression import CompressionMiddleware
 from .exceptions import InvalidAuthHeader
 from .local import context, release_context
 from .management import management
@@ -44,8 +46,29 @@ def create_app(server):
     app.register_error_handler(
         MarshmallowValidationError, server.handle_validation_exception
     )
+    if server.config.get("metrics"):
+        # registered first, so that requests failing authentication are measured
+        app.before_request(start_request_metrics)
+    query_profiler = server.config.get("query_profiler") or {}
+    if query_profiler.get("enabled"):
+        app.before_request(start_query_profile)
     app.before_request(functools.partial(create_context_before_request, server))
     app.after_request(cleanup_context)
+    if server.config.get("metrics"):
+        # registered last, so that it runs before the context is cleaned up
+        app.after_request(finish_request_metrics)
+    if query_profiler.get("enabled"):
+        app.after_request(
+            functools.partial(
+                finish_query_profile,
+                max_queries=query_profiler.get("max_queries"),
+                max_duration_ms=query_profiler.get("max_duration_ms"),
+            )
+        )
+    if server.config.get("http_compression"):
+        app.wsgi_app = CompressionMiddleware(  # type: ignore[method-assign]
+            app.wsgi_app, **server.config["http_compression"]
+        )
     return app
 
 
@@ -59,6 +82,53 @@ def cleanup_context(response):
     return response
 
 
+def start_request_metrics():
+    metrics.start_request()
+
+
+def _request_handler():
+    """Get the handler name and TAXII2 collection id of the current request."""
+    endpoint = getattr(context, "endpoint", None)
+    if endpoint is not None:
+        collection_id = getattr(context, "collection_id", None)
+        return endpoint.handler_name, str(collection_id) if collection_id else ""
+    if request.endpoint in (None, "opentaxii_services_view"):
+        # paths that match no service
+        return "unknown", ""
+    return request.endpoint, ""
+
+
+def finish_request_metrics(response):
+    handler, collection = _request_handler()
+    metrics.finish_request(
+        handler=handler,
+        method=request.method,
+        status=response.status_code,
+        collection=collection,
+        size=response.content_length,
+    )
+    return response
+
+
+def start_query_profile():
+    profiler.start_request()
+
+
+def finish_query_profile(response, max_queries=None, max_duration_ms=None):
+    handler, _ = _request_handler()
+    # streamed responses query the database while they are sent
+    response.call_on_close(
+        functools.partial(
+            profiler.finish_request,
+            handler=handler,
+            method=request.method,
+            max_queries=max_queries,
+            max_duration_ms=max_duration_ms,
+        )
+    )
+    return response
+
+
 def _authenticate(server, headers):
 
     auth_header = headers.get(HTTP_AUTHORIZATION)
@@ -1,12 +1,14 @@
 import datetime
 import uuid
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from opentaxii.taxii2.entities import (
     ApiRoot,
     Collection,
+    CollectionWatermark,
     Job,
     ManifestRecord,
+    PendingJob,
     STIXObject,
     VersionRecord,
 )
@@ -153,6 +155,28 @@ class OpenTAXIIPersistenceAPI:
         """
         raise NotImplementedError()
 
+    def create_content_blocks(self, blocks, service_id=None):
+        """Create content blocks.
+
+        Implementations should create all blocks in one transaction.
+        Calls :meth:`create_content_block` per block by default.
+
+        :param list blocks: list of ``(content_block_entity, collection_ids)``
+            tuples, with :py:class:`opentaxii.taxii.entities.ContentBlockEntity`
+            and a list of collection IDs
+        :param str service_id: ID of an inbox service via which content
+            blocks were created
+
+        :return: updated content block entities, in the order of ``blocks``
+        :rtype: list of :py:class:`opentaxii.taxii.entities.ContentBlockEntity`
+        """
+        return [
+            self.create_content_block(
+                entity, collection_ids=collection_ids, service_id=service_id
+            )
+            for entity, collection_ids in blocks
+        ]
+
     def get_content_blocks_count(
         self, collection_id, start_time=None, end_time=None, bindings=None
     ):
@@ -177,9 +201,12 @@ class OpenTAXIIPersistenceAPI:
         bindings=None,
         offset=0,
         limit=10,
+        after=None,
     ):
         """Get the content blocks associated with a collection.
 
+        Content blocks are ordered by ``(timestamp_label, id)``.
+
         :param str collection_id: ID fo a collection in question
         :param datetime start_time: start of a time frame
         :param datetime end_time: end of a time frame
@@ -187,6 +214,9 @@ class OpenTAXIIPersistenceAPI:
             :py:class:`opentaxii.taxii.entities.ContentBindingEntity`
         :param int offset: result set offset
         :param int limit: result set max size
+        :param tuple after: only return content blocks after the
+            ``(timestamp_label, id)`` cursor. Only passed when
+            :meth:`get_result_set_cursor` returned a cursor.
 
         :return: content blocks list
         :rtype: list of :py:class:`opentaxii.taxii.entities.ContentBlockEntity`
@@ -214,6 +244,31 @@ class OpenTAXIIPersistenceAPI:
         """
         raise NotImplementedError()
 
+    def get_result_set_cursor(self, result_set_id, part_number):
+        """Get the position a part of a result set starts after.
+
+        Returns `None` by default, in which case parts are fetched by offset.
+
+        :param str result_set_id: ID of a result set
+        :param int part_number: number of the result part
+
+        :return: ``(timestamp_label, id)`` of the last content block
+            of the previous part, or `None` if unknown
+        :rtype: tuple
+        """
+        return None
+
+    def set_result_set_cursor(self, result_set_id, part_number, cursor):
+        """Store the position a part of a result set starts after.
+
+        Does nothing by default.
+
+        :param str result_set_id: ID of a result set
+        :param int part_number: number of the result part
+        :param tuple cursor: ``(timestamp_label, id)`` of the last content
+            block of the previous part
+        """
+
     def create_subscription(self, subscription_entity):
         """Create a subscription.
 
@@ -330,6 +385,19 @@ class OpenTAXII2PersistenceAPI:
     ) -> Optional[Collection]:
         raise NotImplementedError
 
+    def get_collection_watermark(
+        self, collection_id: uuid.UUID
+    ) -> Optional[CollectionWatermark]:
+        """
+        Get the watermark of the objects in a collection.
+
+        The watermark must change whenever objects are added or deleted, it is
+        used to answer conditional requests without reading the objects. The
+        default implementation returns `None`, which disables conditional
+        requests.
+        """
+        return None
+
     def get_manifest(
         self,
         collection_id: uuid.UUID,
@@ -356,11 +424,106 @@ class OpenTAXII2PersistenceAPI:
     ) -> Tuple[List[STIXObject], bool, Optional[str]]:
         raise NotImplementedError
 
+    def stream_objects(
+        self,
+        collection_id: uuid.UUID,
+        limit: Optional[int] = None,
+        added_after: Optional[datetime.datetime] = None,
+        next_kwargs: Optional[Dict] = None,
+        match_id: Optional[List[str]] = None,
+        match_type: Optional[List[str]] = None,
+        match_version: Optional[List[str]] = None,
+        match_spec_version: Optional[List[str]] = None,
+    ) -> Tuple[
+        Iterator[STIXObject],
+        bool,
+        Optional[str],
+        Optional[datetime.datetime],
+        Optional[datetime.datetime],
+    ]:
+        """
+        Get the same page of objects as :meth:`get_objects`, lazily.
+
+        Should return an iterator over the objects of the page, ``more``,
+        ``next`` and the ``date_added`` of the first and last object of the
+        page (`None` for an empty page), all known before iterating.
+
+        The default implementation falls back to :meth:`get_objects`.
+        """
+        objects, more, next_param = self.get_objects(
+            collection_id=collection_id,
+            limit=limit,
+            added_after=added_after,
+            next_kwargs=next_kwargs,
+            match_id=match_id,
+            match_type=match_type,
+            match_version=match_version,
+            match_spec_version=match_spec_version,
+        )
+        if not objects:
+            return iter(objects), more, next_param, None, None
+        return (
+            iter(objects),
+            more,
+            next_param,
+            min(obj.date_added for obj in objects),
+            max(obj.date_added for obj in objects),
+        )
+
     def add_objects(
         self, api_root_id: uuid.UUID, collection_id: uuid.UUID, objects: List[Dict]
     ) -> Job:
         raise NotImplementedError
 
+    def add_pending_objects(
+        self,
+        api_root_id: uuid.UUID,
+        collection_id: uuid.UUID,
+        objects: List[Dict],
+        validation_level: str = "full",
+    ) -> Job:
+        """
+        Queue ``objects`` for asynchronous processing.
+
+        Should return a job with status ``pending`` that job workers pick up
+        through :meth:`claim_pending_job`. The ``validation_level`` should be
+        returned with the claimed :class:`PendingJob`.
+        """
+        raise NotImplementedError
+
+    def claim_pending_job(self, claim_timeout: int) -> Optional[PendingJob]:
+        """
+        Claim the oldest pending job that no other worker is processing.
+
+        Claims older than ``claim_timeout`` seconds are considered abandoned
+        and can be claimed again. Every claim counts as an attempt, returned
+        in :attr:`PendingJob.attempts`. Should return `None` when there is no
+        work.
+        """
+        raise NotImplementedError
+
+    def add_job_objects(
+        self,
+        job_id: uuid.UUID,
+        collection_id: uuid.UUID,
+        objects: List[Dict],
+        failures: List[Tuple[Dict, str]],
+    ) -> None:
+        """
+        Store a processed batch of a pending job and update its counters.
+
+        :param job_id: id of the pending job
+        :param collection_id: id of the collection to add ``objects`` to
+        :param objects: the valid stix objects of this batch
+        :param failures: the invalid stix objects of this batch, with the
+            reason they failed
+        """
+        raise NotImplementedError
+
+    def complete_job(self, job_id: uuid.UUID) -> None:
+        """Mark pending job as complete and drop its queued objects."""
+        raise NotImplementedError
+
     def get_object(
         self,
         collection_id: uuid.UUID,
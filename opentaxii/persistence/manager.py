@@ -1,9 +1,10 @@
 import datetime
 import uuid
-from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
 
 import structlog
 
+from opentaxii import metrics
 from opentaxii.local import context
 from opentaxii.persistence.exceptions import (
     DoesNotExistError,
@@ -19,11 +20,13 @@ from opentaxii.signals import (
 from opentaxii.taxii2.entities import (
     ApiRoot,
     Collection,
+    CollectionWatermark,
     Job,
     ManifestRecord,
     STIXObject,
     VersionRecord,
 )
+from opentaxii.taxii2.exceptions import ValidationError
 
 log = structlog.getLogger(__name__)
 
@@ -58,7 +61,9 @@ class Taxii1PersistenceManager:
         :return: created collection entity
         :rtype: :py:class:`opentaxii.taxii.entities.ServiceEntity`
         """
-        return self.api.create_service(service_entity)
+        service = self.api.create_service(service_entity)
+        self.server.invalidate_services()
+        return service
 
     def update_service(self, service_entity):
         """Update service.
@@ -69,7 +74,9 @@ class Taxii1PersistenceManager:
         :return: created collection entity
         :rtype: :py:class:`opentaxii.taxii.entities.ServiceEntity`
         """
-        return self.api.update_service(service_entity)
+        service = self.api.update_service(service_entity)
+        self.server.invalidate_services()
+        return service
 
     def delete_service(self, service_id):
         """Delete service.
@@ -77,7 +84,8 @@ class Taxii1PersistenceManager:
         :param `opentaxii.taxii.entities.ServiceEntity` service_entity:
             service entity object
         """
-        return self.api.delete_service(service_id)
+        self.api.delete_service(service_id)
+        self.server.invalidate_services()
 
     def delete_collection(self, collection_name):
         """Delete cllection.
@@ -233,6 +241,7 @@ class Taxii1PersistenceManager:
                 collection_ids=collection_ids,
                 service_id=service_id,
             )
+            metrics.TAXII1_CONTENT_BLOCKS_CREATED.inc(service=service_id or "")
         else:
             log.warning(
                 "create_content.unknown_collections",
@@ -242,6 +251,57 @@ class Taxii1PersistenceManager:
 
         return content
 
+    def create_content_blocks(self, blocks, service_id=None, inbox_message_id=None):
+        """Create content blocks in one go.
+
+        Methods emits :py:const:`opentaxii.signals.CONTENT_BLOCK_CREATED`
+        signal for every created content block.
+
+        :param list blocks: list of ``(content, collections)`` tuples, with
+                :py:class:`opentaxii.taxii.entities.ContentBlockEntity` and
+                a list of destination collections as
+                :py:class:`opentaxii.taxii.entities.CollectionEntity`
+        :param str service_id: ID of an inbox service via which content
+                blocks were created
+        :param str inbox_message_id: ID of the inbox message that delivered
+                the content blocks
+        :return: created content block entities
+        :rtype: list of :py:class:`opentaxii.taxii.entities.ContentBlockEntity`
+        """
+        to_create = []
+        for content, collections in blocks:
+            if inbox_message_id:
+                content.inbox_message_id = inbox_message_id
+            collection_ids = [
+                collection.id
+                for collection in collections
+                if collection.can_modify(context.account)
+            ]
+            if collection_ids:
+                to_create.append((content, collection_ids))
+            else:
+                log.warning(
+                    "create_content.unknown_collections",
+                    collections=[c.name for c in collections],
+                    user=context.account,
+                )
+
+        if not to_create:
+            return []
+
+        created = self.api.create_content_blocks(to_create, service_id=service_id)
+        for content, (_, collection_ids) in zip(created, to_create):
+            CONTENT_BLOCK_CREATED.send(
+                self,
+                content_block=content,
+                collection_ids=collection_ids,
+                service_id=service_id,
+            )
+        metrics.TAXII1_CONTENT_BLOCKS_CREATED.inc(
+            len(created), service=service_id or ""
+        )
+        return created
+
     def get_content_blocks_count(
         self, collection_id, start_time=None, end_time=None, bindings=None
     ):
@@ -271,6 +331,7 @@ class Taxii1PersistenceManager:
         bindings=None,
         offset=0,
         limit=None,
+        after=None,
     ):
         """Get the content blocks associated with a collection.
 
@@ -281,10 +342,15 @@ class Taxii1PersistenceManager:
             :py:class:`opentaxii.taxii.entities.ContentBindingEntity`
         :param int offset: result set offset
         :param int limit: result set max size
+        :param tuple after: ``(timestamp_label, id)`` cursor to start after
 
         :return: content blocks list
         :rtype: list of :py:class:`opentaxii.taxii.entities.ContentBlockEntity`
         """
+        kwargs = {}
+        if after:
+            # only APIs that store cursors know the argument
+            kwargs["after"] = after
 
         return self.api.get_content_blocks(
             collection_id=collection_id,
@@ -293,6 +359,7 @@ class Taxii1PersistenceManager:
             bindings=bindings or [],
             offset=offset,
             limit=limit,
+            **kwargs,
         )
 
     def create_result_set(self, entity):
@@ -316,6 +383,26 @@ class Taxii1PersistenceManager:
         """
         return self.api.get_result_set(result_set_id)
 
+    def get_result_set_cursor(self, result_set_id, part_number):
+        """Get the position a part of a result set starts after.
+
+        :param str result_set_id: ID of a result set
+        :param int part_number: number of the result part
+
+        :return: ``(timestamp_label, id)`` cursor or `None`
+        :rtype: tuple
+        """
+        return self.api.get_result_set_cursor(result_set_id, part_number)
+
+    def set_result_set_cursor(self, result_set_id, part_number, cursor):
+        """Store the position a part of a result set starts after.
+
+        :param str result_set_id: ID of a result set
+        :param int part_number: number of the result part
+        :param tuple cursor: ``(timestamp_label, id)`` cursor
+        """
+        self.api.set_result_set_cursor(result_set_id, part_number, cursor)
+
     def create_subscription(self, entity):
         """Create a subscription.
 
@@ -452,8 +539,20 @@ class Taxii2PersistenceManager:
         )
         if collection is None:
             raise DoesNotExistError()
+        # label of the request metrics, only set for existing collections
+        context.collection_id = collection.id
         return collection
 
+    def get_collection_watermark(
+        self, api_root_id: uuid.UUID, collection_id_or_alias: str
+    ) -> Optional[CollectionWatermark]:
+        collection = self.get_collection(
+            api_root_id=api_root_id, collection_id_or_alias=collection_id_or_alias
+        )
+        if not collection.can_read(context.account):
+            raise NoReadPermission()
+        return self.api.get_collection_watermark(collection_id=collection.id)
+
     def get_manifest(
         self,
         api_root_id: uuid.UUID,
@@ -510,6 +609,40 @@ class Taxii2PersistenceManager:
             match_spec_version=match_spec_version,
         )
 
+    def stream_objects(
+        self,
+        api_root_id: uuid.UUID,
+        collection_id_or_alias: str,
+        limit: Optional[int] = None,
+        added_after: Optional[datetime.datetime] = None,
+        next_kwargs: Optional[Dict] = None,
+        match_id: Optional[List[str]] = None,
+        match_type: Optional[List[str]] = None,
+        match_version: Optional[List[str]] = None,
+        match_spec_version: Optional[List[str]] = None,
+    ) -> Tuple[
+        Iterator[STIXObject],
+        bool,
+        Optional[str],
+        Optional[datetime.datetime],
+        Optional[datetime.datetime],
+    ]:
+        collection = self.get_collection(
+            api_root_id=api_root_id, collection_id_or_alias=collection_id_or_alias
+        )
+        if not collection.can_read(context.account):
+            raise NoReadPermission()
+        return self.api.stream_objects(
+            collection_id=collection.id,
+            limit=limit,
+            added_after=added_after,
+            next_kwargs=next_kwargs,
+            match_id=match_id,
+            match_type=match_type,
+            match_version=match_version,
+            match_spec_version=match_spec_version,
+        )
+
     def add_objects(
         self,
         api_root_id: uuid.UUID,
@@ -526,8 +659,117 @@ class Taxii2PersistenceManager:
             collection_id=collection.id,
             objects=data["objects"],
         )
+        metrics.TAXII2_OBJECTS_ADDED.inc(
+            job.success_count, collection=str(collection.id)
+        )
+        return job
+
+    def add_pending_objects(
+        self,
+        api_root_id: uuid.UUID,
+        collection_id_or_alias: str,
+        data: Dict,
+        validation_level: str = "full",
+    ) -> Job:
+        """
+        Queue the objects in ``data`` as a pending job.
+
+        The objects are validated with ``validation_level`` and stored later
+        by :meth:`process_pending_job`.
+        """
+        collection = self.get_collection(
+            api_root_id=api_root_id, collection_id_or_alias=collection_id_or_alias
+        )
+        if not collection.can_write(context.account):
+            raise NoWritePermission()
+        job = self.api.add_pending_objects(
+            api_root_id=api_root_id,
+            collection_id=collection.id,
+            objects=data["objects"],
+            validation_level=validation_level,
+        )
+        log.info("job.queued", job_id=job.id, total_count=job.total_count)
         return job
 
+    def process_pending_job(
+        self,
+        validate_object: Callable[..., None],
+        batch_size: int = 1000,
+        claim_timeout: int = 300,
+        max_attempts: int = 3,
+    ) -> Optional[uuid.UUID]:
+        """
+        Claim one pending job and store its objects batch by batch.
+
+        Job counters are updated after every batch, so the status endpoint
+        reports progress while the job runs. A job that was claimed more than
+        ``max_attempts`` times without completing is completed with its
+        remaining objects reported as failures.
+
+        :param validate_object: callable raising
+            :class:`opentaxii.taxii2.exceptions.ValidationError` for objects
+            that should be reported as failures, called with the object and
+            the ``level`` keyword argument
+        :param batch_size: number of objects to store per transaction
+        :param claim_timeout: seconds after which a claimed job that made no
+            progress is considered abandoned
+        :param max_attempts: number of times a job is claimed before it is
+            given up
+
+        :return: id of the processed job, or `None` if there was no work
+        """
+        pending_job = self.api.claim_pending_job(claim_timeout=claim_timeout)
+        if pending_job is None:
+            return None
+        objects = pending_job.objects[pending_job.processed_count :]
+        if pending_job.attempts > max_attempts:
+            log.warning(
+                "job.failed",
+                job_id=pending_job.id,
+                attempts=pending_job.attempts - 1,
+                processed_count=pending_job.processed_count,
+            )
+            message = f"Job was not completed in {max_attempts} attempts"
+            for start in range(0, len(objects), batch_size):
+                self.api.add_job_objects(
+                    job_id=pending_job.id,
+                    collection_id=pending_job.collection_id,
+                    objects=[],
+                    failures=[
+                        (obj, message) for obj in objects[start : start + batch_size]
+                    ],
+                )
+            self.api.complete_job(job_id=pending_job.id)
+            return pending_job.id
+        log.info(
+            "job.processing",
+            job_id=pending_job.id,
+            processed_count=pending_job.processed_count,
+            attempt=pending_job.attempts,
+        )
+        for start in range(0, len(objects), batch_size):
+            valid_objects = []
+            failures = []
+            for obj in objects[start : start + batch_size]:
+                try:
+                    validate_object(obj, level=pending_job.validation_level)
+                except ValidationError as e:
+                    failures.append((obj, str(e)))
+                else:
+                    valid_objects.append(obj)
+            self.api.add_job_objects(
+                job_id=pending_job.id,
+                collection_id=pending_job.collection_id,
+                objects=valid_objects,
+                failures=failures,
+            )
+            metrics.TAXII2_OBJECTS_ADDED.inc(
+                len(valid_objects), collection=str(pending_job.collection_id)
+            )
+        self.api.complete_job(job_id=pending_job.id)
+        log.info("job.completed", job_id=pending_job.id)
+        return pending_job.id
+
     def get_object(
         self,
         api_root_id: uuid.UUID,
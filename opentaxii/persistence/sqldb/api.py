@@ -2,30 +2,43 @@ import base64
 import datetime
 import json
 import uuid
+from collections import Counter, defaultdict
 from functools import reduce
-from typing import Dict, List, Optional, Tuple, no_type_check
+from typing import Dict, Iterator, List, Optional, Set, Tuple, no_type_check
 
 import six
 import sqlalchemy
 import structlog
-from sqlalchemy import and_, func, literal, or_
-from sqlalchemy.orm import Query, aliased, load_only
+from sqlalchemy import and_, func, literal, or_, tuple_, type_coerce
+from sqlalchemy.orm import Query, load_only
 
-from opentaxii.common.sqldb import BaseSQLDatabaseAPI
+from opentaxii.common.sqldb import BaseSQLDatabaseAPI, read_from_replica
 from opentaxii.persistence import OpenTAXII2PersistenceAPI, OpenTAXIIPersistenceAPI
 from opentaxii.persistence.sqldb import taxii2models
+from opentaxii.persistence.sqldb.common import bulk_insert, update_watermarks
+from opentaxii.persistence.sqldb.compression import (
+    STIX1_XML_DICTIONARY,
+    STIX2_JSON_DICTIONARY,
+    check_codec,
+    compress,
+    decompress,
+    is_compressed_with,
+)
 from opentaxii.taxii2 import entities
-from opentaxii.taxii2.utils import get_object_version
+from opentaxii.taxii2.utils import get_failed_object_version, get_object_version
 
 from . import converters as conv
 from .models import (
     Base,
+    CollectionWatermark,
     ContentBlock,
     DataCollection,
     InboxMessage,
     ResultSet,
+    ResultSetPart,
     Service,
     Subscription,
+    collection_to_content_block,
 )
 
 __all__ = ["SQLDatabaseAPI"]
@@ -33,6 +46,16 @@ __all__ = ["SQLDatabaseAPI"]
 log = structlog.getLogger(__name__)
 
 YIELD_PER_SIZE = 100
+BULK_QUERY_CHUNK_SIZE = 500
+CLAIM_CANDIDATES = 10
+
+
+def _parse_next_datetime(value: str) -> datetime.datetime:
+    """Parse a datetime of a `next` param, as written by ``isoformat``."""
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc)
 
 
 class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
@@ -49,12 +72,35 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
 
     :param bool create_tables=False: if True, tables will be created in the DB.
 
+    :param str compression=None: if defined, new content blocks are stored
+        compressed with this codec, ``zlib`` or ``zstd``.
+
+    :param dict pool=None: connection pool settings, see
+        :func:`opentaxii.sqldb_helper.get_engine`.
+
+    :param float statement_timeout_secs=None: if defined, statements running
+        longer are cancelled, on PostgreSQL and MySQL.
+
+    :param list replica_connections=None: if defined, read-only operations
+        are sent to these read replicas.
+
+    :param int replica_retry_secs=30: time a replica that cannot be reached
+        is skipped, in seconds.
+
     :param engine_parameters=None: if defined, these arguments would be passed
         to sqlalchemy.create_engine
     """
 
     BASEMODEL = Base
 
+    def __init__(
+        self, db_connection, create_tables=False, compression=None, **engine_parameters
+    ):
+        super().__init__(db_connection, create_tables, **engine_parameters)
+        check_codec(compression)
+        self.compression = compression
+
+    @read_from_replica
     def get_services(self, collection_id=None):
         if collection_id:
             collection = self.db.session.query(DataCollection).get(collection_id)
@@ -82,6 +128,7 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
     def create_service(self, entity):
         return self.update_service(entity)
 
+    @read_from_replica
     def get_collections(self, service_id=None):
         if service_id:
             service = self.db.session.query(Service).get(service_id)
@@ -128,6 +175,10 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
             .filter(DataCollection.name == collection_name)
             .one()
         )
+        # not all databases enforce the cascade, and collection ids can be reused
+        self.db.session.query(CollectionWatermark).filter(
+            CollectionWatermark.collection_id == collection.id
+        ).delete(synchronize_session=False)
         self.db.session.delete(collection)
         self.db.session.commit()
 
@@ -148,7 +199,7 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
             query = self.db.session.query(func.count(ContentBlock.id))
         else:
             query = self.db.session.query(ContentBlock).order_by(
-                ContentBlock.timestamp_label.asc()
+                ContentBlock.timestamp_label.asc(), ContentBlock.id.asc()
             )
 
         if collection_id:
@@ -178,10 +229,28 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
 
         return query
 
+    def _is_past_watermark(self, collection_id, start_time=None, after=None):
+        """Check if no content block of the collection can match, using its watermark."""
+        if not collection_id:
+            return False
+        watermark = self.db.session.query(CollectionWatermark).get(collection_id)
+        if watermark is None:
+            return False
+        if watermark.count <= 0 or watermark.timestamp_label is None:
+            return True
+        last = conv.enforce_timezone(watermark.timestamp_label)
+        if start_time and last <= start_time:
+            return True
+        return bool(after) and last < after[0]
+
+    @read_from_replica
     def get_content_blocks_count(
         self, collection_id=None, start_time=None, end_time=None, bindings=None
     ):
 
+        if self._is_past_watermark(collection_id, start_time=start_time):
+            return 0
+
         query = self._get_content_query(
             collection_id=collection_id,
             start_time=start_time,
@@ -192,6 +261,7 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
 
         return query.scalar()
 
+    @read_from_replica
     def get_content_blocks(
         self,
         collection_id=None,
@@ -200,8 +270,12 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
         bindings=None,
         offset=0,
         limit=None,
+        after=None,
     ):
 
+        if self._is_past_watermark(collection_id, start_time=start_time, after=after):
+            return []
+
         query = self._get_content_query(
             collection_id=collection_id,
             start_time=start_time,
@@ -209,6 +283,16 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
             bindings=bindings,
         )
 
+        if after:
+            timestamp_label, content_block_id = after
+            query = query.filter(
+                (ContentBlock.timestamp_label > timestamp_label)
+                | (
+                    (ContentBlock.timestamp_label == timestamp_label)
+                    & (ContentBlock.id > content_block_id)
+                )
+            )
+
         query = query.offset(offset)
         if limit:
             query = query.limit(limit)
@@ -231,6 +315,11 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
         )
 
         self.db.session.add(collection)
+        # assigns the collection id
+        self.db.session.flush()
+        self.db.session.add(
+            CollectionWatermark(collection_id=collection.id, count=0, sequence=0)
+        )
         self.db.session.commit()
 
         return conv.to_collection_entity(collection)
@@ -297,7 +386,7 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
 
         return conv.to_inbox_message_entity(message)
 
-    def create_content_block(self, entity, collection_ids=None, service_id=None):
+    def _to_content_block_model(self, entity):
 
         if entity.content_binding:
             binding = entity.content_binding.binding
@@ -315,8 +404,9 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
             if isinstance(entity.content, six.string_types)
             else entity.content
         )
+        content = compress(content, self.compression, STIX1_XML_DICTIONARY)
 
-        content = ContentBlock(
+        return ContentBlock(
             timestamp_label=entity.timestamp_label,
             inbox_message_id=entity.inbox_message_id,
             content=content,
@@ -324,6 +414,10 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
             binding_subtype=subtype,
         )
 
+    def create_content_block(self, entity, collection_ids=None, service_id=None):
+
+        content = self._to_content_block_model(entity)
+
         self.db.session.add(content)
         self.db.session.commit()
 
@@ -332,22 +426,95 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
 
         return conv.to_block_entity(content)
 
+    def create_content_blocks(self, blocks, service_id=None):
+
+        requested_ids = {
+            collection_id
+            for _, collection_ids in blocks
+            for collection_id in collection_ids or []
+        }
+        existing_ids = set()
+        if requested_ids:
+            existing_ids = {
+                collection_id
+                for (collection_id,) in self.db.session.query(DataCollection.id).filter(
+                    DataCollection.id.in_(requested_ids)
+                )
+            }
+
+        models = [self._to_content_block_model(entity) for entity, _ in blocks]
+        self.db.session.add_all(models)
+        # assigns content block ids
+        self.db.session.flush()
+
+        rows = []
+        volume_deltas = Counter()
+        last_labels = {}
+        for model, (_, collection_ids) in zip(models, blocks):
+            for collection_id in set(collection_ids or []) & existing_ids:
+                rows.append(
+                    {"collection_id": collection_id, "content_block_id": model.id}
+                )
+                volume_deltas[collection_id] += 1
+                last_labels[collection_id] = max(
+                    last_labels.get(collection_id, model.timestamp_label),
+                    model.timestamp_label,
+                )
+        bulk_insert(self.db.session, collection_to_content_block, rows)
+        for collection_id, delta in volume_deltas.items():
+            update_watermarks(
+                self.db.session,
+                CollectionWatermark.timestamp_label,
+                [collection_id],
+                delta,
+                last_labels[collection_id],
+            )
+
+        # one update per distinct delta, usually a single one
+        collections_by_delta = defaultdict(list)
+        for collection_id, delta in volume_deltas.items():
+            collections_by_delta[delta].append(collection_id)
+        for delta, collection_ids in collections_by_delta.items():
+            self.db.session.query(DataCollection).filter(
+                DataCollection.id.in_(collection_ids)
+            ).update(
+                {DataCollection.volume: DataCollection.volume + delta},
+                synchronize_session=False,
+            )
+
+        self.db.session.commit()
+
+        log.debug(
+            "Content blocks added to collections",
+            content_blocks=len(models),
+            collections=len(volume_deltas),
+        )
+
+        return [conv.to_block_entity(model) for model in models]
+
     def _attach_content_to_collections(self, content_block, collection_ids):
 
         if not collection_ids:
             return
 
         criteria = DataCollection.id.in_(collection_ids)
-        new_collections = self.db.session.query(DataCollection).filter(criteria)
+        new_collections = self.db.session.query(DataCollection).filter(criteria).all()
 
         content_block.collections.extend(new_collections)
 
         self.db.session.add(content_block)
+        update_watermarks(
+            self.db.session,
+            CollectionWatermark.timestamp_label,
+            [collection.id for collection in new_collections],
+            1,
+            content_block.timestamp_label,
+        )
 
         log.debug(
             "Content block added to collections",
             content_block=content_block.id,
-            collections=new_collections.count(),
+            collections=len(new_collections),
         )
 
         self.db.session.commit()
@@ -373,6 +540,24 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
         result_set = self.db.session.query(ResultSet).get(result_set_id)
         return conv.to_result_set_entity(result_set)
 
+    def get_result_set_cursor(self, result_set_id, part_number):
+        part = self.db.session.query(ResultSetPart).get((result_set_id, part_number))
+        if not part:
+            return None
+        return (conv.enforce_timezone(part.timestamp_label), part.content_block_id)
+
+    def set_result_set_cursor(self, result_set_id, part_number, cursor):
+        timestamp_label, content_block_id = cursor
+        self.db.session.merge(
+            ResultSetPart(
+                result_set_id=result_set_id,
+                part_number=part_number,
+                timestamp_label=timestamp_label,
+                content_block_id=content_block_id,
+            )
+        )
+        self.db.session.commit()
+
     def get_subscription(self, subscription_id):
         s = self.db.session.query(Subscription).get(subscription_id)
         return conv.to_subscription_entity(s)
@@ -428,6 +613,50 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
     def create_subscription(self, entity):
         return self.update_subscription(entity)
 
+    def recompress_content_blocks(self, batch_size=1000):
+        """
+        Rewrite stored content blocks with the configured ``compression``.
+
+        Content blocks are rewritten in batches of ``batch_size``, with a
+        transaction per batch. Without ``compression``, content blocks are
+        stored uncompressed again.
+
+        :return: the number of rewritten content blocks
+        """
+        stored_content = type_coerce(ContentBlock.content, sqlalchemy.LargeBinary)
+        counter = 0
+        last_id = 0
+        while True:
+            rows = (
+                self.db.session.query(ContentBlock.id, stored_content)
+                .filter(ContentBlock.id > last_id)
+                .order_by(ContentBlock.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            updates = [
+                {
+                    "id": block_id,
+                    "content": compress(
+                        decompress(bytes(content)),
+                        self.compression,
+                        STIX1_XML_DICTIONARY,
+                    ),
+                }
+                for block_id, content in rows
+                if not is_compressed_with(
+                    bytes(content), self.compression, STIX1_XML_DICTIONARY
+                )
+            ]
+            if updates:
+                self.db.session.bulk_update_mappings(ContentBlock, updates)
+                self.db.session.commit()
+            counter += len(updates)
+            last_id = rows[-1][0]
+        return counter
+
     def delete_content_blocks(
         self, collection_name, start_time, end_time=None, with_messages=False
     ):
@@ -487,15 +716,90 @@ class SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXIIPersistenceAPI):
             .join(ContentBlock.collections)
             .filter(DataCollection.id == collection.id)
         ).scalar()
+        update_watermarks(
+            self.db.session,
+            CollectionWatermark.timestamp_label,
+            [collection.id],
+            -counter,
+        )
 
         self.db.session.commit()
 
         return counter
 
+    def backfill_watermarks(self):
+        """
+        (Re)compute the watermark of every data collection from its content blocks.
+
+        Used to migrate databases created before watermarks existed. Run it
+        while no content blocks are added.
+
+        :return: the number of data collections processed
+        """
+        counter = 0
+        for (collection_id,) in self.db.session.query(DataCollection.id).all():
+            timestamp_label, count = (
+                self.db.session.query(
+                    func.max(ContentBlock.timestamp_label), func.count(ContentBlock.id)
+                )
+                .join(ContentBlock.collections)
+                .filter(DataCollection.id == collection_id)
+                .one()
+            )
+            watermark = self.db.session.query(CollectionWatermark).get(collection_id)
+            if watermark is None:
+                watermark = CollectionWatermark(collection_id=collection_id, sequence=0)
+                self.db.session.add(watermark)
+            watermark.timestamp_label = timestamp_label
+            watermark.count = count
+            watermark.sequence += 1
+            self.db.session.commit()
+            counter += 1
+        return counter
+
 
 class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
+    """
+    SQL database implementation of OpenTAXII2 Persistence API.
+
+    :param str db_connection: a string that indicates database dialect and
+                          connection arguments that will be passed directly
+                          to :func:`~sqlalchemy.engine.create_engine` method.
+    :param bool create_tables=False: if True, tables will be created in the DB.
+    :param bool raw_objects=False: if True, new stix objects are stored as json
+                          text and written into responses without decoding.
+    :param str compression=None: if defined, new stix objects are stored
+                          compressed with this codec, ``zlib`` or ``zstd``.
+                          Requires ``raw_objects``.
+    :param dict pool=None: connection pool settings, see
+                          :func:`opentaxii.sqldb_helper.get_engine`.
+    :param float statement_timeout_secs=None: if defined, statements running
+                          longer are cancelled, on PostgreSQL and MySQL.
+    :param list replica_connections=None: if defined, read-only operations
+                          are sent to these read replicas.
+    :param int replica_retry_secs=30: time a replica that cannot be reached
+                          is skipped, in seconds.
+    :param engine_parameters=None: if defined, these arguments would be passed to
+                          :func:`~sqlalchemy.engine.create_engine` method.
+    """
+
     BASEMODEL = taxii2models.Base
 
+    def __init__(
+        self,
+        db_connection,
+        create_tables=False,
+        raw_objects=False,
+        compression=None,
+        **engine_parameters,
+    ):
+        super().__init__(db_connection, create_tables, **engine_parameters)
+        check_codec(compression)
+        if compression and not raw_objects:
+            raise ValueError("compression of stix objects requires raw_objects")
+        self.raw_objects = raw_objects
+        self.compression = compression
+
     @staticmethod
     def get_next_param(kwargs: Dict) -> str:
         """
@@ -506,23 +810,27 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
         :return: The value to use as `next` param
         :rtype: str
         """
-        return base64.b64encode(
-            f"{kwargs['date_added'].isoformat()}|{kwargs['id']}".encode("utf-8")
-        ).decode()
+        value = f"{kwargs['date_added'].isoformat()}|{kwargs['id']}"
+        if kwargs.get("version") is not None:
+            value = f"{value}|{kwargs['version'].isoformat()}"
+        return base64.b64encode(value.encode("utf-8")).decode()
 
     @staticmethod
     def parse_next_param(next_param: str) -> Dict:
         """
         Parse provided `next_param` into kwargs to be used to filter stix objects.
         """
-        date_added_str, obj_id = (
+        date_added_str, obj_id, *version_str = (
             base64.b64decode(next_param.encode()).decode().split("|")
         )
-        date_added = datetime.datetime.strptime(
-            date_added_str.split("+")[0], "%Y-%m-%dT%H:%M:%S.%f"
-        ).replace(tzinfo=datetime.timezone.utc)
-        return {"id": obj_id, "date_added": date_added}
-
+        kwargs = {"id": obj_id, "date_added": _parse_next_datetime(date_added_str)}
+        # `next` params without a version were issued by older releases
+        if version_str:
+            (version,) = version_str
+            kwargs["version"] = _parse_next_datetime(version)
+        return kwargs
+
+    @read_from_replica
     def get_api_roots(self) -> List[entities.ApiRoot]:
         query = self.db.session.query(taxii2models.ApiRoot).order_by("title")
         return [
@@ -652,6 +960,7 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
         """
         return taxii2models.Job.cleanup(self.db.session)
 
+    @read_from_replica
     def get_collections(self, api_root_id: uuid.UUID) -> List[entities.Collection]:
         """Get a list of collections from the database"""
         query = (
@@ -735,6 +1044,13 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
             is_public_write=is_public_write,
         )
         self.db.session.add(collection)
+        # assigns the collection id
+        self.db.session.flush()
+        self.db.session.add(
+            taxii2models.CollectionWatermark(
+                collection_id=collection.id, count=0, sequence=0
+            )
+        )
         self.db.session.commit()
 
         return entities.Collection(
@@ -752,8 +1068,11 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
             taxii2models.STIXObject.collection_id == collection_id,
         )
         if ordered:
+            # versions of an object posted together have the same date_added
             query = query.order_by(
-                taxii2models.STIXObject.date_added, taxii2models.STIXObject.id
+                taxii2models.STIXObject.date_added,
+                taxii2models.STIXObject.id,
+                taxii2models.STIXObject.version,
             )
         return query
 
@@ -768,11 +1087,17 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
         self, query: Query, next_kwargs: Optional[Dict] = None
     ) -> Query:
         if next_kwargs is not None:
+            after_id = taxii2models.STIXObject.id > next_kwargs["id"]
+            if next_kwargs.get("version") is not None:
+                after_id = after_id | (
+                    (taxii2models.STIXObject.id == next_kwargs["id"])
+                    & (taxii2models.STIXObject.version > next_kwargs["version"])
+                )
             query = query.filter(
                 (taxii2models.STIXObject.date_added > next_kwargs["date_added"])
                 | (
                     (taxii2models.STIXObject.date_added == next_kwargs["date_added"])
-                    & (taxii2models.STIXObject.id > next_kwargs["id"])
+                    & after_id
                 )
             )
         return query
@@ -794,7 +1119,6 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
     def _apply_match_version(
         self,
         query: Query,
-        collection_id: uuid.UUID,
         match_version: Optional[List[str]] = None,
     ) -> Query:
         if match_version is None:
@@ -805,40 +1129,12 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
 
         for value in match_version:
             if value == "first":
-                VersionSTIXObject = aliased(taxii2models.STIXObject, name="oso_min")
-
-                min_versions_subq = (
-                    sqlalchemy.select(
-                        func.min(VersionSTIXObject.version).label("min_version"),
-                    )
-                    .where(  # type: ignore[call-arg]
-                        VersionSTIXObject.collection_id == collection_id,
-                        VersionSTIXObject.id == taxii2models.STIXObject.id,
-                    )
-                    .group_by(VersionSTIXObject.id)
-                    .scalar_subquery()  # type: ignore[attr-defined]
-                    .correlate(taxii2models.STIXObject)
-                )
                 version_filters.append(
-                    min_versions_subq == taxii2models.STIXObject.version
+                    taxii2models.STIXObject.is_first == literal(True)
                 )
             elif value == "last":
-                VersionSTIXObject = aliased(taxii2models.STIXObject, name="oso_max")
-
-                max_versions_subq = (
-                    sqlalchemy.select(
-                        func.max(VersionSTIXObject.version).label("max_version")
-                    )
-                    .where(  # type: ignore[call-arg]
-                        VersionSTIXObject.collection_id == collection_id,
-                        VersionSTIXObject.id == taxii2models.STIXObject.id,
-                    )
-                    .group_by(VersionSTIXObject.id)
-                    .scalar_subquery()  # type: ignore[attr-defined]
-                    .correlate(taxii2models.STIXObject)
-                )
                 version_filters.append(
-                    max_versions_subq == taxii2models.STIXObject.version
+                    taxii2models.STIXObject.is_latest == literal(True)
                 )
             else:
                 version_filters.append(taxii2models.STIXObject.version == value)
@@ -854,15 +1150,33 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
             )
         return query
 
-    def _apply_limit(
-        self, query: Query, limit: Optional[int] = None
-    ) -> Tuple[Query, bool]:
+    def _apply_limit(self, query: Query, limit: Optional[int] = None) -> Query:
         if limit is not None:
-            more = limit < query.limit(limit + 1).count()
-            query = query.limit(limit)
-        else:
-            more = False
-        return query, more
+            # fetch one surplus row to tell whether there is a next page
+            query = query.limit(limit + 1)
+        return query
+
+    def _fetch_page(
+        self, query: Query, limit: Optional[int] = None
+    ) -> Tuple[List[taxii2models.STIXObject], bool]:
+        items = query.all()
+        if limit is not None and len(items) > limit:
+            return items[:limit], True
+        return items, False
+
+    def _object_exists(self, collection_id: uuid.UUID, object_id: str) -> bool:
+        return bool(
+            self.db.session.query(literal(True))
+            .filter(
+                self.db.session.query(taxii2models.STIXObject)
+                .filter(
+                    taxii2models.STIXObject.id == object_id,
+                    taxii2models.STIXObject.collection_id == collection_id,
+                )
+                .exists()
+            )
+            .scalar()
+        )
 
     def _filtered_objects_query(
         self,
@@ -875,17 +1189,74 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
         match_version: Optional[List[str]] = None,
         match_spec_version: Optional[List[str]] = None,
         ordered: bool = True,
-    ) -> Tuple[Query, bool]:
+    ) -> Query:
         query = self._objects_query(collection_id, ordered)
         query = self._apply_added_after(query, added_after)
         query = self._apply_next_kwargs(query, next_kwargs)
         query = self._apply_match_id(query, match_id)
         query = self._apply_match_type(query, match_type)
-        query = self._apply_match_version(query, collection_id, match_version)
+        query = self._apply_match_version(query, match_version)
         query = self._apply_match_spec_version(query, match_spec_version)
-        query, more = self._apply_limit(query, limit)
-        return query, more
+        query = self._apply_limit(query, limit)
+        return query
 
+    def _get_watermark_row(
+        self, collection_id: uuid.UUID
+    ) -> Optional[taxii2models.CollectionWatermark]:
+        return self.db.session.query(taxii2models.CollectionWatermark).get(
+            collection_id
+        )
+
+    def _compute_watermark(
+        self, collection_id: uuid.UUID
+    ) -> Tuple[Optional[datetime.datetime], int]:
+        """Get the latest ``date_added`` and the object count of a collection."""
+        return (
+            self.db.session.query(
+                func.max(taxii2models.STIXObject.date_added),
+                func.count(taxii2models.STIXObject.pk),
+            )
+            .filter(taxii2models.STIXObject.collection_id == collection_id)
+            .one()
+        )
+
+    def _is_past_watermark(
+        self,
+        collection_id: uuid.UUID,
+        added_after: Optional[datetime.datetime] = None,
+        next_kwargs: Optional[Dict] = None,
+    ) -> bool:
+        """Check if no object of the collection can match, using its watermark."""
+        watermark = self._get_watermark_row(collection_id)
+        if watermark is None:
+            return False
+        if watermark.count <= 0 or watermark.date_added is None:
+            return True
+        if added_after is not None and watermark.date_added <= added_after:
+            return True
+        return (
+            next_kwargs is not None and watermark.date_added < next_kwargs["date_added"]
+        )
+
+    @read_from_replica
+    def get_collection_watermark(
+        self, collection_id: uuid.UUID
+    ) -> entities.CollectionWatermark:
+        watermark = self._get_watermark_row(collection_id)
+        if watermark is not None:
+            return entities.CollectionWatermark(
+                collection_id=collection_id,
+                date_added=watermark.date_added,
+                count=watermark.count,
+                sequence=watermark.sequence,
+            )
+        # collections that are not backfilled yet
+        date_added, count = self._compute_watermark(collection_id)
+        return entities.CollectionWatermark(
+            collection_id=collection_id, date_added=date_added, count=count
+        )
+
+    @read_from_replica
     def get_manifest(
         self,
         collection_id: uuid.UUID,
@@ -897,7 +1268,9 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
         match_version: Optional[List[str]] = None,
         match_spec_version: Optional[List[str]] = None,
     ) -> Tuple[List[entities.ManifestRecord], bool]:
-        query, more = self._filtered_objects_query(
+        if self._is_past_watermark(collection_id, added_after, next_kwargs):
+            return [], False
+        query = self._filtered_objects_query(
             collection_id=collection_id,
             limit=limit,
             added_after=added_after,
@@ -915,6 +1288,7 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
                 taxii2models.STIXObject.spec_version,
             )
         )
+        items, more = self._fetch_page(query, limit)
         return (
             [
                 entities.ManifestRecord(
@@ -923,11 +1297,12 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
                     version=obj.version,
                     spec_version=obj.spec_version,
                 )
-                for obj in query.all()
+                for obj in items
             ],
             more,
         )
 
+    @read_from_replica
     def get_objects(
         self,
         collection_id: uuid.UUID,
@@ -939,7 +1314,9 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
         match_version: Optional[List[str]] = None,
         match_spec_version: Optional[List[str]] = None,
     ) -> Tuple[List[entities.STIXObject], bool, Optional[str]]:
-        query, more = self._filtered_objects_query(
+        if self._is_past_watermark(collection_id, added_after, next_kwargs):
+            return [], False, None
+        query = self._filtered_objects_query(
             collection_id=collection_id,
             limit=limit,
             added_after=added_after,
@@ -949,10 +1326,14 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
             match_version=match_version,
             match_spec_version=match_spec_version,
         )
-        items = query.all()
+        items, more = self._fetch_page(query, limit)
         if more:
             next_param = self.get_next_param(
-                {"id": items[-1].id, "date_added": items[-1].date_added}
+                {
+                    "id": items[-1].id,
+                    "date_added": items[-1].date_added,
+                    "version": items[-1].version,
+                }
             )
         else:
             next_param = None
@@ -966,6 +1347,7 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
                     date_added=obj.date_added,
                     version=obj.version,
                     serialized_data=obj.serialized_data,
+                    raw_data=obj.raw_data,
                 )
                 for obj in items
             ],
@@ -973,6 +1355,100 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
             next_param,
         )
 
+    @read_from_replica
+    def stream_objects(
+        self,
+        collection_id: uuid.UUID,
+        limit: Optional[int] = None,
+        added_after: Optional[datetime.datetime] = None,
+        next_kwargs: Optional[Dict] = None,
+        match_id: Optional[List[str]] = None,
+        match_type: Optional[List[str]] = None,
+        match_version: Optional[List[str]] = None,
+        match_spec_version: Optional[List[str]] = None,
+    ) -> Tuple[
+        Iterator[entities.STIXObject],
+        bool,
+        Optional[str],
+        Optional[datetime.datetime],
+        Optional[datetime.datetime],
+    ]:
+        if self._is_past_watermark(collection_id, added_after, next_kwargs):
+            return iter(()), False, None, None, None
+        query = self._filtered_objects_query(
+            collection_id=collection_id,
+            added_after=added_after,
+            next_kwargs=next_kwargs,
+            match_id=match_id,
+            match_type=match_type,
+            match_version=match_version,
+            match_spec_version=match_spec_version,
+        )
+        # Look up the page boundaries first, so that headers, ``more`` and
+        # ``next`` are known before any object is read.
+        keys = query.with_entities(
+            taxii2models.STIXObject.date_added,
+            taxii2models.STIXObject.id,
+            taxii2models.STIXObject.version,
+        )
+        first = keys.first()
+        if first is None or (limit is not None and limit < 1):
+            return iter(()), False, None, None, None
+        more = False
+        last = None
+        if limit is not None:
+            tail = keys.offset(limit - 1).limit(2).all()
+            if tail:
+                last = tail[0]
+                more = len(tail) > 1
+        if last is None:
+            last = (
+                keys.order_by(None)
+                .order_by(
+                    taxii2models.STIXObject.date_added.desc(),
+                    taxii2models.STIXObject.id.desc(),
+                    taxii2models.STIXObject.version.desc(),
+                )
+                .first()
+            )
+        if more:
+            next_param = self.get_next_param(
+                {"id": last.id, "date_added": last.date_added, "version": last.version}
+            )
+        else:
+            next_param = None
+        # Stop at the last object of the page, also if objects are added
+        # while the page is streamed.
+        query = query.filter(
+            (taxii2models.STIXObject.date_added < last.date_added)
+            | (
+                (taxii2models.STIXObject.date_added == last.date_added)
+                & (
+                    (taxii2models.STIXObject.id < last.id)
+                    | (
+                        (taxii2models.STIXObject.id == last.id)
+                        & (taxii2models.STIXObject.version <= last.version)
+                    )
+                )
+            )
+        )
+        objects = (
+            entities.STIXObject(
+                id=obj.id,
+                collection_id=collection_id,
+                type=obj.type,
+                spec_version=obj.spec_version,
+                date_added=obj.date_added,
+                version=obj.version,
+                serialized_data=obj.serialized_data,
+                raw_data=obj.raw_data,
+            )
+            for obj in self.db.iterate_from(
+                self.db.get_read_bind(), query.yield_per(YIELD_PER_SIZE)
+            )
+        )
+        return objects, more, next_param, first.date_added, last.date_added
+
     def add_objects(
         self, api_root_id: uuid.UUID, collection_id: uuid.UUID, objects: List[Dict]
     ) -> entities.Job:
@@ -987,54 +1463,472 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
         )
         self.db.session.add(job)
         self.db.session.commit()
+        job_details = self._add_objects_and_details(job.id, collection_id, objects)
+        job.total_count = len(objects)
+        job.success_count = len(objects)
+        job.status = "complete"
+        job.completed_timestamp = datetime.datetime.now(datetime.timezone.utc)
+        self.db.session.commit()
+        job_entity = self._job_and_details_to_entity(job, job_details)
+        return job_entity
+
+    def add_pending_objects(
+        self,
+        api_root_id: uuid.UUID,
+        collection_id: uuid.UUID,
+        objects: List[Dict],
+        validation_level: str = "full",
+    ) -> entities.Job:
+        job = taxii2models.Job(
+            id=uuid.uuid4(),
+            api_root_id=api_root_id,
+            status="pending",
+            request_timestamp=datetime.datetime.now(datetime.timezone.utc),
+            total_count=len(objects),
+            success_count=0,
+            failure_count=0,
+            pending_count=len(objects),
+        )
+        self.db.session.add(job)
+        self.db.session.add(
+            taxii2models.JobPayload(
+                job_id=job.id,
+                collection_id=collection_id,
+                objects=objects,
+                processed_count=0,
+                validation_level=validation_level,
+                attempts=0,
+            )
+        )
+        self.db.session.commit()
+        return self._job_and_details_to_entity(job, [])
+
+    def claim_pending_job(self, claim_timeout: int) -> Optional[entities.PendingJob]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        claimable = (taxii2models.JobPayload.claimed_at.is_(None)) | (
+            taxii2models.JobPayload.claimed_at
+            < now - datetime.timedelta(seconds=claim_timeout)
+        )
+        candidates = (
+            self.db.session.query(taxii2models.JobPayload.job_id)
+            .join(taxii2models.Job)
+            .filter(claimable)
+            .order_by(taxii2models.Job.request_timestamp)
+            .limit(CLAIM_CANDIDATES)
+            .all()
+        )
+        for (job_id,) in candidates:
+            # Only one worker can win the conditional update of a payload
+            claimed = (
+                self.db.session.query(taxii2models.JobPayload)
+                .filter(taxii2models.JobPayload.job_id == job_id, claimable)
+                .update(
+                    {
+                        taxii2models.JobPayload.claimed_at: now,
+                        taxii2models.JobPayload.attempts: taxii2models.JobPayload.attempts
+                        + 1,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            self.db.session.commit()
+            if claimed:
+                payload = self.db.session.query(taxii2models.JobPayload).get(job_id)
+                return entities.PendingJob(
+                    id=payload.job_id,
+                    collection_id=payload.collection_id,
+                    objects=payload.objects,
+                    processed_count=payload.processed_count,
+                    validation_level=payload.validation_level,
+                    attempts=payload.attempts,
+                )
+        return None
+
+    def add_job_objects(
+        self,
+        job_id: uuid.UUID,
+        collection_id: uuid.UUID,
+        objects: List[Dict],
+        failures: List[Tuple[Dict, str]],
+    ) -> None:
+        self._add_objects_and_details(job_id, collection_id, objects, failures)
+        processed_count = len(objects) + len(failures)
+        self.db.session.query(taxii2models.Job).filter(
+            taxii2models.Job.id == job_id
+        ).update(
+            {
+                taxii2models.Job.success_count: taxii2models.Job.success_count
+                + len(objects),
+                taxii2models.Job.failure_count: taxii2models.Job.failure_count
+                + len(failures),
+                taxii2models.Job.pending_count: taxii2models.Job.pending_count
+                - processed_count,
+            },
+            synchronize_session=False,
+        )
+        self.db.session.query(taxii2models.JobPayload).filter(
+            taxii2models.JobPayload.job_id == job_id
+        ).update(
+            {
+                taxii2models.JobPayload.processed_count: taxii2models.JobPayload.processed_count
+                + processed_count,
+                taxii2models.JobPayload.claimed_at: datetime.datetime.now(
+                    datetime.timezone.utc
+                ),
+            },
+            synchronize_session=False,
+        )
+        self.db.session.commit()
+
+    def complete_job(self, job_id: uuid.UUID) -> None:
+        self.db.session.query(taxii2models.JobPayload).filter(
+            taxii2models.JobPayload.job_id == job_id
+        ).delete(synchronize_session=False)
+        self.db.session.query(taxii2models.Job).filter(
+            taxii2models.Job.id == job_id
+        ).update(
+            {
+                taxii2models.Job.status: "complete",
+                taxii2models.Job.pending_count: 0,
+                taxii2models.Job.completed_timestamp: datetime.datetime.now(
+                    datetime.timezone.utc
+                ),
+            },
+            synchronize_session=False,
+        )
+        self.db.session.commit()
+
+    def _serialize_object(self, obj: Dict) -> Dict:
+        """Get the payload columns of a stix object row."""
+        if self.raw_objects:
+            raw_data = json.dumps(obj)
+            if self.compression:
+                raw_data = compress(
+                    raw_data.encode("utf-8"), self.compression, STIX2_JSON_DICTIONARY
+                )
+            return {"serialized_data": None, "raw_data": raw_data}
+        return {
+            "serialized_data": {
+                key: value
+                for (key, value) in obj.items()
+                if key not in ["id", "type", "spec_version"]
+            },
+            "raw_data": None,
+        }
+
+    def _add_objects_and_details(
+        self,
+        job_id: uuid.UUID,
+        collection_id: uuid.UUID,
+        objects: List[Dict],
+        failures: Optional[List[Tuple[Dict, str]]] = None,
+    ) -> List[taxii2models.JobDetail]:
+        """
+        Insert ``objects`` that are not stored yet, plus a job detail per object.
+
+        Does not commit.
+        """
+        existing_versions = self._get_existing_versions(
+            collection_id, {obj["id"] for obj in objects}
+        )
+        versions_by_id: Dict[str, Set[datetime.datetime]] = defaultdict(set)
+        for obj_id, version in existing_versions:
+            versions_by_id[obj_id].add(version)
+        for obj in objects:
+            versions_by_id[obj["id"]].add(get_object_version(obj))
+        date_added = datetime.datetime.now(datetime.timezone.utc)
+        stix_object_rows = []
+        changed_ids = set()
         job_details = []
         for obj in objects:
             version = get_object_version(obj)
-            if (
-                not self.db.session.query(literal(True))
-                .filter(
-                    self.db.session.query(taxii2models.STIXObject)
-                    .filter(
-                        taxii2models.STIXObject.id == obj["id"],
-                        taxii2models.STIXObject.collection_id == collection_id,
-                        taxii2models.STIXObject.version == version,
-                    )
-                    .exists()
+            if (obj["id"], version) not in existing_versions:
+                existing_versions.add((obj["id"], version))
+                changed_ids.add(obj["id"])
+                stix_object_rows.append(
+                    {
+                        "pk": uuid.uuid4(),
+                        "id": obj["id"],
+                        "collection_id": collection_id,
+                        "type": obj["id"].split("--")[0],
+                        "spec_version": obj["spec_version"],
+                        "date_added": date_added,
+                        "version": version,
+                        **self._serialize_object(obj),
+                        "is_first": version == min(versions_by_id[obj["id"]]),
+                        "is_latest": version == max(versions_by_id[obj["id"]]),
+                    }
+                )
+            job_details.append(
+                taxii2models.JobDetail(
+                    id=uuid.uuid4(),
+                    job_id=job_id,
+                    stix_id=obj["id"],
+                    version=version,
+                    message="",
+                    status="success",
+                )
+            )
+        for obj, message in failures or []:
+            job_details.append(
+                taxii2models.JobDetail(
+                    id=uuid.uuid4(),
+                    job_id=job_id,
+                    stix_id=str(obj.get("id", ""))[:100],
+                    version=get_failed_object_version(obj),
+                    message=message,
+                    status="failure",
+                )
+            )
+        inserted = bulk_insert(
+            self.db.session,
+            taxii2models.STIXObject.__table__,
+            stix_object_rows,
+            ignore_duplicates=True,
+        )
+        if inserted:
+            update_watermarks(
+                self.db.session,
+                taxii2models.CollectionWatermark.date_added,
+                [collection_id],
+                inserted,
+                date_added,
+            )
+        self._update_version_flags(
+            collection_id, {obj_id: versions_by_id[obj_id] for obj_id in changed_ids}
+        )
+        bulk_insert(
+            self.db.session,
+            taxii2models.JobDetail.__table__,
+            [
+                {
+                    "id": job_detail.id,
+                    "job_id": job_detail.job_id,
+                    "stix_id": job_detail.stix_id,
+                    "version": job_detail.version,
+                    "message": job_detail.message,
+                    "status": job_detail.status,
+                }
+                for job_detail in job_details
+            ],
+        )
+        return job_details
+
+    def _update_version_flags(
+        self,
+        collection_id: uuid.UUID,
+        versions_by_id: Dict[str, Set[datetime.datetime]],
+    ) -> None:
+        """
+        Set ``is_first`` and ``is_latest`` for the objects in ``versions_by_id``.
+
+        ``versions_by_id`` maps object ids to all their versions stored in the
+        collection. Only rows whose flags change are updated. Does not commit.
+        """
+        object_ids = sorted(versions_by_id)
+        for start in range(0, len(object_ids), BULK_QUERY_CHUNK_SIZE):
+            chunk = object_ids[start : start + BULK_QUERY_CHUNK_SIZE]
+            for column, pick in (
+                (taxii2models.STIXObject.is_first, min),
+                (taxii2models.STIXObject.is_latest, max),
+            ):
+                flagged = [(obj_id, pick(versions_by_id[obj_id])) for obj_id in chunk]
+
+                def flag():
+                    # An expanding IN parameter can't be shared between clauses
+                    return tuple_(
+                        taxii2models.STIXObject.id, taxii2models.STIXObject.version
+                    ).in_(flagged)
+
+                self.db.session.query(taxii2models.STIXObject).filter(
+                    taxii2models.STIXObject.collection_id == collection_id,
+                    taxii2models.STIXObject.id.in_(chunk),
+                    column != flag().self_group(),
+                ).update({column: flag()}, synchronize_session=False)
+
+    def backfill_version_flags(self) -> int:
+        """
+        (Re)compute the ``is_first``/``is_latest`` flags of all stix objects.
+
+        Used to migrate databases created before the flags existed, after the
+        columns are added with :meth:`upgrade_schema`.
+
+        :return: The number of stix objects (all versions counted once) processed.
+        """
+        counter = 0
+        for (collection_id,) in self.db.session.query(taxii2models.Collection.id):
+            last_id = None
+            while True:
+                query = (
+                    self.db.session.query(taxii2models.STIXObject.id)
+                    .filter(taxii2models.STIXObject.collection_id == collection_id)
+                    .distinct()
+                    .order_by(taxii2models.STIXObject.id)
                 )
-                .scalar()
+                if last_id is not None:
+                    query = query.filter(taxii2models.STIXObject.id > last_id)
+                object_ids = [
+                    obj_id for (obj_id,) in query.limit(BULK_QUERY_CHUNK_SIZE)
+                ]
+                if not object_ids:
+                    break
+                versions_by_id: Dict[str, Set[datetime.datetime]] = defaultdict(set)
+                for obj_id, version in self._get_existing_versions(
+                    collection_id, set(object_ids)
+                ):
+                    versions_by_id[obj_id].add(version)
+                self._update_version_flags(collection_id, versions_by_id)
+                self.db.session.commit()
+                counter += len(object_ids)
+                last_id = object_ids[-1]
+        return counter
+
+    def backfill_watermarks(self) -> int:
+        """
+        (Re)compute the watermark of every collection from its objects.
+
+        Used to migrate databases created before watermarks existed. Run it
+        while no objects are added.
+
+        :return: The number of collections processed.
+        """
+        counter = 0
+        for (collection_id,) in self.db.session.query(taxii2models.Collection.id).all():
+            date_added, count = self._compute_watermark(collection_id)
+            watermark = self._get_watermark_row(collection_id)
+            if watermark is None:
+                watermark = taxii2models.CollectionWatermark(
+                    collection_id=collection_id, sequence=0
+                )
+                self.db.session.add(watermark)
+            watermark.date_added = date_added
+            watermark.count = count
+            watermark.sequence += 1
+            self.db.session.commit()
+            counter += 1
+        return counter
+
+    def upgrade_schema(self) -> List[str]:
+        """
+        Add the columns and indexes missing from a stix object table created by
+        an older version.
+
+        Missing tables are created when the API is initialized, this covers
+        the columns added to the existing stix object table since then. Run
+        :meth:`backfill_version_flags` afterwards to fill the version flags.
+
+        :return: the names of the added columns and indexes
+        """
+        table = taxii2models.STIXObject.__table__
+        inspector = sqlalchemy.inspect(self.db.engine)
+        existing_columns = {
+            column["name"] for column in inspector.get_columns(table.name)
+        }
+        existing_indexes = {
+            index["name"] for index in inspector.get_indexes(table.name)
+        }
+        added = []
+        with self.db.engine.begin() as connection:
+            false = sqlalchemy.false().compile(dialect=connection.dialect)
+            for name, constraint in (
+                ("is_first", f"NOT NULL DEFAULT {false}"),
+                ("is_latest", f"NOT NULL DEFAULT {false}"),
+                ("raw_data", ""),
             ):
-                self.db.session.add(
-                    taxii2models.STIXObject(
-                        id=obj["id"],
-                        collection_id=collection_id,
-                        type=obj["id"].split("--")[0],
-                        spec_version=obj["spec_version"],
-                        date_added=datetime.datetime.now(datetime.timezone.utc),
-                        version=version,
-                        serialized_data={
-                            key: value
-                            for (key, value) in obj.items()
-                            if key not in ["id", "type", "spec_version"]
-                        },
+                if name in existing_columns:
+                    continue
+                column_type = table.c[name].type.compile(dialect=connection.dialect)
+                connection.execute(
+                    sqlalchemy.text(
+                        f"ALTER TABLE {table.name} ADD COLUMN "
+                        f"{name} {column_type} {constraint}".rstrip()
                     )
                 )
-            job_detail = taxii2models.JobDetail(
-                job_id=job.id,
-                stix_id=obj["id"],
-                version=version,
-                message="",
-                status="success",
+                log.info("stixobject.column_added", column=name)
+                added.append(name)
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=connection)
+                    log.info("stixobject.index_added", index=index.name)
+                    added.append(index.name)
+        return added
+
+    def recompress_objects(self, batch_size: int = 1000) -> int:
+        """
+        Rewrite stored stix objects with the configured ``raw_objects`` and ``compression``.
+
+        Objects are rewritten in batches of ``batch_size``, with a transaction
+        per batch. Objects are converted between raw and decoded storage too.
+
+        :return: the number of rewritten stix objects
+        """
+        model = taxii2models.STIXObject
+        stored_raw_data = type_coerce(model.raw_data, sqlalchemy.LargeBinary)
+        counter = 0
+        last_pk = None
+        while True:
+            query = self.db.session.query(
+                model.pk,
+                model.id,
+                model.type,
+                model.spec_version,
+                model.serialized_data,
+                stored_raw_data,
+            ).order_by(model.pk)
+            if last_pk is not None:
+                query = query.filter(model.pk > last_pk)
+            rows = query.limit(batch_size).all()
+            if not rows:
+                break
+            updates = []
+            for pk, obj_id, obj_type, spec_version, serialized_data, raw_data in rows:
+                if raw_data is not None:
+                    raw_data = bytes(raw_data)
+                    if self.raw_objects and is_compressed_with(
+                        raw_data, self.compression, STIX2_JSON_DICTIONARY
+                    ):
+                        continue
+                    obj = json.loads(decompress(raw_data))
+                elif self.raw_objects:
+                    obj = {
+                        "id": obj_id,
+                        "type": obj_type,
+                        "spec_version": spec_version,
+                        **serialized_data,
+                    }
+                else:
+                    continue
+                updates.append({"pk": pk, **self._serialize_object(obj)})
+            if updates:
+                self.db.session.bulk_update_mappings(model, updates)
+                self.db.session.commit()
+            counter += len(updates)
+            last_pk = rows[-1][0]
+        return counter
+
+    def _get_existing_versions(
+        self, collection_id: uuid.UUID, object_ids: Set[str]
+    ) -> Set[Tuple[str, datetime.datetime]]:
+        """
+        Get the ``(id, version)`` pairs already stored for ``object_ids``.
+
+        Object ids are looked up in chunks to keep the ``IN`` clause bounded.
+        """
+        existing_versions = set()
+        object_ids_list = sorted(object_ids)
+        for start in range(0, len(object_ids_list), BULK_QUERY_CHUNK_SIZE):
+            query = self.db.session.query(
+                taxii2models.STIXObject.id, taxii2models.STIXObject.version
+            ).filter(
+                taxii2models.STIXObject.collection_id == collection_id,
+                taxii2models.STIXObject.id.in_(
+                    object_ids_list[start : start + BULK_QUERY_CHUNK_SIZE]
+                ),
             )
-            job_details.append(job_detail)
-            self.db.session.add(job_detail)
-            job.total_count += 1  # type: ignore[operator]
-            job.success_count += 1  # type: ignore[operator]
-        job.status = "complete"
-        job.completed_timestamp = datetime.datetime.now(datetime.timezone.utc)
-        self.db.session.commit()
-        job_entity = self._job_and_details_to_entity(job, job_details)
-        return job_entity
+            existing_versions.update((obj_id, version) for obj_id, version in query)
+        return existing_versions
 
+    @read_from_replica
     def get_object(
         self,
         collection_id: uuid.UUID,
@@ -1050,20 +1944,7 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
 
         Should return `None` when object matching object_id doesn't exist.
         """
-        if (
-            not self.db.session.query(literal(True))
-            .filter(
-                self.db.session.query(taxii2models.STIXObject)
-                .filter(
-                    taxii2models.STIXObject.id == object_id,
-                    taxii2models.STIXObject.collection_id == collection_id,
-                )
-                .exists()
-            )
-            .scalar()
-        ):
-            return (None, False, None)
-        query, more = self._filtered_objects_query(
+        query = self._filtered_objects_query(
             collection_id=collection_id,
             limit=limit,
             added_after=added_after,
@@ -1072,10 +1953,16 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
             match_version=match_version,
             match_spec_version=match_spec_version,
         )
-        items = query.all()
+        items, more = self._fetch_page(query, limit)
+        if not items and not self._object_exists(collection_id, object_id):
+            return (None, False, None)
         if more:
             next_param = self.get_next_param(
-                {"id": items[-1].id, "date_added": items[-1].date_added}
+                {
+                    "id": items[-1].id,
+                    "date_added": items[-1].date_added,
+                    "version": items[-1].version,
+                }
             )
         else:
             next_param = None
@@ -1089,6 +1976,7 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
                     date_added=obj.date_added,
                     version=obj.version,
                     serialized_data=obj.serialized_data,
+                    raw_data=obj.raw_data,
                 )
                 for obj in items
             ],
@@ -1105,16 +1993,28 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
     ) -> None:
         if match_version is None:
             match_version = ["all"]
-        query, _ = self._filtered_objects_query(
+        query = self._filtered_objects_query(
             collection_id=collection_id,
             match_id=[object_id],
             match_version=match_version,
             match_spec_version=match_spec_version,
             ordered=False,
         )
-        query.delete("fetch")
+        deleted = query.delete("fetch")
+        if deleted:
+            update_watermarks(
+                self.db.session,
+                taxii2models.CollectionWatermark.date_added,
+                [collection_id],
+                -deleted,
+            )
+        versions_by_id: Dict[str, Set[datetime.datetime]] = defaultdict(set)
+        for obj_id, version in self._get_existing_versions(collection_id, {object_id}):
+            versions_by_id[obj_id].add(version)
+        self._update_version_flags(collection_id, versions_by_id)
         self.db.session.commit()
 
+    @read_from_replica
     def get_versions(
         self,
         collection_id: uuid.UUID,
@@ -1129,20 +2029,7 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
 
         Should return `None` when object matching object_id doesn't exist.
         """
-        if (
-            not self.db.session.query(literal(True))
-            .filter(
-                self.db.session.query(taxii2models.STIXObject)
-                .filter(
-                    taxii2models.STIXObject.id == object_id,
-                    taxii2models.STIXObject.collection_id == collection_id,
-                )
-                .exists()
-            )
-            .scalar()
-        ):
-            return (None, False)
-        query, more = self._filtered_objects_query(
+        query = self._filtered_objects_query(
             collection_id=collection_id,
             limit=limit,
             added_after=added_after,
@@ -1157,13 +2044,16 @@ class Taxii2SQLDatabaseAPI(BaseSQLDatabaseAPI, OpenTAXII2PersistenceAPI):
                 taxii2models.STIXObject.version,
             )
         )
+        items, more = self._fetch_page(query, limit)
+        if not items and not self._object_exists(collection_id, object_id):
+            return (None, False)
         return (
             [
                 entities.VersionRecord(
                     date_added=obj.date_added,
                     version=obj.version,
                 )
-                for obj in query.all()
+                for obj in items
             ],
             more,
         )
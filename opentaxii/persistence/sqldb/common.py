@@ -1,11 +1,18 @@
 """A module to put common database helper components."""
 
 import uuid
-from datetime import timezone
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
 
-from sqlalchemy.dialects import mysql
+from sqlalchemy import case, insert, literal, or_
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.types import CHAR, DateTime, TypeDecorator
+from sqlalchemy.orm import Session
+from sqlalchemy.types import CHAR, DateTime, LargeBinary, TypeDecorator
+
+from opentaxii.persistence.sqldb.compression import decompress
+
+BULK_INSERT_CHUNK_SIZE = 1000
 
 
 class GUID(TypeDecorator):
@@ -71,3 +78,116 @@ class UTCDateTime(TypeDecorator):
         """Convert from database to python representation."""
         if value is not None:
             return value.replace(tzinfo=timezone.utc)
+
+
+class CompressedBinary(TypeDecorator):
+    """
+    Binary type that transparently decompresses stored values.
+
+    Values are stored as given, encode them with
+    :func:`opentaxii.persistence.sqldb.compression.compress` first, also when
+    they are stored uncompressed. Values without a header written by
+    ``compress`` are returned as they are.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        """Switch implementation based on database dialect."""
+        if dialect.name == 'mysql':
+            return dialect.type_descriptor(mysql.MEDIUMBLOB())
+        else:
+            return dialect.type_descriptor(LargeBinary())
+
+    def process_result_value(self, value, dialect):
+        """Convert from database to python representation."""
+        if value is not None:
+            return decompress(bytes(value))
+
+
+class CompressedText(CompressedBinary):
+    """Text type stored as utf-8 encoded :class:`CompressedBinary`."""
+
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        """Convert from python to database representation."""
+        if isinstance(value, str):
+            return value.encode("utf-8")
+        return value
+
+    def process_result_value(self, value, dialect):
+        """Convert from database to python representation."""
+        value = super().process_result_value(value, dialect)
+        if value is not None:
+            return value.decode("utf-8")
+
+
+def bulk_insert(
+    session: Session, table, rows: List[Dict], ignore_duplicates: bool = False
+) -> int:
+    """
+    Insert ``rows`` into ``table`` with chunked multi-row statements.
+
+    With ``ignore_duplicates``, rows violating a unique constraint are skipped
+    using ``INSERT ... ON CONFLICT DO NOTHING`` on PostgreSQL and SQLite and
+    ``INSERT IGNORE`` on MySQL.
+
+    :return: the number of inserted rows, or ``len(rows)`` when the driver
+        does not report it
+    """
+    if not rows:
+        return 0
+    dialect_name = session.get_bind().dialect.name
+    if not ignore_duplicates:
+        stmt = insert(table)
+    elif dialect_name == "postgresql":
+        stmt = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect_name == "sqlite":
+        stmt = sqlite.insert(table).on_conflict_do_nothing()
+    elif dialect_name in ("mysql", "mariadb"):
+        stmt = insert(table).prefix_with("IGNORE")
+    else:
+        stmt = insert(table)
+    inserted = 0
+    for start in range(0, len(rows), BULK_INSERT_CHUNK_SIZE):
+        chunk = rows[start : start + BULK_INSERT_CHUNK_SIZE]
+        rowcount = session.execute(stmt, chunk).rowcount
+        inserted += rowcount if rowcount is not None and rowcount >= 0 else len(chunk)
+    return inserted
+
+
+def update_watermarks(
+    session: Session,
+    added_column,
+    collection_ids: Iterable,
+    count_delta: int,
+    added: Optional[datetime] = None,
+) -> None:
+    """
+    Record a change of the contents of collections in their watermark rows.
+
+    Bumps the ``sequence``, adds ``count_delta`` to the ``count`` and moves
+    ``added_column`` forward to ``added``, it never moves backwards. The
+    watermark model is the class of ``added_column``. Collections without a
+    watermark row are left alone, see ``backfill_watermarks``.
+
+    Does not commit.
+    """
+    model = added_column.class_
+    values = {
+        model.count: model.count + count_delta,
+        model.sequence: model.sequence + 1,
+    }
+    if added is not None:
+        values[added_column] = case(
+            (
+                or_(added_column.is_(None), added_column < added),
+                literal(added, type_=added_column.type),
+            ),
+            else_=added_column,
+        )
+    session.query(model).filter(model.collection_id.in_(list(collection_ids))).update(
+        values, synchronize_session=False
+    )
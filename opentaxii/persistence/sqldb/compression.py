@@ -0,0 +1,222 @@
+"""Compression of stored payloads, see :class:`.common.CompressedBinary`."""
+
+import importlib
+import zlib
+from typing import Dict, Optional, Tuple
+
+# Compressed values start with the magic, followed by one byte for the
+# codec and one byte for the preset dictionary they were compressed with.
+# Uncompressed values that start with the magic are stored with the identity
+# codec, so that stored payloads never look like compressed values.
+MAGIC = b"\x00otc"
+HEADER_SIZE = len(MAGIC) + 2
+
+ZLIB = "zlib"
+ZSTD = "zstd"
+CODEC_IDS = {ZLIB: b"z", ZSTD: b"s"}
+CODECS = tuple(CODEC_IDS)
+IDENTITY_CODEC_ID = b"n"
+
+# decompressing a value to more bytes than this raises ValueError
+MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+NO_DICTIONARY = 0
+STIX2_JSON_DICTIONARY = 1
+STIX1_XML_DICTIONARY = 2
+
+# Preset dictionaries hold strings that are frequent in the payloads, so that
+# small payloads compress well too. Dictionaries are referred to by id from
+# stored values: never change a dictionary, add a new one instead.
+DICTIONARIES: Dict[int, bytes] = {
+    NO_DICTIONARY: b"",
+    STIX2_JSON_DICTIONARY: (
+        b'"external_references": [{"source_name": "mitre-attack", "url": "https://'
+        b'"kill_chain_phases": [{"kill_chain_name": "mitre-attack", "phase_name": "'
+        b'"object_marking_refs": ["marking-definition--'
+        b'"granular_markings": "created_by_ref": "identity--'
+        b'"pattern_type": "stix", "pattern_version": "2.1", "pattern": "[file:hashes.'
+        b"'SHA-256' = '\", \"[ipv4-addr:value = '\", \"[url:value = '"
+        b'"valid_from": "", "valid_until": "'
+        b'"indicator_types": ["malicious-activity"], "labels": ["'
+        b'"relationship_type": "indicates", "source_ref": "indicator--'
+        b'"target_ref": "malware--", "is_family": true, "malware_types": ["'
+        b'"description": "", "name": "", "confidence": , "lang": "en", '
+        b'"revoked": false, "x_mitre_'
+        b'"type": "attack-pattern", "type": "course-of-action", '
+        b'"type": "identity", "identity_class": "organization", '
+        b'"type": "threat-actor", "type": "intrusion-set", "type": "campaign", '
+        b'"type": "vulnerability", "type": "observed-data", "type": "sighting", '
+        b'"type": "report", "report_types": ["threat-report"], "object_refs": ["'
+        b'"type": "relationship", "type": "malware", "type": "indicator", '
+        b'"created": "T00:00:00.000Z", "modified": "", "published": "'
+        b'"spec_version": "2.1", "id": "indicator--'
+    ),
+    STIX1_XML_DICTIONARY: (
+        b'<?xml version="1.0" encoding="UTF-8"?>\n'
+        b'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        b'xmlns:stix="http://stix.mitre.org/stix-1" '
+        b'xmlns:stixCommon="http://stix.mitre.org/common-1" '
+        b'xmlns:stixVocabs="http://stix.mitre.org/default_vocabularies-1" '
+        b'xmlns:indicator="http://stix.mitre.org/Indicator-2" '
+        b'xmlns:ttp="http://stix.mitre.org/TTP-1" '
+        b'xmlns:cybox="http://cybox.mitre.org/cybox-2" '
+        b'xmlns:cyboxCommon="http://cybox.mitre.org/common-2" '
+        b'xmlns:cyboxVocabs="http://cybox.mitre.org/default_vocabularies-2" '
+        b'xmlns:AddressObj="http://cybox.mitre.org/objects#AddressObject-2" '
+        b'xmlns:DomainNameObj="http://cybox.mitre.org/objects#DomainNameObject-1" '
+        b'xmlns:URIObj="http://cybox.mitre.org/objects#URIObject-2" '
+        b'xmlns:FileObj="http://cybox.mitre.org/objects#FileObject-2" '
+        b'xmlns:marking="http://data-marking.mitre.org/Marking-1" '
+        b'xmlns:tlpMarking="http://data-marking.mitre.org/extensions/MarkingStructure#TLP-1" '
+        b'version="1.1.1"><stix:STIX_Header><stix:Title></stix:Title>'
+        b'<stix:Indicators><stix:Indicator xsi:type="indicator:IndicatorType" '
+        b'id="" timestamp=""><indicator:Title></indicator:Title>'
+        b'<indicator:Type xsi:type="stixVocabs:IndicatorTypeVocab-1.1">'
+        b'</indicator:Type><indicator:Observable id=""><cybox:Object id="">'
+        b'<cybox:Properties xsi:type="AddressObj:AddressObjectType" '
+        b'category="ipv4-addr"><AddressObj:Address_Value condition="Equals">'
+        b'</AddressObj:Address_Value></cybox:Properties></cybox:Object>'
+        b'</indicator:Observable></stix:Indicator></stix:Indicators>'
+        b'<cyboxCommon:Simple_Hash_Value condition="Equals">'
+        b'<cyboxCommon:Type xsi:type="cyboxVocabs:HashNameVocab-1.0">SHA256'
+        b"</cyboxCommon:Type><stixCommon:Confidence><stixCommon:Value>"
+        b"</stixCommon:Value></stixCommon:Confidence></stix:STIX_Package>"
+    ),
+}
+
+_zstd_dictionaries: Dict[int, object] = {}
+
+
+def _zstandard():
+    try:
+        return importlib.import_module("zstandard")
+    except ImportError as e:
+        raise ValueError(
+            f"{ZSTD} compression requires the zstandard package to be installed"
+        ) from e
+
+
+def _zstd_dictionary(dictionary_id: int):
+    if dictionary_id not in _zstd_dictionaries:
+        zstandard = _zstandard()
+        _zstd_dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(
+            DICTIONARIES[dictionary_id], dict_type=zstandard.DICT_TYPE_RAWCONTENT
+        )
+    return _zstd_dictionaries[dictionary_id]
+
+
+def check_codec(codec: Optional[str]) -> None:
+    """Raise :class:`ValueError` if ``codec`` cannot be used."""
+    if codec is None:
+        return
+    if codec not in CODEC_IDS:
+        raise ValueError(f"invalid compression {codec!r}, must be one of {CODECS}")
+    if codec == ZSTD:
+        _zstandard()
+
+
+def _header(value: bytes) -> Optional[Tuple[bytes, int]]:
+    """Get the codec id and dictionary id of a value written by :func:`compress`."""
+    if len(value) < HEADER_SIZE or value[: len(MAGIC)] != MAGIC:
+        return None
+    codec_id = value[len(MAGIC) : len(MAGIC) + 1]
+    dictionary_id = value[len(MAGIC) + 1]
+    if dictionary_id not in DICTIONARIES:
+        return None
+    if codec_id == IDENTITY_CODEC_ID and dictionary_id == NO_DICTIONARY:
+        return codec_id, dictionary_id
+    if codec_id in CODEC_IDS.values():
+        return codec_id, dictionary_id
+    return None
+
+
+def is_compressed(value: bytes) -> bool:
+    """Check if ``value`` was compressed by :func:`compress`."""
+    header = _header(value)
+    return header is not None and header[0] != IDENTITY_CODEC_ID
+
+
+def is_compressed_with(value: bytes, codec: Optional[str], dictionary_id: int) -> bool:
+    """Check if ``value`` is stored as :func:`compress` would store it."""
+    if codec is None:
+        return not is_compressed(value)
+    return _header(value) == (CODEC_IDS[codec], dictionary_id)
+
+
+def compress(
+    value: bytes, codec: Optional[str], dictionary_id: int = NO_DICTIONARY
+) -> bytes:
+    """
+    Compress ``value`` with ``codec``, using a preset dictionary.
+
+    ``value`` is always taken as a payload, to recompress a stored value
+    :func:`decompress` it first. ``codec`` `None` returns the value
+    uncompressed, with a header only if it starts with :data:`MAGIC`.
+    """
+    if codec is None:
+        if value[: len(MAGIC)] == MAGIC:
+            return MAGIC + IDENTITY_CODEC_ID + bytes([NO_DICTIONARY]) + value
+        return value
+    dictionary = DICTIONARIES[dictionary_id]
+    if codec == ZLIB:
+        compressor = (
+            zlib.compressobj(zdict=dictionary) if dictionary else zlib.compressobj()
+        )
+        body = compressor.compress(value) + compressor.flush()
+    elif codec == ZSTD:
+        zstandard = _zstandard()
+        if dictionary:
+            compressor = zstandard.ZstdCompressor(
+                dict_data=_zstd_dictionary(dictionary_id)
+            )
+        else:
+            compressor = zstandard.ZstdCompressor()
+        body = compressor.compress(value)
+    else:
+        raise ValueError(f"invalid compression {codec!r}, must be one of {CODECS}")
+    return MAGIC + CODEC_IDS[codec] + bytes([dictionary_id]) + body
+
+
+def decompress(value: bytes, max_size: int = MAX_DECOMPRESSED_SIZE) -> bytes:
+    """
+    Decompress ``value`` if it was written by :func:`compress`.
+
+    :raises ValueError: if the value decompresses to more than ``max_size``
+        bytes
+    """
+    header = _header(value)
+    if header is None:
+        return value
+    codec_id, dictionary_id = header
+    body = value[HEADER_SIZE:]
+    if codec_id == IDENTITY_CODEC_ID:
+        return body
+    dictionary = DICTIONARIES[dictionary_id]
+    if codec_id == CODEC_IDS[ZLIB]:
+        decompressor = (
+            zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        )
+        decompressed = decompressor.decompress(body, max_size + 1)
+        if decompressor.unconsumed_tail or len(decompressed) > max_size:
+            raise ValueError(f"value decompresses to more than {max_size} bytes")
+        return decompressed + decompressor.flush()
+    zstandard = _zstandard()
+    if dictionary:
+        decompressor = zstandard.ZstdDecompressor(
+            dict_data=_zstd_dictionary(dictionary_id)
+        )
+    else:
+        decompressor = zstandard.ZstdDecompressor()
+    chunks = []
+    size = 0
+    with decompressor.stream_reader(body) as reader:
+        while True:
+            chunk = reader.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise ValueError(f"value decompresses to more than {max_size} bytes")
+            chunks.append(chunk)
+    return b"".join(chunks)
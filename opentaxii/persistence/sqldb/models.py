@@ -7,13 +7,17 @@ from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, validates
 
+from opentaxii.persistence.sqldb.common import CompressedBinary
+
 __all__ = [
     'Base',
+    'CollectionWatermark',
     'ContentBlock',
     'DataCollection',
     'Service',
     'InboxMessage',
     'ResultSet',
+    'ResultSetPart',
     'Subscription',
 ]
 
@@ -67,8 +71,7 @@ class ContentBlock(AbstractModel):
         nullable=True,
     )
 
-    content_type = types.LargeBinary().with_variant(MYSQL_LARGE_BINARY, 'mysql')
-    content = schema.Column(content_type, nullable=False)
+    content = schema.Column(CompressedBinary, nullable=False)
 
     binding_id = schema.Column(types.String(300), index=True)
     binding_subtype = schema.Column(types.String(300), index=True)
@@ -156,6 +159,26 @@ class DataCollection(AbstractModel):
         return 'DataCollection(name={obj.name}, type={obj.type})'.format(obj=self)
 
 
+class CollectionWatermark(Base):
+    """Summary of the content blocks of a data collection.
+
+    Maintained on every change, so that polls can find out that nothing
+    was added without scanning content blocks.
+    """
+
+    __tablename__ = 'collection_watermarks'
+
+    collection_id = schema.Column(
+        types.Integer,
+        schema.ForeignKey('data_collections.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+    # latest timestamp label added, deleting content blocks keeps it as is
+    timestamp_label = schema.Column(types.DateTime(timezone=True), nullable=True)
+    count = schema.Column(types.Integer, nullable=False, default=0)
+    sequence = schema.Column(types.BigInteger, nullable=False, default=0)
+
+
 class InboxMessage(AbstractModel):
 
     __tablename__ = 'inbox_messages'
@@ -221,6 +244,30 @@ class ResultSet(AbstractModel):
     begin_time = schema.Column(types.DateTime(timezone=True), nullable=True)
     end_time = schema.Column(types.DateTime(timezone=True), nullable=True)
 
+    parts = relationship(
+        'ResultSetPart', cascade='all, delete-orphan', passive_deletes=True
+    )
+
+
+class ResultSetPart(Base):
+    '''Position of the first content block of a result set part.
+
+    The part starts right after the content block identified by
+    ``(timestamp_label, content_block_id)``.
+    '''
+
+    __tablename__ = 'result_set_parts'
+
+    result_set_id = schema.Column(
+        types.String(150),
+        schema.ForeignKey('result_sets.id', onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True,
+    )
+    part_number = schema.Column(types.Integer, primary_key=True, autoincrement=False)
+
+    timestamp_label = schema.Column(types.DateTime(timezone=True), nullable=False)
+    content_block_id = schema.Column(types.Integer, nullable=False)
+
 
 class Subscription(AbstractModel):
 
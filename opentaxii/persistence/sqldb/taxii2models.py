@@ -8,7 +8,7 @@ from sqlalchemy import literal
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
-from opentaxii.persistence.sqldb.common import GUID, UTCDateTime
+from opentaxii.persistence.sqldb.common import GUID, CompressedText, UTCDateTime
 from opentaxii.taxii2 import entities
 
 Base = declarative_base()
@@ -115,6 +115,30 @@ class JobDetail(Base):
         return cls(**entity.to_dict())
 
 
+class JobPayload(Base):
+    """Raw objects of a pending `Job`, queued for processing by a job worker."""
+
+    __tablename__ = "opentaxii_job_payload"
+
+    job_id = sqlalchemy.Column(
+        GUID,
+        sqlalchemy.ForeignKey("opentaxii_job.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    collection_id = sqlalchemy.Column(
+        GUID,
+        sqlalchemy.ForeignKey("opentaxii_collection.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    objects = sqlalchemy.Column(sqlalchemy.JSON, nullable=False)
+    processed_count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    validation_level = sqlalchemy.Column(
+        sqlalchemy.String(20), nullable=False, default="full"
+    )
+    claimed_at = sqlalchemy.Column(UTCDateTime, nullable=True, index=True)
+    attempts = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+
+
 class Collection(Base):
     """Database equivalent of `entities.Collection`."""
 
@@ -141,6 +165,22 @@ class Collection(Base):
         return cls(**entity.to_dict())
 
 
+class CollectionWatermark(Base):
+    """Database equivalent of `entities.CollectionWatermark`."""
+
+    __tablename__ = "opentaxii_collection_watermark"
+
+    collection_id = sqlalchemy.Column(
+        GUID,
+        sqlalchemy.ForeignKey("opentaxii_collection.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # latest date_added, deleting objects keeps it as is
+    date_added = sqlalchemy.Column(UTCDateTime, nullable=True)
+    count = sqlalchemy.Column(sqlalchemy.Integer, nullable=False, default=0)
+    sequence = sqlalchemy.Column(sqlalchemy.BigInteger, nullable=False, default=0)
+
+
 class STIXObject(Base):
     """Database equivalent of `entities.STIXObject`."""
 
@@ -158,6 +198,12 @@ class STIXObject(Base):
     date_added = sqlalchemy.Column(UTCDateTime, index=True)
     version = sqlalchemy.Column(UTCDateTime, index=True)
     serialized_data = sqlalchemy.Column(sqlalchemy.JSON)
+    # The whole object as json text, stored instead of `serialized_data`
+    # when the persistence api is configured with `raw_objects`
+    raw_data = sqlalchemy.Column(CompressedText, nullable=True)
+    # Whether this is the first/last version of the object in its collection
+    is_first = sqlalchemy.Column(sqlalchemy.Boolean, nullable=False, default=False)
+    is_latest = sqlalchemy.Column(sqlalchemy.Boolean, nullable=False, default=False)
 
     collection = relationship("Collection", back_populates="objects")
 
@@ -166,6 +212,14 @@ class STIXObject(Base):
         sqlalchemy.Index(
             "ix_opentaxii_stixobject_col_date_added_id", collection_id, date_added, id
         ),
+        sqlalchemy.Index(
+            "ix_opentaxii_stixobject_col_latest_date_added_id",
+            collection_id,
+            is_latest,
+            date_added,
+            id,
+        ),
+        sqlalchemy.Index("ix_opentaxii_stixobject_col_first", collection_id, is_first),
     )
 
     @classmethod
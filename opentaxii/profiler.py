@@ -0,0 +1,103 @@
+"""
+Per-request profile of database queries, with a log of requests that run
+too many queries or spend too long in the database.
+
+Enabled with the ``query_profiler`` option.
+"""
+
+import functools
+import re
+import threading
+from typing import Dict, List, Optional
+
+import structlog
+
+log = structlog.getLogger(__name__)
+
+# number of statements listed in the log of a slow request
+MAX_LOGGED_STATEMENTS = 10
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# bind parameters of the supported dialects, and literals
+_VALUE_RE = re.compile(
+    r"%\(\w+\)s|%s|(?<![:\w]):\w+|\$\d+|'(?:[^']|'')*'|(?<![\w.])-?\d+(?:\.\d+)?\b"
+)
+# lists of values, e.g. IN (?, ?, ?) or VALUES (?, ?), (?, ?)
+_VALUE_LIST_RE = re.compile(r"\(\?(?:, \?)+\)")
+_VALUE_LISTS_RE = re.compile(r"\(\.\.\.\)(?:, \(\.\.\.\))+")
+
+_request = threading.local()
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(statement: str) -> str:
+    """
+    Normalize ``statement`` so that queries that only differ in their values
+    are the same.
+
+    Bind parameters and literals become ``?``, lists of values become
+    ``(...)`` and whitespace is collapsed.
+    """
+    normalized = _WHITESPACE_RE.sub(" ", statement).strip()
+    normalized = _VALUE_RE.sub("?", normalized)
+    normalized = _VALUE_LIST_RE.sub("(...)", normalized)
+    return _VALUE_LISTS_RE.sub("(...)", normalized)
+
+
+def start_request() -> None:
+    """Start profiling the request handled by the current thread."""
+    _request.statements = {}
+
+
+def record_query(statement: str, duration: float) -> None:
+    """Add a query of ``duration`` seconds to the current request profile."""
+    statements: Optional[Dict[str, List[float]]] = getattr(_request, "statements", None)
+    if statements is None:
+        return
+    entry = statements.setdefault(normalize_sql(statement), [0, 0.0])
+    entry[0] += 1
+    entry[1] += duration
+
+
+def finish_request(
+    handler: str,
+    method: str,
+    max_queries: Optional[int] = None,
+    max_duration_ms: Optional[float] = None,
+) -> None:
+    """
+    Stop profiling the request handled by the current thread.
+
+    Logs a ``request.slow_queries`` warning with the most frequent
+    statements if the request ran more than ``max_queries`` queries, or
+    spent more than ``max_duration_ms`` milliseconds running them.
+    """
+    statements: Optional[Dict[str, List[float]]] = getattr(_request, "statements", None)
+    if statements is None:
+        return
+    _request.statements = None
+    queries = sum(int(count) for count, _ in statements.values())
+    duration_ms = sum(duration for _, duration in statements.values()) * 1000
+    if not (
+        (max_queries is not None and queries > max_queries)
+        or (max_duration_ms is not None and duration_ms > max_duration_ms)
+    ):
+        return
+    slowest = sorted(
+        statements.items(), key=lambda item: (item[1][0], item[1][1]), reverse=True
+    )
+    log.warning(
+        "request.slow_queries",
+        handler=handler,
+        method=method,
+        queries=queries,
+        duration_ms=round(duration_ms, 3),
+        statements=[
+            {
+                "sql": sql,
+                "count": int(count),
+                "duration_ms": round(duration * 1000, 3),
+            }
+            for sql, (count, duration) in slowest[:MAX_LOGGED_STATEMENTS]
+        ],
+    )
@@ -1,14 +1,26 @@
 import functools
 import importlib
-import json
+import threading
+import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 
 try:
     from re import Pattern
 except ImportError:
     from typing.re import Pattern  # type: ignore[no-redef]
 
-from typing import ClassVar, NamedTuple, Optional, Protocol, Tuple, Type, Union
+from typing import (
+    ClassVar,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Tuple,
+    Type,
+    Union,
+)
 
 import structlog
 from flask import Flask, Response, request
@@ -21,6 +33,7 @@ from werkzeug.exceptions import (
     Unauthorized,
     UnsupportedMediaType,
 )
+from werkzeug.http import http_date, is_resource_modified, quote_etag
 
 from opentaxii.persistence.exceptions import (
     DoesNotExistError,
@@ -30,13 +43,16 @@ from opentaxii.persistence.exceptions import (
 )
 from opentaxii.taxii2.utils import taxii2_datetimeformat
 from opentaxii.taxii2.validation import (
+    VALIDATION_FULL,
+    VALIDATION_LEVELS,
     validate_delete_filter_params,
     validate_envelope,
     validate_list_filter_params,
+    validate_object,
     validate_object_filter_params,
     validate_versions_filter_params,
 )
-from opentaxii.utils import register_handler
+from opentaxii.utils import EndpointRouter, register_handler
 
 from .auth import AuthManager
 from .config import ServerConfig
@@ -44,7 +60,16 @@ from .entities import Account
 from .exceptions import UnauthorizedException
 from .local import context
 from .persistence import Taxii1PersistenceManager, Taxii2PersistenceManager
-from .taxii2.http import make_taxii2_response
+from .taxii2.entities import STIXObject
+from .taxii2.http import (
+    RawJson,
+    configure_json_codec,
+    get_json_codec,
+    make_taxii2_list_response,
+    make_taxii2_response,
+    make_taxii2_stream_response,
+    read_request_body,
+)
 from .taxii.bindings import ALL_PROTOCOL_BINDINGS, MESSAGE_BINDINGS, SERVICE_BINDINGS
 from .taxii.exceptions import FailureStatus, StatusMessageException, raise_failure
 from .taxii.http import (
@@ -93,6 +118,8 @@ class Endpoint(Protocol):
 
     func: EndpointFunc
     server: "BaseTAXIIServer"
+    # label of the request metrics
+    handler_name: str
 
     def __call__(self) -> Response: ...
 
@@ -103,6 +130,7 @@ class BaseTAXIIServer:
     """
 
     ENDPOINT_MAPPING: Tuple[Tuple[Pattern, EndpointFunc], ...]
+    endpoint_router: EndpointRouter
     app: Flask
     config: dict
     persistence: Union[Taxii1PersistenceManager, Taxii2PersistenceManager]
@@ -115,6 +143,7 @@ class BaseTAXIIServer:
                 mapping.append((attr.registered_url_re, attr))
         if mapping:
             self.ENDPOINT_MAPPING = tuple(mapping)
+            self.endpoint_router = EndpointRouter(self.ENDPOINT_MAPPING)
 
     def init_app(self, app: Flask):
         """Connect server and persistence to flask."""
@@ -165,7 +194,9 @@ class TAXII1Server(BaseTAXIIServer):
     """TAXII1 Server class.
 
     This class keeps Presistence API manager instance for TAXII1
-    and creates TAXII1 Service instances on request.
+    and creates TAXII1 Service instances on request. Created services
+    are kept for ``services_cache_ttl`` seconds, or until services are
+    changed through the Persistence API manager.
 
     :param dict config:
         OpenTAXII1 server configuration
@@ -181,6 +212,11 @@ class TAXII1Server(BaseTAXIIServer):
 
     def __init__(self, config: dict):
         self.config = config
+        # (expiry time, services, services by path)
+        self._services_cache: Optional[
+            Tuple[float, List[TAXIIService], Dict[str, TAXIIService]]
+        ] = None
+        self._services_generation = 0
         self.persistence = Taxii1PersistenceManager(
             server=self, api=initialize_api(config["persistence_api"])
         )
@@ -232,14 +268,42 @@ class TAXII1Server(BaseTAXIIServer):
 
     def get_endpoint(self, relative_path: str) -> Optional[Endpoint]:
         """Get first endpoint matching relative_path."""
-        for endpoint in self.get_services():
-            if endpoint.path == relative_path:
-                return functools.partial(  # type: ignore[return-value]
-                    self.handle_request, endpoint=endpoint
-                )
+        _, services_by_path = self._get_cached_services()
+        endpoint = services_by_path.get(relative_path)
+        if endpoint is not None:
+            partial = functools.partial(self.handle_request, endpoint=endpoint)
+            partial.handler_name = endpoint.id  # type: ignore[attr-defined]
+            return partial  # type: ignore[return-value]
 
         return None
 
+    def invalidate_services(self):
+        """Drop cached services, so that they are recreated on next use."""
+        self._services_generation += 1
+        self._services_cache = None
+
+    def _get_cached_services(
+        self,
+    ) -> Tuple[List[TAXIIService], Dict[str, TAXIIService]]:
+        cache = self._services_cache
+        if cache is None or cache[0] <= time.monotonic():
+            generation = self._services_generation
+            ttl = self.config.get("services_cache_ttl") or 0
+
+            # Services needs to be created all at once to ensure that
+            # discovery services list all active advertised services
+            services = self._create_services(self.persistence.get_services())
+            services_by_path: Dict[str, TAXIIService] = {}
+            for service in services:
+                if service.path is not None:
+                    services_by_path.setdefault(service.path, service)
+            cache = (time.monotonic() + ttl, services, services_by_path)
+
+            # do not store services loaded before a concurrent invalidation
+            if ttl > 0 and generation == self._services_generation:
+                self._services_cache = cache
+        return cache[1], cache[2]
+
     def get_domain(self, service_id):
         """Get domain either from request handler or config."""
         dynamic_domain = self.persistence.get_domain(service_id)
@@ -260,11 +324,7 @@ class TAXII1Server(BaseTAXIIServer):
         if service_ids is not None and not service_ids:
             return []
 
-        service_entities = self.persistence.get_services()
-
-        # Services needs to be created all at once to ensure that
-        # discovery services list all active advertised services
-        services = self._create_services(service_entities)
+        services, _ = self._get_cached_services()
 
         if service_ids:
             services = [service for service in services if service.id in service_ids]
@@ -440,13 +500,99 @@ class TAXII2Server(BaseTAXIIServer):
             server=self, api=initialize_api(config["persistence_api"])
         )
         self.setup_endpoint_mapping()
+        configure_json_codec(config.get("json_codec"))
+        self._validation_executor: Optional[ProcessPoolExecutor] = None
+        self._validation_executor_lock = threading.Lock()
+        self._check_validation_level_config()
+
+    def _check_validation_level_config(self):
+        config = self.config.get("validation_level") or VALIDATION_FULL
+        if isinstance(config, str):
+            levels = [config]
+        else:
+            levels = [
+                config.get("default") or VALIDATION_FULL,
+                *(config.get("collections") or {}).values(),
+                *(config.get("accounts") or {}).values(),
+            ]
+        for level in levels:
+            if level not in VALIDATION_LEVELS:
+                raise ValueError(
+                    f"invalid validation_level {level!r}, "
+                    f"must be one of {VALIDATION_LEVELS}"
+                )
+
+    def get_validation_level(
+        self, api_root_id: uuid.UUID, collection_id_or_alias: str
+    ) -> str:
+        """
+        Get the level to validate objects posted to a collection with.
+
+        ``validation_level`` is either a level for all collections, or a
+        mapping with levels per collection (id or alias) and per account
+        (username) and a ``default``. If both the collection and the current
+        account have a level, the strictest one is used.
+        """
+        config = self.config.get("validation_level") or VALIDATION_FULL
+        if isinstance(config, str):
+            return config
+        levels = []
+        collection_levels = config.get("collections") or {}
+        if collection_levels:
+            collection = self.persistence.get_collection(
+                api_root_id=api_root_id, collection_id_or_alias=collection_id_or_alias
+            )
+            for key in (str(collection.id), collection.alias):
+                if key in collection_levels:
+                    levels.append(collection_levels[key])
+                    break
+        account_levels = config.get("accounts") or {}
+        if context.account is not None and context.account.username in account_levels:
+            levels.append(account_levels[context.account.username])
+        if not levels:
+            return config.get("default") or VALIDATION_FULL
+        return min(levels, key=VALIDATION_LEVELS.index)
+
+    def get_validation_executor(self) -> Optional[ProcessPoolExecutor]:
+        """
+        Get the process pool to validate large envelopes in.
+
+        The pool is created on first use, so that it is not inherited by
+        forked server workers. Returns `None` if ``validation_processes`` is
+        not configured.
+        """
+        processes = self.config.get("validation_processes") or 0
+        if processes < 1:
+            return None
+        if self._validation_executor is None:
+            with self._validation_executor_lock:
+                if self._validation_executor is None:
+                    self._validation_executor = ProcessPoolExecutor(
+                        max_workers=processes
+                    )
+        return self._validation_executor
+
+    def process_pending_job(self) -> Optional[uuid.UUID]:
+        """
+        Process one job queued by an object POST in ``async_jobs`` mode.
+
+        :return: id of the processed job, or `None` if there was no work
+        """
+        return self.persistence.process_pending_job(
+            functools.partial(
+                validate_object,
+                allow_custom=self.config.get("allow_custom_properties", True),
+            ),
+            batch_size=self.config.get("job_batch_size", 1000),
+            max_attempts=self.config.get("job_max_attempts", 3),
+        )
 
     def handle_http_exception(self, error):
         """Return JSON instead of HTML for HTTP errors."""
         # start with the correct headers and status code from the error
         response = error.get_response()
         # replace the body with JSON
-        response.data = json.dumps(
+        response.data = get_json_codec().dumps(
             {
                 "code": error.code,
                 "name": error.name,
@@ -474,18 +620,16 @@ class TAXII2Server(BaseTAXIIServer):
         raise Unauthorized()
 
     def get_endpoint(self, relative_path: str) -> Optional[Endpoint]:
-        endpoint = None
-        for regex, handler in self.ENDPOINT_MAPPING:
-            match = regex.match(relative_path)
-            if match:
-                endpoint = functools.partial(handler, **match.groupdict())
-                break
-        if endpoint:
-            return functools.partial(  # type: ignore[return-value]
-                self.handle_request, endpoint  # type: ignore[arg-type]
-            )
-
-        return None
+        match = self.endpoint_router.match(relative_path)
+        if match is None:
+            return None
+        handler, kwargs = match
+        endpoint = functools.partial(handler, **kwargs)
+        partial = functools.partial(
+            self.handle_request, endpoint  # type: ignore[arg-type]
+        )
+        partial.handler_name = handler.__name__  # type: ignore[attr-defined]
+        return partial  # type: ignore[return-value]
 
     def check_authentication(self, endpoint: Endpoint):
         """Check if account is authenticated, unless endpoint handles that itself."""
@@ -495,14 +639,54 @@ class TAXII2Server(BaseTAXIIServer):
         if context.account is None:
             raise Unauthorized()
 
+    def get_collection_validators(
+        self, api_root_id: uuid.UUID, collection_id_or_alias: str
+    ) -> Dict[str, str]:
+        """
+        Get the ``ETag`` and ``Last-Modified`` headers of the objects in a collection.
+
+        Get these before reading the objects: a concurrent change then leaves
+        the headers behind the response, so the next request is not answered
+        with 304.
+        """
+        watermark = self.persistence.get_collection_watermark(
+            api_root_id=api_root_id, collection_id_or_alias=collection_id_or_alias
+        )
+        if watermark is None:
+            return {}
+        headers = {"ETag": quote_etag(watermark.etag, weak=True)}
+        if watermark.date_added is not None:
+            headers["Last-Modified"] = http_date(watermark.date_added)
+        return headers
+
+    @staticmethod
+    def is_not_modified(validators: Dict[str, str]) -> bool:
+        """
+        Check if ``If-None-Match`` matches the ``ETag`` of ``validators``.
+
+        ``If-Modified-Since`` is ignored: ``Last-Modified`` has a resolution of
+        one second and does not change when objects are deleted.
+        """
+        if not validators:
+            return False
+        return not is_resource_modified(request.environ, etag=validators["ETag"])
+
     def check_content_length(self):
-        if (request.content_length or 0) > self.config["max_content_length"] or len(
-            request.data
-        ) > self.config[
-            "max_content_length"
-        ]:  # untestable with flask
+        if (request.content_length or 0) > self.config["max_content_length"]:
             raise RequestEntityTooLarge()
 
+    def get_request_body(self) -> bytearray:
+        """
+        Read the request body, raising 413 as soon as it exceeds ``max_content_length``.
+
+        The body is read from the wsgi input once and not kept in ``request.data``.
+        """
+        return read_request_body(
+            request.stream,
+            self.config["max_content_length"],
+            content_length=request.content_length,
+        )
+
     def check_headers(self, endpoint: Endpoint):
         if not any(
             [
@@ -616,7 +800,9 @@ class TAXII2Server(BaseTAXIIServer):
                     if value:
                         data[key] = value
                 response["collections"].append(data)
-        return make_taxii2_response(response)
+        conditional_response = make_taxii2_response(response)
+        conditional_response.add_etag(weak=True)
+        return conditional_response.make_conditional(request)
 
     @register_handler(
         r"^/taxii2/(?P<api_root_id>[^/]+)"
@@ -649,7 +835,9 @@ class TAXII2Server(BaseTAXIIServer):
             value = getattr(collection, key, None)
             if value:
                 response[key] = value
-        return make_taxii2_response(response)
+        conditional_response = make_taxii2_response(response)
+        conditional_response.add_etag(weak=True)
+        return conditional_response.make_conditional(request)
 
     @register_handler(
         r"^/taxii2/(?P<api_root_id>[^/]+)"
@@ -659,6 +847,11 @@ class TAXII2Server(BaseTAXIIServer):
     def manifest_handler(self, api_root_id: str, collection_id_or_alias: str):
         filter_params = validate_list_filter_params(request.args, self.persistence.api)
         try:
+            validators = self.get_collection_validators(
+                uuid.UUID(api_root_id), collection_id_or_alias
+            )
+            if self.is_not_modified(validators):
+                return make_taxii2_response("", 304, extra_headers=validators)
             manifest, more = self.persistence.get_manifest(
                 api_root_id=uuid.UUID(api_root_id),
                 collection_id_or_alias=collection_id_or_alias,
@@ -683,6 +876,7 @@ class TAXII2Server(BaseTAXIIServer):
                 ],
             }
             headers = {
+                **validators,
                 "X-TAXII-Date-Added-First": min(
                     obj["date_added"] for obj in response["objects"]
                 ),
@@ -692,7 +886,7 @@ class TAXII2Server(BaseTAXIIServer):
             }
         else:
             response = {}
-            headers = {}
+            headers = validators
         return make_taxii2_response(
             response,
             extra_headers=headers,
@@ -712,9 +906,23 @@ class TAXII2Server(BaseTAXIIServer):
         if request.method == "POST":
             return self.objects_post_handler(api_root_uuid, collection_id_or_alias)
 
+    @staticmethod
+    def _stix_object_json(obj: STIXObject) -> Union[Dict, RawJson]:
+        """Get the response json of ``obj``, as stored if it is stored raw."""
+        if obj.raw_data is not None:
+            return RawJson(obj.raw_data.encode("utf-8"))
+        return obj.as_taxii2_dict()
+
     def objects_get_handler(self, api_root_id: uuid.UUID, collection_id_or_alias: str):
+        if self.config.get("stream_objects", False):
+            return self.objects_get_stream_handler(api_root_id, collection_id_or_alias)
         filter_params = validate_list_filter_params(request.args, self.persistence.api)
         try:
+            validators = self.get_collection_validators(
+                api_root_id, collection_id_or_alias
+            )
+            if self.is_not_modified(validators):
+                return make_taxii2_response("", 304, extra_headers=validators)
             objects, more, next_param = self.persistence.get_objects(
                 api_root_id=api_root_id,
                 collection_id_or_alias=collection_id_or_alias,
@@ -725,19 +933,9 @@ class TAXII2Server(BaseTAXIIServer):
                 raise Unauthorized()
             raise NotFound()
         if objects:
-            response = {
-                "more": more,
-                "objects": [
-                    {
-                        "id": obj.id,
-                        "type": obj.type,
-                        "spec_version": obj.spec_version,
-                        **obj.serialized_data,
-                    }
-                    for obj in objects
-                ],
-            }
+            response: Dict = {"more": more}
             headers = {
+                **validators,
                 "X-TAXII-Date-Added-First": taxii2_datetimeformat(
                     min(obj.date_added for obj in objects)
                 ),
@@ -747,24 +945,84 @@ class TAXII2Server(BaseTAXIIServer):
             }
             if more:
                 response["next"] = next_param
-        else:
-            response = {}
-            headers = {}
-        return make_taxii2_response(
+            return make_taxii2_list_response(
+                response,
+                "objects",
+                [self._stix_object_json(obj) for obj in objects],
+                extra_headers=headers,
+            )
+        return make_taxii2_response({}, extra_headers=validators)
+
+    def objects_get_stream_handler(
+        self, api_root_id: uuid.UUID, collection_id_or_alias: str
+    ):
+        filter_params = validate_list_filter_params(request.args, self.persistence.api)
+        try:
+            validators = self.get_collection_validators(
+                api_root_id, collection_id_or_alias
+            )
+            if self.is_not_modified(validators):
+                return make_taxii2_response("", 304, extra_headers=validators)
+            (
+                objects,
+                more,
+                next_param,
+                date_added_first,
+                date_added_last,
+            ) = self.persistence.stream_objects(
+                api_root_id=api_root_id,
+                collection_id_or_alias=collection_id_or_alias,
+                **filter_params,
+            )
+        except (DoesNotExistError, NoReadPermission):
+            if context.account is None:
+                raise Unauthorized()
+            raise NotFound()
+        if date_added_first is None:
+            return make_taxii2_response({}, extra_headers=validators)
+        response = {"more": more}
+        if more:
+            response["next"] = next_param
+        return make_taxii2_stream_response(
             response,
-            extra_headers=headers,
+            "objects",
+            (self._stix_object_json(obj) for obj in objects),
+            extra_headers={
+                **validators,
+                "X-TAXII-Date-Added-First": taxii2_datetimeformat(date_added_first),
+                "X-TAXII-Date-Added-Last": taxii2_datetimeformat(date_added_last),
+            },
         )
 
     def objects_post_handler(self, api_root_id: uuid.UUID, collection_id_or_alias: str):
-        validate_envelope(
-            request.data, allow_custom=self.config.get("allow_custom_properties", True)
-        )
+        async_jobs = self.config.get("async_jobs", False)
         try:
-            job = self.persistence.add_objects(
-                api_root_id=api_root_id,
-                collection_id_or_alias=collection_id_or_alias,
-                data=request.get_json(),
+            validation_level = self.get_validation_level(
+                api_root_id, collection_id_or_alias
             )
+            envelope = validate_envelope(
+                self.get_request_body(),
+                allow_custom=self.config.get("allow_custom_properties", True),
+                validate_objects=not async_jobs,
+                executor=self.get_validation_executor(),
+                parallel_threshold=self.config.get(
+                    "validation_parallel_threshold", 1000
+                ),
+                level=validation_level,
+            )
+            if async_jobs:
+                job = self.persistence.add_pending_objects(
+                    api_root_id=api_root_id,
+                    collection_id_or_alias=collection_id_or_alias,
+                    data=envelope,
+                    validation_level=validation_level,
+                )
+            else:
+                job = self.persistence.add_objects(
+                    api_root_id=api_root_id,
+                    collection_id_or_alias=collection_id_or_alias,
+                    data=envelope,
+                )
         except (DoesNotExistError, NoWritePermission):
             if context.account is None:
                 raise Unauthorized()
@@ -815,18 +1073,7 @@ class TAXII2Server(BaseTAXIIServer):
                 raise Unauthorized()
             raise NotFound()
         if versions:
-            response = {
-                "more": more,
-                "objects": [
-                    {
-                        "id": obj.id,
-                        "type": obj.type,
-                        "spec_version": obj.spec_version,
-                        **obj.serialized_data,
-                    }
-                    for obj in versions
-                ],
-            }
+            response: Dict = {"more": more}
             headers = {
                 "X-TAXII-Date-Added-First": taxii2_datetimeformat(
                     min(obj.date_added for obj in versions)
@@ -837,13 +1084,13 @@ class TAXII2Server(BaseTAXIIServer):
             }
             if more:
                 response["next"] = next_param
-        else:
-            response = {}
-            headers = {}
-        return make_taxii2_response(
-            response,
-            extra_headers=headers,
-        )
+            return make_taxii2_list_response(
+                response,
+                "objects",
+                [self._stix_object_json(obj) for obj in versions],
+                extra_headers=headers,
+            )
+        return make_taxii2_response({})
 
     def object_delete_handler(
         self, api_root_id: uuid.UUID, collection_id_or_alias: str, object_id: str
@@ -996,6 +1243,7 @@ class TAXIIServer:
         if not endpoint:
             raise NotFound()
         context.taxiiserver = endpoint.server
+        context.endpoint = endpoint
         return endpoint()
 
     def handle_internal_error(self, error):
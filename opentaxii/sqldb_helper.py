@@ -1,7 +1,39 @@
+import contextlib
+import itertools
+import threading
+import time
 from threading import get_ident
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
-from sqlalchemy import engine, orm
+import structlog
+from sqlalchemy import engine, event, orm
 from sqlalchemy.orm.exc import UnmappedClassError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+
+from opentaxii import metrics, profiler
+
+log = structlog.getLogger(__name__)
+
+# statements that set the statement timeout of a connection, in milliseconds
+STATEMENT_TIMEOUT_STATEMENTS = {
+    'postgresql': 'SET statement_timeout = %d',
+    'mysql': 'SET SESSION max_execution_time = %d',
+}
+# options of the ``pool`` parameter and their ``create_engine`` arguments
+POOL_OPTIONS = {
+    'size': 'pool_size',
+    'max_overflow': 'max_overflow',
+    'timeout': 'pool_timeout',
+    'recycle': 'pool_recycle',
+    'pre_ping': 'pool_pre_ping',
+}
+# options that only queue pools support
+QUEUE_POOL_OPTIONS = ('size', 'max_overflow', 'timeout')
+
+_engines: Dict[Tuple, engine.Engine] = {}
+_engines_lock = threading.Lock()
+_saturated_checkouts: Dict[engine.Engine, int] = {}
 
 
 class _QueryProperty:
@@ -17,15 +49,66 @@ class _QueryProperty:
             return None
 
 
+class RoutingSession(orm.Session):
+    '''
+    Session that sends SELECT statements to the replica chosen with
+    :meth:`SQLAlchemyDB.read_from`, and everything else to the primary.
+    '''
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        replica = self.info['db'].get_read_bind()
+        if (
+            replica is not None
+            and not self._flushing
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        ):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
 class SQLAlchemyDB:
     '''
     Simple SQLAlchemy helper inspired by Flask-SQLAlchemy code.
 
     Allows the code to use a session bind to Flask context.
+
+    With ``replica_connections``, reads wrapped in :meth:`read_from` go to a
+    replica. The replica is picked round-robin and kept for the rest of the
+    session, so that all reads of a request see the same replica. Replicas
+    that fail are skipped for ``replica_retry_secs``.
     '''
 
-    def __init__(self, db_connection, base_model, session_options=None, **kwargs):
-        self.engine = engine.create_engine(db_connection, **kwargs)
+    def __init__(
+        self,
+        db_connection,
+        base_model,
+        session_options=None,
+        pool=None,
+        statement_timeout_secs=None,
+        replica_connections=None,
+        replica_retry_secs=30,
+        **kwargs,
+    ):
+        self.engine = get_engine(
+            db_connection,
+            pool=pool,
+            statement_timeout_secs=statement_timeout_secs,
+            **kwargs,
+        )
+        self.replicas = [
+            get_engine(
+                replica_connection,
+                pool=pool,
+                statement_timeout_secs=statement_timeout_secs,
+                **kwargs,
+            )
+            for replica_connection in replica_connections or []
+        ]
+        self.replica_retry_secs = replica_retry_secs
+        self._replica_counter = itertools.count()
+        self._replicas_down_until: Dict[engine.Engine, float] = {}
+        self._routing = threading.local()
         self.Query = orm.Query
         self.session_options = session_options
         self.Model = self.extend_base_model(base_model)
@@ -61,8 +144,66 @@ class SQLAlchemyDB:
             "bind": self.engine,
             **options,
         }
+        if self.replicas:
+            kwargs.update(class_=RoutingSession, info={'db': self})
         return orm.sessionmaker(**kwargs)
 
+    def choose_replica(self) -> Optional[engine.Engine]:
+        '''Get the replica to read from in the current session, if any is up.'''
+        if not self.replicas:
+            return None
+        info = self.session().info
+        replica = info.get('replica')
+        if replica is not None and self.is_replica_up(replica):
+            return replica
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._replica_counter) % len(self.replicas)]
+            if self.is_replica_up(replica):
+                info['replica'] = replica
+                return replica
+        info.pop('replica', None)
+        return None
+
+    def is_replica_up(self, replica: engine.Engine) -> bool:
+        return self._replicas_down_until.get(replica, 0) <= time.monotonic()
+
+    def mark_replica_down(self, replica: engine.Engine) -> None:
+        '''Skip ``replica`` for ``replica_retry_secs``.'''
+        self._replicas_down_until[replica] = time.monotonic() + self.replica_retry_secs
+        self.session().info.pop('replica', None)
+        log.warning(
+            'db.replica.down', replica=repr(replica.url), retry=self.replica_retry_secs
+        )
+
+    def get_read_bind(self) -> Optional[engine.Engine]:
+        '''Get the replica that SELECT statements go to, see :meth:`read_from`.'''
+        return getattr(self._routing, 'bind', None)
+
+    @contextlib.contextmanager
+    def read_from(self, replica: Optional[engine.Engine]):
+        '''Send the SELECT statements of the session to ``replica`` in this block.'''
+        previous = self.get_read_bind()
+        self._routing.bind = replica
+        try:
+            yield
+        finally:
+            self._routing.bind = previous
+
+    def iterate_from(
+        self, replica: Optional[engine.Engine], iterable: Iterable
+    ) -> Iterator:
+        '''Iterate over a lazy query result, reading it from ``replica``.'''
+        iterator = None
+        while True:
+            with self.read_from(replica):
+                if iterator is None:
+                    iterator = iter(iterable)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
     def create_all_tables(self):
         self.metadata.create_all(bind=self.engine)
 
@@ -71,3 +212,202 @@ class SQLAlchemyDB:
         def shutdown_session(response_or_exc):
             self.session.remove()
             return response_or_exc
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def get_engine(db_connection, pool=None, statement_timeout_secs=None, **kwargs):
+    """
+    Get the engine of a database, shared by all APIs that use it.
+
+    APIs connecting to the same ``db_connection`` with the same settings get
+    the same engine, so they share one connection pool.
+
+    :param db_connection: the database url
+    :param pool: pool settings, see :data:`POOL_OPTIONS`. Size, overflow and
+        timeout are ignored for databases that do not use a queue pool,
+        like sqlite.
+    :param statement_timeout_secs: cancel statements that run longer than
+        this, on postgresql and mysql
+    :param kwargs: other arguments of :func:`sqlalchemy.create_engine`
+    """
+    key = (str(db_connection), _freeze(pool), statement_timeout_secs, _freeze(kwargs))
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = _create_engine(
+                db_connection, pool or {}, statement_timeout_secs, kwargs
+            )
+        return _engines[key]
+
+
+def _create_engine(db_connection, pool_settings, statement_timeout_secs, kwargs):
+    url = engine.make_url(db_connection)
+    unknown = set(pool_settings) - set(POOL_OPTIONS)
+    if unknown:
+        raise ValueError(
+            'invalid pool options {}, must be some of {}'.format(
+                sorted(unknown), tuple(POOL_OPTIONS)
+            )
+        )
+    kwargs = dict(kwargs)
+    pool_class = kwargs.get('poolclass') or url.get_dialect().get_pool_class(url)
+    for option, value in pool_settings.items():
+        if option in QUEUE_POOL_OPTIONS and not issubclass(pool_class, QueuePool):
+            continue
+        kwargs.setdefault(POOL_OPTIONS[option], value)
+    created = engine.create_engine(url, **kwargs)
+    _saturated_checkouts[created] = 0
+    event.listen(created, 'checkout', _count_saturation(created))
+    event.listen(created, 'before_cursor_execute', _start_query)
+    event.listen(created, 'after_cursor_execute', _finish_query)
+
+    if statement_timeout_secs:
+        statement = STATEMENT_TIMEOUT_STATEMENTS.get(created.dialect.name)
+        if statement is None:
+            log.warning(
+                'db.statement_timeout.unsupported', dialect=created.dialect.name
+            )
+        else:
+            event.listen(
+                created,
+                'connect',
+                _set_statement_timeout(statement % int(statement_timeout_secs * 1000)),
+            )
+    log.info('db.engine.created', url=repr(url), pool=type(created.pool).__name__)
+    return created
+
+
+def _set_statement_timeout(statement):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+        # keep the setting when the pool rolls back the connection
+        dbapi_connection.commit()
+
+    return on_connect
+
+
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.opentaxii_query_start = time.perf_counter()
+
+
+def _finish_query(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, 'opentaxii_query_start', None)
+    if start is not None:
+        duration = time.perf_counter() - start
+        metrics.record_query(duration)
+        profiler.record_query(statement, duration)
+
+
+def _count_saturation(created):
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats = get_pool_stats(created)
+        if stats.get('max_connections') and (
+            stats['checked_out'] >= stats['max_connections']
+        ):
+            _saturated_checkouts[created] += 1
+
+    return on_checkout
+
+
+def get_pool_stats(db_engine) -> Dict[str, Optional[int]]:
+    """
+    Get the usage of the connection pool of ``db_engine``.
+
+    ``saturated_checkouts`` counts the connections handed out while the
+    pool was at ``max_connections``, where further requests have to wait.
+    """
+    engine_pool = db_engine.pool
+    stats: Dict[str, Optional[int]] = {
+        'saturated_checkouts': _saturated_checkouts.get(db_engine, 0),
+    }
+    if isinstance(engine_pool, QueuePool):
+        max_overflow = engine_pool._max_overflow
+        stats.update(
+            size=engine_pool.size(),
+            checked_in=engine_pool.checkedin(),
+            checked_out=engine_pool.checkedout(),
+            overflow=max(engine_pool.overflow(), 0),
+            max_connections=(
+                None if max_overflow < 0 else engine_pool.size() + max_overflow
+            ),
+        )
+    return stats
+
+
+def get_engines_pool_stats() -> Dict[str, Dict[str, Optional[int]]]:
+    """Get the pool usage of all shared engines, by url without password."""
+    with _engines_lock:
+        engines = list(_engines.values())
+    stats: Dict[str, Dict[str, Optional[int]]] = {}
+    for db_engine in engines:
+        name = repr(db_engine.url)
+        if name in stats:
+            # the same database with other settings
+            name = '{} ({})'.format(name, len(stats))
+        stats[name] = get_pool_stats(db_engine)
+    return stats
+
+
+@metrics.registry.collector
+def collect_pool_stats(server):
+    '''Export the pool usage of the shared engines as metrics.'''
+    pools = get_engines_pool_stats()
+    connections = []
+    max_connections = []
+    saturated = []
+    for database, stats in pools.items():
+        for state in ('checked_in', 'checked_out', 'overflow'):
+            if stats.get(state) is not None:
+                connections.append(
+                    (
+                        'opentaxii_db_pool_connections',
+                        {'database': database, 'state': state},
+                        stats[state],
+                    )
+                )
+        if stats.get('max_connections') is not None:
+            max_connections.append(
+                (
+                    'opentaxii_db_pool_max_connections',
+                    {'database': database},
+                    stats['max_connections'],
+                )
+            )
+        saturated.append(
+            (
+                'opentaxii_db_pool_saturated_checkouts_total',
+                {'database': database},
+                stats['saturated_checkouts'],
+            )
+        )
+    return [
+        (
+            'opentaxii_db_pool_connections',
+            'gauge',
+            'Connections of the database connection pools, by state.',
+            connections,
+        ),
+        (
+            'opentaxii_db_pool_max_connections',
+            'gauge',
+            'Maximum number of connections of the database connection pools.',
+            max_connections,
+        ),
+        (
+            'opentaxii_db_pool_saturated_checkouts_total',
+            'counter',
+            'Connections handed out while the pool had no connection left.',
+            saturated,
+        ),
+    ]
@@ -30,6 +30,7 @@ class InboxMessage11Handler(BaseMessageHandler):
             )
         )
 
+        blocks = []
         for content_block in request.content_blocks:
 
             is_supported = service.is_content_supported(
@@ -62,10 +63,11 @@ class InboxMessage11Handler(BaseMessageHandler):
                 continue
 
             block = content_block_to_content_block_entity(content_block, version=11)
+            blocks.append((block, correct_binding_collections))
 
-            service.server.persistence.create_content(
-                block,
-                collections=correct_binding_collections,
+        if blocks:
+            service.server.persistence.create_content_blocks(
+                blocks,
                 service_id=service.id,
                 inbox_message_id=inbox_message.id if inbox_message else None,
             )
@@ -95,6 +97,7 @@ class InboxMessage10Handler(BaseMessageHandler):
             )
         )
 
+        blocks = []
         for content_block in request.content_blocks:
             is_supported = service.is_content_supported(
                 content_block.content_binding, version=10
@@ -109,10 +112,11 @@ class InboxMessage10Handler(BaseMessageHandler):
                 continue
 
             block = content_block_to_content_block_entity(content_block, version=10)
+            blocks.append((block, collections))
 
-            service.server.persistence.create_content(
-                block,
-                collections=collections,
+        if blocks:
+            service.server.persistence.create_content_blocks(
+                blocks,
                 service_id=service.id,
                 inbox_message_id=inbox_message.id if inbox_message else None,
             )
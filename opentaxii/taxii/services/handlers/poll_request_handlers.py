@@ -163,6 +163,7 @@ class PollRequest11Handler(BaseMessageHandler):
                 timeframe=timeframe,
                 content_bindings=content_bindings,
                 part_number=result_part,
+                result_set_id=result_id,
             )
         except ResultsNotReady:
             if not allow_async:
@@ -217,6 +218,11 @@ class PollRequest11Handler(BaseMessageHandler):
             )
             result_id = result_set.id
 
+        if has_more and content_blocks:
+            service.set_result_part_start(
+                result_id, result_part + 1, content_blocks[-1]
+            )
+
         response = tm11.PollResponse(
             message_id=service.generate_id(),
             in_response_to=in_response_to,
@@ -73,10 +73,23 @@ class PollService(TAXIIService):
         )
 
     def get_content_blocks(
-        self, collection, timeframe=None, content_bindings=None, part_number=1
+        self,
+        collection,
+        timeframe=None,
+        content_bindings=None,
+        part_number=1,
+        result_set_id=None,
     ):
         start_time, end_time = timeframe or (None, None)
         offset, limit = self.get_offset_limit(part_number)
+        after = None
+        if result_set_id and part_number > 1:
+            after = self.server.persistence.get_result_set_cursor(
+                result_set_id, part_number
+            )
+            if after:
+                # seek directly to the part instead of skipping previous parts
+                offset = 0
         return self.server.persistence.get_content_blocks(
             collection_id=collection.id,
             start_time=start_time,
@@ -84,6 +97,7 @@ class PollService(TAXIIService):
             bindings=content_bindings,
             offset=offset,
             limit=limit,
+            after=after,
         )
 
     def create_result_set(self, collection, content_bindings=None, timeframe=None):
@@ -100,5 +114,13 @@ class PollService(TAXIIService):
     def get_result_set(self, result_set_id):
         return self.server.persistence.get_result_set(result_set_id)
 
+    def set_result_part_start(self, result_set_id, part_number, previous_block):
+        """Remember that result part ``part_number`` starts after ``previous_block``."""
+        self.server.persistence.set_result_set_cursor(
+            result_set_id,
+            part_number,
+            (previous_block.timestamp_label, previous_block.id),
+        )
+
     def get_subscription(self, subscription_id):
         return self.server.persistence.get_subscription(subscription_id)
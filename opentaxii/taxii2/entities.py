@@ -1,8 +1,10 @@
 """Taxii2 entities."""
 
+import hashlib
+import json
 import uuid
 from datetime import datetime
-from typing import List, NamedTuple, Optional
+from typing import Dict, List, NamedTuple, Optional
 
 from opentaxii.common.entities import Entity
 from opentaxii.entities import Account
@@ -100,7 +102,9 @@ class STIXObject(Entity):
     :param spec_version: stix version this object matches
     :param date_added: the date and time this object was added
     :param version: the version of this object
-    :param serialized_data: the payload of this object
+    :param serialized_data: the payload of this object, without ``id``,
+        ``type`` and ``spec_version``; `None` if only ``raw_data`` is stored
+    :param raw_data: the whole object serialized as json, if stored
     """
 
     def __init__(
@@ -111,7 +115,8 @@ class STIXObject(Entity):
         spec_version: str,
         date_added: datetime,
         version: datetime,
-        serialized_data: dict,
+        serialized_data: Optional[dict],
+        raw_data: Optional[str] = None,
     ):
         """Initialize STIXObject."""
         self.id = id
@@ -121,6 +126,18 @@ class STIXObject(Entity):
         self.date_added = date_added
         self.version = version
         self.serialized_data = serialized_data
+        self.raw_data = raw_data
+
+    def as_taxii2_dict(self) -> Dict:
+        """Turn this object into a stix2 object dict."""
+        if self.raw_data is not None:
+            return json.loads(self.raw_data)
+        return {
+            "id": self.id,
+            "type": self.type,
+            "spec_version": self.spec_version,
+            **self.serialized_data,
+        }
 
 
 class ManifestRecord(Entity):
@@ -169,6 +186,42 @@ class VersionRecord(Entity):
         self.version = version
 
 
+class CollectionWatermark(Entity):
+    """
+    TAXII2 CollectionWatermark entity.
+
+    Summarizes the objects of a collection, to find out if they changed
+    without reading them.
+
+    :param collection_id: id of the collection
+    :param date_added: the latest date and time an object was added,
+        `None` for an empty collection
+    :param count: number of object versions in the collection
+    :param sequence: number that increases with every change of the
+        objects, `None` if not tracked
+    """
+
+    def __init__(
+        self,
+        collection_id: uuid.UUID,
+        date_added: Optional[datetime],
+        count: int,
+        sequence: Optional[int] = None,
+    ):
+        """Initialize CollectionWatermark."""
+        self.collection_id = collection_id
+        self.date_added = date_added
+        self.count = count
+        self.sequence = sequence
+
+    @property
+    def etag(self) -> str:
+        """Opaque tag that changes whenever objects are added or deleted."""
+        date_added = taxii2_datetimeformat(self.date_added) if self.date_added else ""
+        key = f"{self.collection_id}:{date_added}:{self.count}:{self.sequence}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
 class JobDetail(Entity):
     """
     TAXII2 JobDetail entity, part of "status resource" in taxii2 docs.
@@ -283,3 +336,33 @@ class Job(Entity):
                 job_detail.as_taxii2_dict() for job_detail in self.details.pending
             ]
         return response
+
+
+class PendingJob(Entity):
+    """
+    TAXII2 PendingJob entity, the queued work of a :class:`Job`.
+
+    :param id: id of the :class:`Job` this work belongs to
+    :param collection_id: id of the :class:`Collection` to add the objects to
+    :param objects: the stix objects as posted in the envelope
+    :param processed_count: the number of objects already processed
+    :param validation_level: the level to validate the objects with
+    :param attempts: the number of times the job was claimed, this one included
+    """
+
+    def __init__(
+        self,
+        id: uuid.UUID,
+        collection_id: uuid.UUID,
+        objects: List[Dict],
+        processed_count: int = 0,
+        validation_level: str = "full",
+        attempts: int = 1,
+    ):
+        """Initialize PendingJob."""
+        self.id = id
+        self.collection_id = collection_id
+        self.objects = objects
+        self.processed_count = processed_count
+        self.validation_level = validation_level
+        self.attempts = attempts
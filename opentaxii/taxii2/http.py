@@ -1,26 +1,224 @@
 """Taxii2 http helper functions."""
 
+import datetime
+import importlib
 import json
 import uuid
-from typing import Dict, Optional
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Union
 
-from flask import Response, make_response
+from flask import Response, make_response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from opentaxii.taxii2.utils import taxii2_datetimeformat
+
+READ_CHUNK_SIZE = 64 * 1024
 
 
 class UuidJsonEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, uuid.UUID):
             return str(obj)
+        if isinstance(obj, datetime.datetime):
+            return taxii2_datetimeformat(obj)
         return super().default(obj)
 
 
+def _encode_default(obj):
+    """Serialize values the json libraries do not handle the taxii2 way."""
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, datetime.datetime):
+        return taxii2_datetimeformat(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JsonCodec:
+    """
+    Json codec for taxii2 request and response bodies, using :mod:`json`.
+
+    Codecs serialize :class:`uuid.UUID` and :class:`datetime.datetime`
+    values as taxii2 strings. Decoding errors are :class:`ValueError`.
+    """
+
+    name = "json"
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, cls=UuidJsonEncoder).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes, bytearray]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """Json codec using `orjson <https://github.com/ijl/orjson>`_."""
+
+    name = "orjson"
+
+    def __init__(self):
+        self.orjson = importlib.import_module("orjson")
+
+    def dumps(self, data: Any) -> bytes:
+        return self.orjson.dumps(
+            data,
+            default=_encode_default,
+            option=self.orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+
+    def loads(self, data: Union[str, bytes, bytearray]) -> Any:
+        return self.orjson.loads(data)
+
+
+class UjsonCodec(JsonCodec):
+    """Json codec using `ujson <https://github.com/ultrajson/ultrajson>`_."""
+
+    name = "ujson"
+
+    def __init__(self):
+        self.ujson = importlib.import_module("ujson")
+
+    def dumps(self, data: Any) -> bytes:
+        return self.ujson.dumps(
+            data, default=_encode_default, escape_forward_slashes=False
+        ).encode("utf-8")
+
+    def loads(self, data: Union[str, bytes, bytearray]) -> Any:
+        if isinstance(data, bytearray):
+            data = bytes(data)
+        return self.ujson.loads(data)
+
+
+def read_request_body(
+    stream: IO[bytes], max_length: int, content_length: Optional[int] = None
+) -> bytearray:
+    """
+    Read a request body from ``stream``, without reading past ``max_length``.
+
+    The body is read in chunks into a single buffer, which the json codecs
+    parse as is.
+
+    :param stream: the request body stream
+    :param max_length: the maximum size of the body in bytes
+    :param content_length: the announced size of the body, if known
+
+    :raises RequestEntityTooLarge: if the body is larger than ``max_length``
+    """
+    if content_length is not None and content_length > max_length:
+        raise RequestEntityTooLarge()
+    body = bytearray()
+    while True:
+        chunk = stream.read(min(READ_CHUNK_SIZE, max_length + 1 - len(body)))
+        if not chunk:
+            return body
+        body += chunk
+        if len(body) > max_length:
+            raise RequestEntityTooLarge()
+
+
+JSON_CODECS = {codec.name: codec for codec in (JsonCodec, OrjsonCodec, UjsonCodec)}
+
+_json_codec: JsonCodec = JsonCodec()
+
+
+def configure_json_codec(name: Optional[str] = None) -> JsonCodec:
+    """
+    Set the json codec used for taxii2 request and response bodies.
+
+    :param name: one of :data:`JSON_CODECS`, or ``auto`` to use the fastest
+        installed codec; defaults to ``json``
+
+    :return: the configured codec
+    """
+    global _json_codec
+    name = name or JsonCodec.name
+    if name == "auto":
+        for codec_class in (OrjsonCodec, UjsonCodec, JsonCodec):
+            try:
+                _json_codec = codec_class()
+            except ImportError:
+                continue
+            return _json_codec
+    if name not in JSON_CODECS:
+        raise ValueError(
+            f"invalid json_codec {name!r}, must be 'auto' or one of {tuple(JSON_CODECS)}"
+        )
+    _json_codec = JSON_CODECS[name]()
+    return _json_codec
+
+
+def get_json_codec() -> JsonCodec:
+    """Get the json codec configured with :func:`configure_json_codec`."""
+    return _json_codec
+
+
+class RawJson(bytes):
+    """Serialized json value, written into responses as is."""
+
+
+def _encode_list_member(
+    codec: JsonCodec, data: Dict, key: str, items: Iterable
+) -> Iterator[bytes]:
+    """
+    Serialize ``data`` with ``items`` as the list under ``key`` piece by piece.
+
+    Items that are :class:`RawJson` are not serialized again.
+    """
+    head = codec.dumps(data)[:-1]
+    yield head + (b", " if data else b"") + codec.dumps(key) + b": ["
+    separator = b""
+    for item in items:
+        yield separator + (item if isinstance(item, RawJson) else codec.dumps(item))
+        separator = b", "
+    yield b"]}"
+
+
 def make_taxii2_response(
     data, status: Optional[int] = 200, extra_headers: Optional[Dict] = None
 ) -> Response:
     """Turn input data into valid taxii2 response."""
-    if not isinstance(data, str):
-        data = json.dumps(data, cls=UuidJsonEncoder)
+    if not isinstance(data, (str, bytes)):
+        data = _json_codec.dumps(data)
     response = make_response((data, status))
     response.content_type = "application/taxii+json;version=2.1"
     response.headers.update(extra_headers or {})
     return response
+
+
+def make_taxii2_list_response(
+    data: Dict,
+    list_key: str,
+    items: Iterable,
+    status: Optional[int] = 200,
+    extra_headers: Optional[Dict] = None,
+) -> Response:
+    """
+    Turn input data into valid taxii2 response.
+
+    The ``items`` are serialized as the list under ``list_key``, after the
+    other members of ``data``. Items can be :class:`RawJson`.
+    """
+    return make_taxii2_response(
+        b"".join(_encode_list_member(_json_codec, data, list_key, items)),
+        status=status,
+        extra_headers=extra_headers,
+    )
+
+
+def make_taxii2_stream_response(
+    data: Dict,
+    stream_key: str,
+    stream: Iterable,
+    status: Optional[int] = 200,
+    extra_headers: Optional[Dict] = None,
+) -> Response:
+    """
+    Turn input data into streamed taxii2 response.
+
+    The items of ``stream`` are serialized one by one as the list under
+    ``stream_key``, after the other members of ``data``. Items can be
+    :class:`RawJson`.
+    """
+    generate = _encode_list_member(_json_codec, data, stream_key, stream)
+    response = Response(stream_with_context(generate), status=status)
+    response.content_type = "application/taxii+json;version=2.1"
+    response.headers.update(extra_headers or {})
+    return response
@@ -45,3 +45,16 @@ def get_object_version(obj: dict) -> datetime.datetime:
         )
     else:
         return datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
+
+
+def get_failed_object_version(obj: dict) -> datetime.datetime:
+    """
+    Best-effort version of an object that failed validation.
+
+    Same as :func:`get_object_version`, but falls back to
+    1970-01-01T00:00:00+00:00 when the version fields are malformed.
+    """
+    try:
+        return get_object_version(obj)
+    except (TypeError, ValueError):
+        return datetime.datetime.fromtimestamp(0, tz=datetime.timezone.utc)
@@ -2,7 +2,11 @@
 
 import datetime
 import json
-from typing import Mapping, Union
+import re
+import uuid
+from concurrent.futures import Executor
+from itertools import repeat
+from typing import Dict, List, Mapping, Optional, Union
 
 from marshmallow import Schema, fields
 from stix2 import parse
@@ -10,31 +14,187 @@ from stix2.exceptions import STIXError
 
 from opentaxii.persistence.api import OpenTAXII2PersistenceAPI
 from opentaxii.taxii2.exceptions import ValidationError
+from opentaxii.taxii2.http import get_json_codec
 from opentaxii.taxii2.utils import DATETIMEFORMAT
 
+# number of objects validated per process pool task
+PARALLEL_CHUNK_SIZE = 250
 
-def validate_envelope(json_data: Union[str, bytes], allow_custom: bool = False) -> None:
+VALIDATION_FULL = "full"
+VALIDATION_STRUCTURAL = "structural"
+VALIDATION_NONE = "none"
+# ordered from strictest to most lenient
+VALIDATION_LEVELS = (VALIDATION_FULL, VALIDATION_STRUCTURAL, VALIDATION_NONE)
+
+STIX_TYPE_RE = re.compile(r"^[a-z0-9][a-z0-9-]+[a-z0-9]$")
+SPEC_VERSIONS = ("2.0", "2.1")
+
+
+def validate_envelope(
+    json_data: Union[str, bytes, bytearray],
+    allow_custom: bool = False,
+    validate_objects: bool = True,
+    executor: Optional[Executor] = None,
+    parallel_threshold: int = 1000,
+    level: str = VALIDATION_FULL,
+) -> Dict:
     """
     Validate if ``json_data`` is a valid taxii2 envelope.
 
+    Objects are pre-checked for the properties every stix object needs
+    before they are fully parsed with :func:`validate_object`.
+
     :param json_data: the data to check
     :param allow_custom: if true, allow non-standard stix types
+    :param validate_objects: if false, only check the envelope structure and
+        leave validation of the stix objects to :func:`validate_object`
+    :param executor: process pool to parse the objects of large envelopes in
+    :param parallel_threshold: minimal number of objects to use ``executor`` for
+    :param level: validation level of the objects, see :func:`validate_object`
+
+    :return: the parsed envelope
     """
     if not json_data:
         raise ValidationError("No data")
     try:
-        data = json.loads(json_data)
-    except json.JSONDecodeError as e:
+        data = get_json_codec().loads(json_data)
+    except ValueError as e:
         raise ValidationError(f"Invalid json: {str(e)}") from e
-    if "objects" not in data:
+    if not isinstance(data, dict) or "objects" not in data:
         raise ValidationError("No objects")
-    for item in data["objects"]:
+    objects = data["objects"]
+    if not isinstance(objects, list) or not all(
+        isinstance(item, dict) for item in objects
+    ):
+        raise ValidationError("Objects must be a list of json objects")
+    for item in objects:
+        precheck_object(item)
+    if not validate_objects:
+        return data
+    if (
+        level == VALIDATION_FULL
+        and executor is not None
+        and len(objects) >= parallel_threshold
+    ):
+        _validate_objects_parallel(objects, allow_custom, executor)
+    else:
+        for item in objects:
+            validate_object(item, allow_custom, level)
+    return data
+
+
+def precheck_object(item: dict) -> None:
+    """
+    Check if ``item`` has the properties every stix object needs.
+
+    This is a cheap check that is done before :func:`validate_object`.
+
+    :param item: the stix object to check
+    """
+    object_type = item.get("type")
+    if not isinstance(object_type, str) or not object_type:
+        error = "Missing or invalid 'type' property"
+    elif "id" in item and (
+        not isinstance(item["id"], str) or not item["id"].startswith(f"{object_type}--")
+    ):
+        error = f"Invalid 'id' property, must start with '{object_type}--'"
+    else:
+        return
+    raise ValidationError(f"Invalid stix object: {json.dumps(item)}; {error}")
+
+
+def _first_invalid_object(items: List[dict], allow_custom: bool) -> Optional[str]:
+    """Return the error of the first invalid object in ``items``, if any."""
+    for item in items:
+        try:
+            validate_object(item, allow_custom)
+        except ValidationError as e:
+            return str(e)
+    return None
+
+
+def _validate_objects_parallel(
+    objects: List[dict], allow_custom: bool, executor: Executor
+) -> None:
+    chunks = [
+        objects[start : start + PARALLEL_CHUNK_SIZE]
+        for start in range(0, len(objects), PARALLEL_CHUNK_SIZE)
+    ]
+    # results come in order, so the first invalid object is reported
+    for error in executor.map(_first_invalid_object, chunks, repeat(allow_custom)):
+        if error is not None:
+            raise ValidationError(error)
+
+
+def validate_object(
+    item: dict, allow_custom: bool = False, level: str = VALIDATION_FULL
+) -> None:
+    """
+    Validate if ``item`` is a valid stix object.
+
+    Validation levels:
+
+    - ``full``: parse the object with :func:`stix2.parse`, and check the
+      properties needed to store the object
+    - ``structural``: only check the stix common properties
+      (``type``, ``id``, ``spec_version``, ``created`` and ``modified``)
+    - ``none``: only check the properties needed to store the object
+
+    :param item: the stix object to check
+    :param allow_custom: if true, allow non-standard stix types
+    :param level: one of :data:`VALIDATION_LEVELS`
+    """
+    if level == VALIDATION_FULL:
         try:
             parse(item, allow_custom)
         except STIXError as e:
             raise ValidationError(
                 f"Invalid stix object: {json.dumps(item)}; {str(e)}"
             ) from e
+        # stix2 fills in what it can, like a missing spec_version
+        error = _structure_error(item, strict=False)
+    else:
+        error = _structure_error(item, strict=level == VALIDATION_STRUCTURAL)
+    if error is not None:
+        raise ValidationError(f"Invalid stix object: {json.dumps(item)}; {error}")
+
+
+def _structure_error(item: dict, strict: bool) -> Optional[str]:
+    """
+    Return why ``item`` does not have the stix common properties, if it doesn't.
+
+    :param item: the stix object to check
+    :param strict: if false, only check the properties needed to store ``item``
+    """
+    object_id = item.get("id")
+    if not isinstance(object_id, str):
+        return "Missing or invalid 'id' property"
+    spec_version = item.get("spec_version")
+    if not isinstance(spec_version, str):
+        return "Missing or invalid 'spec_version' property"
+    if strict:
+        object_type = item.get("type")
+        if not isinstance(object_type, str) or not STIX_TYPE_RE.match(object_type):
+            return "Invalid 'type' property"
+        prefix, _, identifier = object_id.partition("--")
+        try:
+            uuid.UUID(identifier)
+        except ValueError:
+            identifier = ""
+        if prefix != object_type or not identifier:
+            return f"Invalid 'id' property, must be '{object_type}--<uuid>'"
+        if spec_version not in SPEC_VERSIONS:
+            return (
+                f"Unsupported 'spec_version' property, must be one of {SPEC_VERSIONS}"
+            )
+    for key in ("created", "modified"):
+        if key not in item:
+            continue
+        try:
+            datetime.datetime.strptime(item[key], DATETIMEFORMAT)
+        except (TypeError, ValueError):
+            return f"Invalid '{key}' property, must be formatted as 'YYYY-MM-DDTHH:MM:SS.sssZ'"
+    return None
 
 
 class Taxii2DateTime(fields.DateTime):
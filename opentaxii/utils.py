@@ -6,7 +6,7 @@ import inspect
 import logging
 import re
 import sys
-from typing import Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Optional, Pattern, Tuple
 
 import structlog
 from six.moves import urllib
@@ -351,3 +351,45 @@ def register_handler(
         return inner
 
     return inner_decorator
+
+
+# named groups and named backreferences in a url regex
+_GROUP_NAME_RE = re.compile(r"\(\?P(<|=)(\w+)")
+
+
+class EndpointRouter:
+    """
+    Match paths against the url regexes of many handlers in one pass.
+
+    The regexes registered with :func:`register_handler` are compiled into a
+    single alternation, in which every regex gets its own named group, so
+    the first regex that matches wins, as if they were tried one by one.
+
+    :param mapping: ``(regex, handler)`` pairs, in matching order
+    """
+
+    def __init__(self, mapping: Iterable[Tuple[Pattern, Callable]]):
+        self.mapping = tuple(mapping)
+        # handler and (combined group name, group name) pairs by alternative
+        self._alternatives: Dict[str, Tuple[Callable, Tuple[Tuple[str, str], ...]]] = {}
+        alternatives = []
+        for index, (regex, handler) in enumerate(self.mapping):
+            name = f"_{index}"
+            pattern = _GROUP_NAME_RE.sub(
+                lambda match: f"(?P{match.group(1)}{name}_{match.group(2)}",
+                regex.pattern,
+            )
+            alternatives.append(f"(?P<{name}>{pattern})")
+            self._alternatives[name] = (
+                handler,
+                tuple((f"{name}_{group}", group) for group in regex.groupindex),
+            )
+        self.regex = re.compile("|".join(alternatives))
+
+    def match(self, path: str) -> Optional[Tuple[Callable, Dict[str, Any]]]:
+        """Get the handler matching ``path`` and the named groups of its regex."""
+        match = self.regex.match(path)
+        if match is None:
+            return None
+        handler, groups = self._alternatives[match.lastgroup]  # type: ignore[index]
+        return handler, {group: match.group(name) for name, group in groups}
@@ -44,9 +44,20 @@ setup(
             'opentaxii-add-api-root = opentaxii.cli.persistence:add_api_root',
             'opentaxii-add-collection = opentaxii.cli.persistence:add_collection',
             'opentaxii-job-cleanup = opentaxii.cli.persistence:job_cleanup',
+            'opentaxii-run-job-worker = opentaxii.cli.persistence:run_job_worker',
+            'opentaxii-upgrade-db = opentaxii.cli.persistence:upgrade_db',
+            'opentaxii-backfill-version-flags = opentaxii.cli.persistence:backfill_version_flags',
+            'opentaxii-recompress = opentaxii.cli.persistence:recompress',
+            'opentaxii-backfill-watermarks = opentaxii.cli.persistence:backfill_watermarks',
         ]
     },
     install_requires=install_requires,
+    extras_require={
+        'brotli': ['brotli'],
+        'orjson': ['orjson'],
+        'ujson': ['ujson'],
+        'zstd': ['zstandard'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
@@ -216,6 +216,9 @@ def transaction_app(dbconn, taxiiserver):
         connections.append(connection)
         sessions.append(manager.api.db.session)
     yield app
+    if taxiiserver.servers.taxii1:
+        # services rolled back below must not outlive the test
+        taxiiserver.servers.taxii1.invalidate_services()
     for transaction, connection, session, manager in zip(
         transactions, connections, sessions, managers
     ):
@@ -361,4 +364,5 @@ def db_stix_objects(request, taxii2_sqldb_api, db_collections):
     for stix_object in stix_objects:
         taxii2_sqldb_api.db.session.add(STIXObject.from_entity(stix_object))
     taxii2_sqldb_api.db.session.commit()
+    taxii2_sqldb_api.backfill_version_flags()
     yield stix_objects
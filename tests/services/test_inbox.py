@@ -1,8 +1,11 @@
+from unittest import mock
+
 import pytest
 from libtaxii import messages_10 as tm10
 from libtaxii import messages_11 as tm11
 from libtaxii.constants import CB_STIX_XML_111, ST_SUCCESS
 
+from opentaxii.signals import CONTENT_BLOCK_CREATED
 from opentaxii.taxii import exceptions
 
 from ..fixtures import (
@@ -212,3 +215,49 @@ def test_inbox_req_coll_content_bindings_filtering(server, version, https):
 
     # Content blocks with invalid content should be ignored
     assert len(blocks) == 1
+
+
+@pytest.mark.parametrize("version", [11, 10])
+def test_inbox_request_creates_blocks_in_bulk(server, version):
+    from opentaxii.persistence.sqldb.models import DataCollection
+
+    inbox = server.servers.taxii1.get_service("inbox-A")
+    persistence = server.servers.taxii1.persistence
+    headers = prepare_headers(version, https=True)
+
+    blocks = [make_content(version, content_binding=CB_STIX_XML_111) for _ in range(3)]
+    inbox_message = make_inbox_message(version, blocks=blocks)
+
+    received = []
+
+    def on_created(manager, content_block, collection_ids, service_id):
+        received.append((content_block.id, tuple(collection_ids), service_id))
+
+    CONTENT_BLOCK_CREATED.connect(on_created)
+    try:
+        with mock.patch.object(
+            persistence.api,
+            "create_content_blocks",
+            wraps=persistence.api.create_content_blocks,
+        ) as create_content_blocks:
+            response = inbox.process(headers, inbox_message)
+    finally:
+        CONTENT_BLOCK_CREATED.disconnect(on_created)
+
+    assert response.status_type == ST_SUCCESS
+    create_content_blocks.assert_called_once()
+
+    db_blocks = persistence.get_content_blocks(None)
+    assert sorted(block_id for block_id, _, _ in received) == sorted(
+        block.id for block in db_blocks
+    )
+    collection_ids = received[0][1]
+    assert collection_ids
+    assert all(ids == collection_ids and sid == inbox.id for _, ids, sid in received)
+
+    volumes = dict(
+        persistence.api.db.session.query(DataCollection.id, DataCollection.volume)
+    )
+    for collection_id in collection_ids:
+        assert volumes[collection_id] == len(blocks)
+        assert len(persistence.get_content_blocks(collection_id)) == len(blocks)
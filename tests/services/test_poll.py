@@ -1,8 +1,11 @@
+import datetime
+
 import pytest
 from libtaxii import messages_10 as tm10
 from libtaxii import messages_11 as tm11
 from libtaxii.constants import ACT_SUBSCRIBE, CB_STIX_XML_111, RT_COUNT_ONLY, RT_FULL
 
+from opentaxii.persistence.sqldb.models import get_utc_now
 from opentaxii.taxii import exceptions
 
 from ..fixtures import (
@@ -326,6 +329,40 @@ def test_poll_fulfilment_request(server, https, count_blocks):
     server.servers.taxii1.config['count_blocks_in_poll_responses'] = True
 
 
+def test_poll_fulfilment_request_seeks_to_part(server):
+    server.servers.taxii1.config['count_blocks_in_poll_responses'] = False
+    version = 11
+    service = server.servers.taxii1.get_service('poll-A')
+    persistence = server.servers.taxii1.persistence
+
+    timestamp = get_utc_now()
+    for i in range(30):
+        persist_content(persistence, COLLECTION_OPEN, service.id, timestamp=timestamp)
+
+    headers = prepare_headers(version, https=False)
+    request = prepare_request(collection_name=COLLECTION_OPEN, version=version)
+    response = service.process(headers, request)
+    assert len(response.content_blocks) == POLL_RESULT_SIZE
+    assert response.more is True
+    result_id = response.result_id
+
+    # content added to the start of the result set does not shift later parts
+    persist_content(
+        persistence,
+        COLLECTION_OPEN,
+        service.id,
+        timestamp=timestamp - datetime.timedelta(hours=1),
+    )
+    cursor = persistence.get_result_set_cursor(result_id, 2)
+    assert cursor[0] == timestamp
+
+    request = prepare_fulfilment_request(COLLECTION_OPEN, result_id, 2)
+    response = service.process(headers, request)
+    assert len(response.content_blocks) == 30 - POLL_RESULT_SIZE
+    assert not response.more
+    server.servers.taxii1.config['count_blocks_in_poll_responses'] = True
+
+
 @pytest.mark.parametrize("https", [True, False])
 @pytest.mark.parametrize("version", [11, 10])
 def test_subscribe_and_poll(server, version, https):
@@ -432,3 +432,24 @@ def test_collection_can_write():
     assert collection.can_write(None) is False
     collection.is_public_write = True
     assert collection.can_write(None) is True
+
+
+def test_collection_conditional(authenticated_client, db_collections):
+    url = f"/taxii2/{API_ROOTS[0].id}/collections/{COLLECTIONS[0].id}/"
+    headers = {"Accept": "application/taxii+json;version=2.1"}
+    response = authenticated_client.get(url, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert etag.startswith('W/"')
+    response = authenticated_client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    # can_read and can_write are part of the response
+    with patch.object(
+        authenticated_client.account, "permissions", {str(COLLECTIONS[0].id): ["read"]}
+    ):
+        response = authenticated_client.get(
+            url, headers={**headers, "If-None-Match": etag}
+        )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
@@ -0,0 +1,93 @@
+import datetime
+import io
+import json
+from uuid import UUID
+
+import pytest
+from flask import Flask
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from opentaxii.taxii2.http import (
+    JsonCodec,
+    configure_json_codec,
+    get_json_codec,
+    make_taxii2_response,
+    make_taxii2_stream_response,
+    read_request_body,
+)
+
+DATA = {
+    "id": UUID("5e113376-8a13-432d-b711-92f566ebbd92"),
+    "date_added": datetime.datetime(2022, 1, 1, 12, tzinfo=datetime.timezone.utc),
+    "objects": [{"name": "ünicode/slash", "count": 1, "more": None}],
+}
+EXPECTED = {
+    "id": "5e113376-8a13-432d-b711-92f566ebbd92",
+    "date_added": "2022-01-01T12:00:00.000000Z",
+    "objects": [{"name": "ünicode/slash", "count": 1, "more": None}],
+}
+
+
+@pytest.fixture(params=["json", "orjson", "ujson"])
+def codec(request):
+    pytest.importorskip(request.param)
+    yield configure_json_codec(request.param)
+    configure_json_codec()
+
+
+def test_codec(codec):
+    assert get_json_codec() is codec
+    assert json.loads(codec.dumps(DATA)) == EXPECTED
+    assert codec.loads(json.dumps(EXPECTED)) == EXPECTED
+    assert codec.loads(json.dumps(EXPECTED).encode()) == EXPECTED
+    assert codec.loads(bytearray(json.dumps(EXPECTED).encode())) == EXPECTED
+    with pytest.raises(ValueError):
+        codec.loads(b"not json")
+    with pytest.raises(TypeError):
+        codec.dumps({"value": object()})
+
+
+def test_codec_responses(codec):
+    with Flask(__name__).test_request_context():
+        response = make_taxii2_response(DATA)
+        stream_response = make_taxii2_stream_response(
+            {"more": False}, "objects", iter(DATA["objects"])
+        )
+        empty_stream_response = make_taxii2_stream_response({}, "objects", iter([]))
+        assert json.loads(response.get_data()) == EXPECTED
+        assert json.loads(stream_response.get_data()) == {
+            "more": False,
+            "objects": EXPECTED["objects"],
+        }
+        assert json.loads(empty_stream_response.get_data()) == {"objects": []}
+
+
+def test_configure_json_codec():
+    try:
+        assert isinstance(configure_json_codec("auto"), JsonCodec)
+        with pytest.raises(ValueError):
+            configure_json_codec("nope")
+    finally:
+        configure_json_codec()
+    assert type(get_json_codec()) is JsonCodec
+
+
+@pytest.mark.parametrize(
+    ["size", "content_length", "too_large"],
+    [
+        pytest.param(0, None, False, id="empty"),
+        pytest.param(200 * 1024, None, False, id="max_length"),
+        pytest.param(200 * 1024 + 1, None, True, id="too large"),
+        pytest.param(10, 200 * 1024 + 1, True, id="too large content-length"),
+    ],
+)
+def test_read_request_body(size, content_length, too_large):
+    stream = io.BytesIO(b"x" * size)
+    if too_large:
+        with pytest.raises(RequestEntityTooLarge):
+            read_request_body(stream, 200 * 1024, content_length=content_length)
+        # the body is not read beyond the limit
+        assert stream.tell() <= 200 * 1024 + 1
+    else:
+        body = read_request_body(stream, 200 * 1024, content_length=content_length)
+        assert body == b"x" * size
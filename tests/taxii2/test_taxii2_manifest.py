@@ -791,3 +791,31 @@ def test_manifest_unauthenticated(
             headers={"Accept": "application/taxii+json;version=2.1"},
         )
     assert response.status_code == expected_status_code
+
+
+def test_manifest_conditional(authenticated_client, db_stix_objects):
+    taxii2_api = (
+        authenticated_client.application.taxii_server.servers.taxii2.persistence.api
+    )
+    url = f"/taxii2/{API_ROOTS[0].id}/collections/{COLLECTIONS[5].id}/manifest/"
+    headers = {"Accept": "application/taxii+json;version=2.1"}
+    with patch.object(
+        authenticated_client.account,
+        "permissions",
+        {str(COLLECTIONS[1].id): ["read"], str(COLLECTIONS[5].id): ["read"]},
+    ):
+        response = authenticated_client.get(url, headers=headers)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        with patch.object(taxii2_api, "get_manifest") as get_manifest:
+            response = authenticated_client.get(
+                url, headers={**headers, "If-None-Match": etag}
+            )
+        get_manifest.assert_not_called()
+        assert response.status_code == 304
+        # etags are per collection
+        response = authenticated_client.get(
+            url.replace(str(COLLECTIONS[5].id), str(COLLECTIONS[1].id)),
+            headers={**headers, "If-None-Match": etag},
+        )
+    assert response.status_code == 200
@@ -1,12 +1,14 @@
 import datetime
+import gzip
 import json
 from unittest.mock import patch
 from urllib.parse import urlencode
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 import pytest
 
 from opentaxii.taxii2.utils import taxii2_datetimeformat
+from tests.fixtures import ACCOUNT
 from tests.taxii2.utils import (
     ADD_OBJECTS_MOCK,
     API_ROOTS,
@@ -181,7 +183,11 @@ from tests.utils import SKIP
             {
                 "more": True,
                 "next": GET_NEXT_PARAM(
-                    {"id": STIX_OBJECTS[0].id, "date_added": STIX_OBJECTS[0].date_added}
+                    {
+                        "id": STIX_OBJECTS[0].id,
+                        "date_added": STIX_OBJECTS[0].date_added,
+                        "version": STIX_OBJECTS[0].version,
+                    }
                 ),
                 "objects": [
                     {
@@ -1346,3 +1352,427 @@ def test_objects_unauthenticated(
         )
     else:
         add_objects_mock.assert_not_called()
+
+
+def test_objects_post_async(authenticated_client, db_collections):
+    taxii2_server = authenticated_client.application.taxii_server.servers.taxii2
+    valid = {
+        "type": "x-no-version",
+        "id": "x-no-version--5e113376-8a13-432d-b711-92f566ebbd92",
+        "spec_version": "2.1",
+    }
+    invalid = {"type": "indicator", "id": "indicator--1", "spec_version": "2.1"}
+    with (
+        patch.object(
+            taxii2_server,
+            "config",
+            config_override({"async_jobs": True, "job_batch_size": 1})(
+                taxii2_server.config
+            ),
+        ),
+        patch.object(
+            authenticated_client.account,
+            "permissions",
+            {str(COLLECTIONS[5].id): ["read", "write"]},
+        ),
+    ):
+        response = authenticated_client.post(
+            f"/taxii2/{API_ROOTS[0].id}/collections/{COLLECTIONS[5].id}/objects/",
+            json={"objects": [valid, invalid]},
+            headers={
+                "Accept": "application/taxii+json;version=2.1",
+                "Content-Type": "application/taxii+json;version=2.1",
+            },
+        )
+        assert response.status_code == 202
+        content = json.loads(response.data)
+        assert content["status"] == "pending"
+        assert content["pending_count"] == 2
+        assert taxii2_server.process_pending_job() == UUID(content["id"])
+        assert taxii2_server.process_pending_job() is None
+        response = authenticated_client.get(
+            f"/taxii2/{API_ROOTS[0].id}/status/{content['id']}/",
+            headers={"Accept": "application/taxii+json;version=2.1"},
+        )
+    assert response.status_code == 200
+    status = json.loads(response.data)
+    assert status["status"] == "complete"
+    assert (
+        status["success_count"],
+        status["failure_count"],
+        status["pending_count"],
+    ) == (1, 1, 0)
+    assert [detail["id"] for detail in status["successes"]] == [valid["id"]]
+    assert [detail["id"] for detail in status["failures"]] == [invalid["id"]]
+    assert status["failures"][0]["message"].startswith("Invalid stix object")
+
+
+def test_objects_post_async_unstorable(authenticated_client, db_collections):
+    taxii2_server = authenticated_client.application.taxii_server.servers.taxii2
+    valid = {
+        "type": "x-no-version",
+        "id": "x-no-version--5e113376-8a13-432d-b711-92f566ebbd92",
+        "spec_version": "2.1",
+    }
+    # accepted by stix2.parse, but cannot be stored
+    unstorable = [
+        {"type": "x-no-id", "spec_version": "2.1"},
+        {
+            "type": "x-seconds",
+            "id": "x-seconds--2e113376-8a13-432d-b711-92f566ebbd92",
+            "spec_version": "2.1",
+            "modified": "2020-01-01T00:00:00Z",
+        },
+    ]
+    job = taxii2_server.persistence.api.add_pending_objects(
+        api_root_id=API_ROOTS[0].id,
+        collection_id=COLLECTIONS[5].id,
+        objects=[valid] + unstorable,
+    )
+    assert taxii2_server.process_pending_job() == job.id
+    status = taxii2_server.persistence.api.get_job_and_details(API_ROOTS[0].id, job.id)
+    assert status.status == "complete"
+    assert (
+        status.success_count,
+        status.failure_count,
+        status.pending_count,
+    ) == (1, 2, 0)
+
+
+def test_objects_post_async_max_attempts(authenticated_client, db_collections):
+    taxii2_server = authenticated_client.application.taxii_server.servers.taxii2
+    persistence = taxii2_server.persistence
+    objects = [
+        {
+            "type": "x-no-version",
+            "id": f"x-no-version--{uuid4()}",
+            "spec_version": "2.1",
+        }
+        for _ in range(2)
+    ]
+    job = persistence.api.add_pending_objects(
+        api_root_id=API_ROOTS[0].id,
+        collection_id=COLLECTIONS[5].id,
+        objects=objects,
+    )
+    for _ in range(2):
+        # a worker that crashes while storing the job
+        with (
+            patch.object(
+                persistence.api, "add_job_objects", side_effect=RuntimeError()
+            ),
+            pytest.raises(RuntimeError),
+        ):
+            persistence.process_pending_job(
+                lambda obj, level: None, claim_timeout=-1, max_attempts=2
+            )
+    assert (
+        persistence.process_pending_job(
+            lambda obj, level: None, claim_timeout=-1, max_attempts=2
+        )
+        == job.id
+    )
+    status = persistence.api.get_job_and_details(API_ROOTS[0].id, job.id)
+    assert status.status == "complete"
+    assert (
+        status.success_count,
+        status.failure_count,
+        status.pending_count,
+    ) == (0, 2, 0)
+    assert {detail.message for detail in status.details.failure} == {
+        "Job was not completed in 2 attempts"
+    }
+
+
+INCOMPLETE_INDICATOR = {
+    "type": "indicator",
+    "spec_version": "2.1",
+    "id": "indicator--8e2e2d2b-17d4-4cbf-938f-98ee46b3cd3f",
+    "created": "2016-04-06T20:03:48.000Z",
+    "modified": "2016-04-06T20:03:48.000Z",
+}
+BAD_ID_INDICATOR = {"type": "indicator", "id": "indicator--1", "spec_version": "2.1"}
+
+
+@pytest.mark.parametrize(
+    ["validation_level", "async_jobs", "obj", "expected_success"],
+    [
+        pytest.param(None, False, INCOMPLETE_INDICATOR, False, id="default"),
+        pytest.param("structural", False, INCOMPLETE_INDICATOR, True, id="structural"),
+        pytest.param(
+            "structural", False, BAD_ID_INDICATOR, False, id="structural, bad id"
+        ),
+        pytest.param("none", False, BAD_ID_INDICATOR, True, id="none"),
+        pytest.param(
+            {"collections": {COLLECTIONS[5].alias: "none"}},
+            False,
+            BAD_ID_INDICATOR,
+            True,
+            id="collection alias",
+        ),
+        pytest.param(
+            {"default": "none", "collections": {str(COLLECTIONS[4].id): "none"}},
+            False,
+            BAD_ID_INDICATOR,
+            True,
+            id="mapping default",
+        ),
+        pytest.param(
+            {"default": "none", "accounts": {ACCOUNT.username: "full"}},
+            False,
+            INCOMPLETE_INDICATOR,
+            False,
+            id="account",
+        ),
+        pytest.param(
+            {
+                "collections": {str(COLLECTIONS[5].id): "none"},
+                "accounts": {ACCOUNT.username: "structural"},
+            },
+            False,
+            BAD_ID_INDICATOR,
+            False,
+            id="strictest wins",
+        ),
+        pytest.param("structural", True, INCOMPLETE_INDICATOR, True, id="async"),
+        pytest.param(None, True, INCOMPLETE_INDICATOR, False, id="async, default"),
+    ],
+)
+def test_objects_post_validation_level(
+    authenticated_client,
+    db_collections,
+    validation_level,
+    async_jobs,
+    obj,
+    expected_success,
+):
+    taxii2_server = authenticated_client.application.taxii_server.servers.taxii2
+    with (
+        patch.object(
+            taxii2_server,
+            "config",
+            config_override(
+                {"validation_level": validation_level, "async_jobs": async_jobs}
+            )(taxii2_server.config),
+        ),
+        patch.object(
+            authenticated_client.account,
+            "permissions",
+            {str(COLLECTIONS[5].id): ["read", "write"]},
+        ),
+    ):
+        response = authenticated_client.post(
+            f"/taxii2/{API_ROOTS[0].id}/collections/{COLLECTIONS[5].alias}/objects/",
+            json={"objects": [obj]},
+            headers={
+                "Accept": "application/taxii+json;version=2.1",
+                "Content-Type": "application/taxii+json;version=2.1",
+            },
+        )
+        if async_jobs:
+            assert response.status_code == 202
+            job_id = json.loads(response.data)["id"]
+            assert taxii2_server.process_pending_job() == UUID(job_id)
+            response = authenticated_client.get(
+                f"/taxii2/{API_ROOTS[0].id}/status/{job_id}/",
+                headers={"Accept": "application/taxii+json;version=2.1"},
+            )
+            status = json.loads(response.data)
+            assert status["success_count"] == int(expected_success)
+        elif expected_success:
+            assert response.status_code == 202
+            assert json.loads(response.data)["success_count"] == 1
+        else:
+            assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "filter_kwargs",
+    [
+        pytest.param({}, id="all"),
+        pytest.param({"limit": 1}, id="limit"),
+        pytest.param({"match[version]": "all", "limit": 2}, id="versions limit"),
+        pytest.param({"match[type]": "nothing"}, id="empty"),
+    ],
+)
+def test_objects_get_stream(authenticated_client, db_stix_objects, filter_kwargs):
+    taxii2_server = authenticated_client.application.taxii_server.servers.taxii2
+    url = (
+        f"/taxii2/{API_ROOTS[0].id}/collections/{COLLECTIONS[5].id}/objects/"
+        f"?{urlencode(filter_kwargs)}"
+    )
+    headers = {"Accept": "application/taxii+json;version=2.1"}
+    with patch.object(
+        authenticated_client.account,
+        "permissions",
+        {str(COLLECTIONS[5].id): ["read"]},
+    ):
+        expected = authenticated_client.get(url, headers=headers)
+        with patch.object(
+            taxii2_server,
+            "config",
+            config_override({"stream_objects": True})(taxii2_server.config),
+        ):
+            response = authenticated_client.get(url, headers=headers)
+    assert expected.status_code == 200
+    assert response.status_code == 200
+    assert json.loads(response.data) == json.loads(expected.data)
+    for header in (
+        "Content-Type",
+        "X-TAXII-Date-Added-First",
+        "X-TAXII-Date-Added-Last",
+    ):
+        assert response.headers.get(header) == expected.headers.get(header)
+
+
+@pytest.mark.parametrize("stream_objects", [False, True])
+def test_objects_get_raw(authenticated_client, db_collections, stream_objects):
+    taxii2_server = authenticated_client.application.taxii_server.servers.taxii2
+    objects = [
+        {**INCOMPLETE_INDICATOR, "pattern": "[ipv4-addr:value = '1.2.3.4']"},
+        {
+            "type": "x-no-version",
+            "id": "x-no-version--5e113376-8a13-432d-b711-92f566ebbd92",
+            "spec_version": "2.1",
+        },
+    ]
+    headers = {
+        "Accept": "application/taxii+json;version=2.1",
+        "Content-Type": "application/taxii+json;version=2.1",
+    }
+    url = f"/taxii2/{API_ROOTS[0].id}/collections/{COLLECTIONS[5].id}/objects/"
+    with (
+        patch.object(
+            taxii2_server,
+            "config",
+            config_override(
+                {"validation_level": "none", "stream_objects": stream_objects}
+            )(taxii2_server.config),
+        ),
+        patch.object(taxii2_server.persistence.api, "raw_objects", True),
+        patch.object(
+            authenticated_client.account,
+            "permissions",
+            {str(COLLECTIONS[5].id): ["read", "write"]},
+        ),
+    ):
+        response = authenticated_client.post(
+            url, json={"objects": objects}, headers=headers
+        )
+        assert response.status_code == 202
+        response = authenticated_client.get(url, headers=headers)
+        object_response = authenticated_client.get(
+            f"{url}{objects[0]['id']}/", headers=headers
+        )
+    assert response.status_code == 200
+    content = json.loads(response.data)
+    assert content["more"] is False
+    assert sorted(content["objects"], key=json.dumps) == sorted(objects, key=json.dumps)
+    assert response.headers["X-TAXII-Date-Added-First"]
+    assert object_response.status_code == 200
+    assert json.loads(object_response.data) == {
+        "more": False,
+        "objects": [objects[0]],
+    }
+
+
+@pytest.mark.parametrize(
+    ["padding", "expected_status_code"],
+    [
+        pytest.param(0, 202, id="small"),
+        pytest.param(2000, 413, id="too large after decompression"),
+    ],
+)
+def test_objects_post_gzip(
+    authenticated_client, db_collections, padding, expected_status_code
+):
+    obj = {
+        "type": "x-no-version",
+        "id": "x-no-version--5e113376-8a13-432d-b711-92f566ebbd92",
+        "spec_version": "2.1",
+        "x_padding": "x" * padding,
+    }
+    body = gzip.compress(json.dumps({"objects": [obj]}).encode())
+    # the configured max_content_length of 1024 applies to the decompressed body
+    assert len(body) < 1024
+    taxii2_server = authenticated_client.application.taxii_server.servers.taxii2
+    with (
+        patch.object(
+            taxii2_server,
+            "config",
+            config_override({"validation_level": "none"})(taxii2_server.config),
+        ),
+        patch.object(
+            authenticated_client.account,
+            "permissions",
+            {str(COLLECTIONS[5].id): ["read", "write"]},
+        ),
+    ):
+        response = authenticated_client.post(
+            f"/taxii2/{API_ROOTS[0].id}/collections/{COLLECTIONS[5].id}/objects/",
+            data=body,
+            headers={
+                "Accept": "application/taxii+json;version=2.1",
+                "Content-Type": "application/taxii+json;version=2.1",
+                "Content-Encoding": "gzip",
+            },
+        )
+    assert response.status_code == expected_status_code
+    if expected_status_code == 202:
+        assert json.loads(response.data)["success_count"] == 1
+
+
+@pytest.mark.parametrize("stream_objects", [False, True])
+def test_objects_get_conditional(authenticated_client, db_stix_objects, stream_objects):
+    taxii2_server = authenticated_client.application.taxii_server.servers.taxii2
+    url = f"/taxii2/{API_ROOTS[0].id}/collections/{COLLECTIONS[5].id}/objects/"
+    headers = {"Accept": "application/taxii+json;version=2.1"}
+    with (
+        patch.object(
+            taxii2_server,
+            "config",
+            config_override({"stream_objects": stream_objects})(taxii2_server.config),
+        ),
+        patch.object(
+            authenticated_client.account,
+            "permissions",
+            {str(COLLECTIONS[5].id): ["read", "write"]},
+        ),
+    ):
+        response = authenticated_client.get(url, headers=headers)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/"')
+        last_modified = response.headers["Last-Modified"]
+        with (
+            patch.object(taxii2_server.persistence.api, "get_objects") as get_objects,
+            patch.object(
+                taxii2_server.persistence.api, "stream_objects"
+            ) as stream_objects_mock,
+        ):
+            for conditional_headers in [
+                {"If-None-Match": etag},
+                {"If-None-Match": etag, "If-Modified-Since": last_modified},
+            ]:
+                response = authenticated_client.get(
+                    url, headers={**headers, **conditional_headers}
+                )
+                assert response.status_code == 304
+                assert response.data == b""
+                assert response.headers["ETag"] == etag
+            get_objects.assert_not_called()
+            stream_objects_mock.assert_not_called()
+        # Last-Modified is too coarse to answer 304 on its own
+        response = authenticated_client.get(
+            url, headers={**headers, "If-Modified-Since": last_modified}
+        )
+        assert response.status_code == 200
+        response = authenticated_client.delete(
+            f"{url}{STIX_OBJECTS[1].id}/", headers=headers
+        )
+        assert response.status_code == 200
+        response = authenticated_client.get(
+            url, headers={**headers, "If-None-Match": etag}
+        )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
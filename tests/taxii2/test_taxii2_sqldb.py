@@ -1,10 +1,21 @@
+import concurrent.futures
 import datetime
+import functools
+import json
+from unittest.mock import patch
 from uuid import uuid4
 
 import pytest
+from sqlalchemy import LargeBinary, text, type_coerce
 
 from opentaxii.persistence.sqldb.api import Taxii2SQLDatabaseAPI
-from opentaxii.persistence.sqldb.taxii2models import Job, JobDetail, STIXObject
+from opentaxii.persistence.sqldb.compression import is_compressed
+from opentaxii.persistence.sqldb.taxii2models import (
+    CollectionWatermark,
+    Job,
+    JobDetail,
+    STIXObject,
+)
 from opentaxii.taxii2 import entities
 from opentaxii.taxii2.utils import get_object_version
 from tests.taxii2.utils import (
@@ -745,26 +756,30 @@ def test_get_objects(
     match_version,
     match_spec_version,
 ):
-    response = taxii2_sqldb_api.get_objects(
-        collection_id=collection_id,
-        limit=limit,
-        added_after=added_after,
-        next_kwargs=next_kwargs,
-        match_id=match_id,
-        match_type=match_type,
-        match_version=match_version,
-        match_spec_version=match_spec_version,
-    )
-    assert response == GET_OBJECTS_MOCK(
-        collection_id=collection_id,
-        limit=limit,
-        added_after=added_after,
-        next_kwargs=next_kwargs,
-        match_id=match_id,
-        match_type=match_type,
-        match_version=match_version,
-        match_spec_version=match_spec_version,
+    kwargs = {
+        "collection_id": collection_id,
+        "limit": limit,
+        "added_after": added_after,
+        "next_kwargs": next_kwargs,
+        "match_id": match_id,
+        "match_type": match_type,
+        "match_version": match_version,
+        "match_spec_version": match_spec_version,
+    }
+    expected = GET_OBJECTS_MOCK(**kwargs)
+    assert taxii2_sqldb_api.get_objects(**kwargs) == expected
+    objects, more, next_param, date_added_first, date_added_last = (
+        taxii2_sqldb_api.stream_objects(**kwargs)
     )
+    if not expected[0]:
+        assert (date_added_first, date_added_last) == (None, None)
+        expected = ([], False, None)
+    else:
+        assert (date_added_first, date_added_last) == (
+            expected[0][0].date_added,
+            expected[0][-1].date_added,
+        )
+    assert (list(objects), more, next_param) == expected
 
 
 @pytest.mark.parametrize(
@@ -949,6 +964,46 @@ def test_add_objects(
         assert db_job_detail.status == "success"
 
 
+def test_add_objects_duplicates(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_stix_objects,
+):
+    existing = {
+        "id": STIX_OBJECTS[0].id,
+        "type": STIX_OBJECTS[0].type,
+        "spec_version": STIX_OBJECTS[0].spec_version,
+        **STIX_OBJECTS[0].serialized_data,
+    }
+    new = {
+        "type": "x-no-version",
+        "id": "x-no-version--5e113376-8a13-432d-b711-92f566ebbd92",
+        "spec_version": "2.1",
+    }
+    objects = [existing, new, new]
+    job = taxii2_sqldb_api.add_objects(
+        api_root_id=API_ROOTS[0].id,
+        collection_id=COLLECTIONS[5].id,
+        objects=objects,
+    )
+    assert job.total_count == 3
+    assert job.success_count == 3
+    assert [job_detail.stix_id for job_detail in job.details.success] == [
+        obj["id"] for obj in objects
+    ]
+    for obj in [existing, new]:
+        assert (
+            taxii2_sqldb_api.db.session.query(STIXObject)
+            .filter(
+                STIXObject.collection_id == COLLECTIONS[5].id,
+                STIXObject.id == obj["id"],
+                STIXObject.version == get_object_version(obj),
+            )
+            .count()
+            == 1
+        )
+    assert taxii2_sqldb_api.db.session.query(JobDetail).count() == 3
+
+
 @pytest.mark.parametrize(
     [
         "collection_id",
@@ -1434,6 +1489,193 @@ def test_get_versions(
     )
 
 
+def test_version_flags(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_collections,
+):
+    versions = [
+        {
+            "type": "malware",
+            "spec_version": "2.1",
+            "id": "malware--31b940d4-6f7f-459a-80ea-9c1f17b5891b",
+            "is_family": True,
+            "created": "2016-04-06T20:07:09.000Z",
+            "modified": f"2016-04-0{day}T20:07:09.000Z",
+            "name": "Poison Ivy",
+        }
+        for day in (7, 6, 8)
+    ]
+
+    def flags():
+        return [
+            (obj.version.day, obj.is_first, obj.is_latest)
+            for obj in taxii2_sqldb_api.db.session.query(STIXObject).order_by(
+                STIXObject.version
+            )
+        ]
+
+    taxii2_sqldb_api.add_objects(API_ROOTS[0].id, COLLECTIONS[5].id, versions[:1])
+    assert flags() == [(7, True, True)]
+    taxii2_sqldb_api.add_objects(API_ROOTS[0].id, COLLECTIONS[5].id, versions[1:])
+    assert flags() == [(6, True, False), (7, False, False), (8, False, True)]
+    taxii2_sqldb_api.delete_object(
+        COLLECTIONS[5].id, versions[0]["id"], match_version=["last"]
+    )
+    assert flags() == [(6, True, False), (7, False, True)]
+    taxii2_sqldb_api.delete_object(
+        COLLECTIONS[5].id, versions[0]["id"], match_version=["first"]
+    )
+    assert flags() == [(7, True, True)]
+
+
+def test_version_flags_interleaved_writers(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_collections,
+):
+    versions = [
+        {
+            "type": "malware",
+            "spec_version": "2.1",
+            "id": "malware--c0931cc6-c75e-47e5-9036-78fabc95d4ec",
+            "is_family": True,
+            "created": "2016-04-06T20:07:09.000Z",
+            "modified": f"2016-04-0{day}T20:07:09.000Z",
+            "name": "Poison Ivy",
+        }
+        for day in (6, 7, 8)
+    ]
+    taxii2_sqldb_api.add_objects(API_ROOTS[0].id, COLLECTIONS[5].id, versions[1:2])
+    get_existing_versions = taxii2_sqldb_api._get_existing_versions
+
+    def other_writer_commits_after_read(*args, **kwargs):
+        existing_versions = get_existing_versions(*args, **kwargs)
+        if not kwargs.get("for_update"):
+            # sessions are per thread, the latest version is committed by
+            # another writer between the read and the insert of the oldest one
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(
+                    taxii2_sqldb_api.add_objects,
+                    API_ROOTS[0].id,
+                    COLLECTIONS[5].id,
+                    versions[2:],
+                ).result()
+        return existing_versions
+
+    with patch.object(
+        taxii2_sqldb_api,
+        "_get_existing_versions",
+        side_effect=other_writer_commits_after_read,
+    ):
+        taxii2_sqldb_api.add_objects(API_ROOTS[0].id, COLLECTIONS[5].id, versions[:1])
+    taxii2_sqldb_api.db.session.expire_all()
+    assert [
+        (obj.version.day, obj.is_first, obj.is_latest)
+        for obj in taxii2_sqldb_api.db.session.query(STIXObject).order_by(
+            STIXObject.version
+        )
+    ] == [(6, True, False), (7, False, False), (8, False, True)]
+
+
+def test_backfill_version_flags(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_stix_objects,
+):
+    expected = taxii2_sqldb_api.get_objects(COLLECTIONS[5].id)
+    taxii2_sqldb_api.db.session.query(STIXObject).update(
+        {STIXObject.is_first: False, STIXObject.is_latest: False}
+    )
+    taxii2_sqldb_api.db.session.commit()
+    assert taxii2_sqldb_api.get_objects(COLLECTIONS[5].id)[0] == []
+    assert taxii2_sqldb_api.backfill_version_flags() == len(
+        {(obj.collection_id, obj.id) for obj in STIX_OBJECTS}
+    )
+    assert taxii2_sqldb_api.get_objects(COLLECTIONS[5].id) == expected
+
+
+def test_upgrade_schema(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_stix_objects,
+):
+    assert taxii2_sqldb_api.upgrade_schema() == []
+    taxii2_sqldb_api.db.session.close()
+    with taxii2_sqldb_api.db.engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_opentaxii_stixobject_col_first"))
+        connection.execute(
+            text("ALTER TABLE opentaxii_stixobject DROP COLUMN raw_data")
+        )
+    assert taxii2_sqldb_api.upgrade_schema() == [
+        "raw_data",
+        "ix_opentaxii_stixobject_col_first",
+    ]
+    assert taxii2_sqldb_api.upgrade_schema() == []
+    assert len(taxii2_sqldb_api.get_objects(COLLECTIONS[5].id)[0]) > 0
+
+
+def test_pending_job(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_collections,
+):
+    valid = {
+        "type": "x-no-version",
+        "id": "x-no-version--5e113376-8a13-432d-b711-92f566ebbd92",
+        "spec_version": "2.1",
+    }
+    invalid = {"type": "x-broken", "id": "x-broken--1", "modified": "yesterday"}
+    job = taxii2_sqldb_api.add_pending_objects(
+        api_root_id=API_ROOTS[0].id,
+        collection_id=COLLECTIONS[5].id,
+        objects=[valid, invalid],
+    )
+    assert job.status == "pending"
+    assert job.total_count == 2
+    assert job.pending_count == 2
+    pending_job = taxii2_sqldb_api.claim_pending_job(claim_timeout=300)
+    assert pending_job == entities.PendingJob(
+        id=job.id,
+        collection_id=COLLECTIONS[5].id,
+        objects=[valid, invalid],
+        processed_count=0,
+        attempts=1,
+    )
+    # Already claimed
+    assert taxii2_sqldb_api.claim_pending_job(claim_timeout=300) is None
+    # Abandoned claims can be taken over
+    pending_job.attempts = 2
+    assert taxii2_sqldb_api.claim_pending_job(claim_timeout=-1) == pending_job
+    taxii2_sqldb_api.add_job_objects(
+        job_id=job.id,
+        collection_id=COLLECTIONS[5].id,
+        objects=[valid],
+        failures=[],
+    )
+    in_progress = taxii2_sqldb_api.get_job_and_details(API_ROOTS[0].id, job.id)
+    assert in_progress.status == "pending"
+    assert in_progress.success_count == 1
+    assert in_progress.pending_count == 1
+    taxii2_sqldb_api.add_job_objects(
+        job_id=job.id,
+        collection_id=COLLECTIONS[5].id,
+        objects=[],
+        failures=[(invalid, "Invalid stix object")],
+    )
+    taxii2_sqldb_api.complete_job(job.id)
+    done = taxii2_sqldb_api.get_job_and_details(API_ROOTS[0].id, job.id)
+    assert done.status == "complete"
+    assert isinstance(done.completed_timestamp, datetime.datetime)
+    assert (done.success_count, done.failure_count, done.pending_count) == (1, 1, 0)
+    assert [detail.stix_id for detail in done.details.success] == [valid["id"]]
+    assert [(detail.stix_id, detail.message) for detail in done.details.failure] == [
+        (invalid["id"], "Invalid stix object")
+    ]
+    assert (
+        taxii2_sqldb_api.db.session.query(STIXObject)
+        .filter(STIXObject.id == valid["id"])
+        .count()
+        == 1
+    )
+    assert taxii2_sqldb_api.claim_pending_job(claim_timeout=-1) is None
+
+
 @pytest.mark.parametrize(
     "stix_id, date_added, next_param",
     [
@@ -1461,3 +1703,199 @@ def test_next_param(
         "id": stix_id,
         "date_added": date_added,
     }
+
+
+def test_next_param_with_version(taxii2_sqldb_api: Taxii2SQLDatabaseAPI):
+    kwargs = {
+        "id": "indicator--fa641b92-94d7-42dd-aa0e-63cfe1ee148a",
+        "date_added": datetime.datetime(
+            2022, 2, 4, 18, 40, 6, 297204, tzinfo=datetime.timezone.utc
+        ),
+        "version": datetime.datetime(2022, 2, 4, tzinfo=datetime.timezone.utc),
+    }
+    next_param = taxii2_sqldb_api.get_next_param(kwargs)
+    assert taxii2_sqldb_api.parse_next_param(next_param) == kwargs
+
+
+def test_paginate_versions_added_together(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_collections,
+):
+    obj_id = "indicator--a3b1f4e6-0c6e-4a4b-8c39-3cbbf1b0e5a4"
+    versions = [
+        {
+            "type": "indicator",
+            "spec_version": "2.1",
+            "id": obj_id,
+            "created": "2020-01-01T00:00:00.000Z",
+            "modified": f"2020-01-0{day}T00:00:00.000Z",
+        }
+        for day in (1, 2, 3)
+    ]
+    # one envelope, so all versions have the same date_added
+    taxii2_sqldb_api.add_objects(
+        api_root_id=API_ROOTS[0].id,
+        collection_id=COLLECTIONS[5].id,
+        objects=versions,
+    )
+    expected = [get_object_version(obj) for obj in versions]
+
+    for method in (
+        taxii2_sqldb_api.get_objects,
+        taxii2_sqldb_api.stream_objects,
+        functools.partial(taxii2_sqldb_api.get_object, object_id=obj_id),
+    ):
+        seen = []
+        next_kwargs = None
+        while True:
+            objects, more, next_param, *_ = method(
+                collection_id=COLLECTIONS[5].id,
+                limit=1,
+                next_kwargs=next_kwargs,
+                match_version=["all"],
+            )
+            seen.extend(obj.version for obj in objects)
+            if not more:
+                break
+            next_kwargs = taxii2_sqldb_api.parse_next_param(next_param)
+        assert seen == expected, method
+
+    versions_page, more = taxii2_sqldb_api.get_versions(
+        collection_id=COLLECTIONS[5].id,
+        object_id=obj_id,
+        limit=2,
+    )
+    assert more
+    assert [record.version for record in versions_page] == expected[:2]
+
+
+def test_raw_objects(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_collections,
+):
+    objects = [
+        obj.as_taxii2_dict()
+        for obj in STIX_OBJECTS
+        if obj.collection_id == COLLECTIONS[5].id
+    ]
+    taxii2_sqldb_api.add_objects(API_ROOTS[0].id, COLLECTIONS[4].id, objects)
+    with patch.object(taxii2_sqldb_api, "raw_objects", True):
+        taxii2_sqldb_api.add_objects(API_ROOTS[0].id, COLLECTIONS[5].id, objects)
+    expected, _, _ = taxii2_sqldb_api.get_objects(
+        COLLECTIONS[4].id, match_version=["all"]
+    )
+    stored, _, _ = taxii2_sqldb_api.get_objects(
+        COLLECTIONS[5].id, match_version=["all"]
+    )
+    assert all(obj.raw_data is None for obj in expected)
+    assert all(obj.serialized_data is None for obj in stored)
+    assert sorted((obj.as_taxii2_dict() for obj in stored), key=json.dumps) == sorted(
+        (obj.as_taxii2_dict() for obj in expected), key=json.dumps
+    )
+    assert sorted(json.loads(obj.raw_data)["id"] for obj in stored) == sorted(
+        obj["id"] for obj in objects
+    )
+
+
+def test_recompress_objects(
+    taxii2_sqldb_api: Taxii2SQLDatabaseAPI,
+    db_stix_objects,
+):
+    def stored():
+        objects, _, _ = taxii2_sqldb_api.get_objects(
+            COLLECTIONS[5].id, match_version=["all"]
+        )
+        return sorted(objects, key=lambda obj: (obj.id, obj.version))
+
+    def stored_raw_data():
+        return [
+            raw_data
+            for (raw_data,) in taxii2_sqldb_api.db.session.query(
+                type_coerce(STIXObject.raw_data, LargeBinary)
+            )
+        ]
+
+    expected = [obj.as_taxii2_dict() for obj in stored()]
+    number_of_objects = len(stored_raw_data())
+    with (
+        patch.object(taxii2_sqldb_api, "raw_objects", True),
+        patch.object(taxii2_sqldb_api, "compression", "zlib"),
+    ):
+        assert taxii2_sqldb_api.recompress_objects(batch_size=2) == number_of_objects
+        assert taxii2_sqldb_api.recompress_objects(batch_size=2) == 0
+    assert all(is_compressed(raw_data) for raw_data in stored_raw_data())
+    objects = stored()
+    assert all(obj.serialized_data is None for obj in objects)
+    assert [obj.as_taxii2_dict() for obj in objects] == expected
+
+    assert taxii2_sqldb_api.recompress_objects() == number_of_objects
+    assert stored_raw_data() == [None] * number_of_objects
+    assert [obj.as_taxii2_dict() for obj in stored()] == expected
+
+
+def test_collection_watermark(taxii2_sqldb_api: Taxii2SQLDatabaseAPI, db_api_roots):
+    collection = taxii2_sqldb_api.add_collection(API_ROOTS[0].id, "watermarked")
+    versions = [
+        {
+            "type": "malware",
+            "spec_version": "2.1",
+            "id": "malware--31b940d4-6f7f-459a-80ea-9c1f17b5891b",
+            "is_family": True,
+            "created": "2016-04-06T20:07:09.000Z",
+            "modified": f"2016-04-0{day}T20:07:09.000Z",
+            "name": "Poison Ivy",
+        }
+        for day in (7, 8)
+    ]
+
+    def watermark():
+        watermark = taxii2_sqldb_api.get_collection_watermark(collection.id)
+        return watermark.date_added, watermark.count, watermark.sequence
+
+    def assert_past_watermark(**kwargs):
+        with patch.object(
+            taxii2_sqldb_api, "_filtered_objects_query", side_effect=AssertionError
+        ):
+            assert taxii2_sqldb_api.get_objects(collection.id, **kwargs) == (
+                [],
+                False,
+                None,
+            )
+            assert taxii2_sqldb_api.get_manifest(collection.id, **kwargs) == ([], False)
+
+    assert watermark() == (None, 0, 0)
+    assert_past_watermark()
+
+    taxii2_sqldb_api.add_objects(API_ROOTS[0].id, collection.id, versions)
+    objects, _, _ = taxii2_sqldb_api.get_objects(collection.id, match_version=["all"])
+    date_added = objects[0].date_added
+    assert watermark() == (date_added, 2, 1)
+    assert_past_watermark(added_after=date_added)
+    assert_past_watermark(
+        next_kwargs={
+            "date_added": date_added + datetime.timedelta(microseconds=1),
+            "id": "",
+        }
+    )
+    assert taxii2_sqldb_api.get_objects(
+        collection.id, added_after=date_added - datetime.timedelta(seconds=1)
+    )[0]
+    assert taxii2_sqldb_api.get_objects(
+        collection.id, next_kwargs={"date_added": date_added, "id": ""}
+    )[0]
+
+    # already stored versions do not count
+    taxii2_sqldb_api.add_objects(API_ROOTS[0].id, collection.id, versions)
+    assert watermark() == (date_added, 2, 1)
+
+    taxii2_sqldb_api.delete_object(
+        collection.id, versions[0]["id"], match_version=["first"]
+    )
+    assert watermark() == (date_added, 1, 2)
+
+    taxii2_sqldb_api.db.session.query(CollectionWatermark).delete()
+    taxii2_sqldb_api.db.session.commit()
+    # without a watermark row, the watermark is computed
+    assert watermark() == (date_added, 1, None)
+    assert taxii2_sqldb_api.backfill_watermarks() == 1
+    assert watermark() == (date_added, 1, 1)
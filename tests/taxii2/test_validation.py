@@ -1,10 +1,11 @@
 import json
 import platform
+from concurrent.futures import ProcessPoolExecutor
 
 import pytest
 
 from opentaxii.taxii2.exceptions import ValidationError
-from opentaxii.taxii2.validation import validate_envelope
+from opentaxii.taxii2.validation import validate_envelope, validate_object
 from tests.utils import conditional
 
 BROKEN_INDICATOR = json.dumps(
@@ -93,13 +94,150 @@ else:
         (
             CUSTOM_TYPE,
             True,
+            True,
+            'Invalid stix object: {"type": "mytype"}; '
+            "Missing or invalid 'id' property",
+        ),
+        (
+            json.dumps(
+                {
+                    "objects": [
+                        {
+                            "type": "mytype",
+                            "id": "mytype--1",
+                            "spec_version": "2.1",
+                            "modified": "2020-01-01T00:00:00Z",
+                        }
+                    ]
+                }
+            ),
+            True,
+            True,
+            'Invalid stix object: {"type": "mytype", "id": "mytype--1", '
+            '"spec_version": "2.1", "modified": "2020-01-01T00:00:00Z"}; '
+            "Invalid 'modified' property, must be formatted as "
+            "'YYYY-MM-DDTHH:MM:SS.sssZ'",
+        ),
+        (
+            json.dumps(
+                {
+                    "objects": [
+                        {
+                            "type": "mytype",
+                            "id": "mytype--1",
+                            "spec_version": "2.1",
+                        }
+                    ]
+                }
+            ),
+            True,
             False,
             "",
         ),
+        (
+            json.dumps({"objects": {"type": "mytype"}}),
+            True,
+            True,
+            "Objects must be a list of json objects",
+        ),
+        (
+            json.dumps({"objects": [{"id": "mytype--1"}]}),
+            True,
+            True,
+            'Invalid stix object: {"id": "mytype--1"}; '
+            "Missing or invalid 'type' property",
+        ),
+        (
+            json.dumps({"objects": [{"type": "mytype", "id": "other--1"}]}),
+            True,
+            True,
+            'Invalid stix object: {"type": "mytype", "id": "other--1"}; '
+            "Invalid 'id' property, must start with 'mytype--'",
+        ),
     ],
 )
 def test_validate_envelope(json_data, allow_custom, raises, message):
     with conditional(raises, pytest.raises(ValidationError)) as exception:
-        validate_envelope(json_data, allow_custom)
+        envelope = validate_envelope(json_data, allow_custom)
     if raises:
         assert str(exception.value) == message
+    else:
+        assert envelope == json.loads(json_data)
+
+
+def test_validate_envelope_parallel():
+    objects = json.loads(GOOD_INDICATOR_WITH_CONTEXT)["objects"] * 200
+    broken = json.loads(BROKEN_INDICATOR)["objects"][0]
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        envelope = validate_envelope(
+            json.dumps({"objects": objects}), executor=executor, parallel_threshold=1
+        )
+        assert envelope == {"objects": objects}
+
+        data = json.dumps({"objects": objects[:-1] + [broken] + objects})
+        with pytest.raises(ValidationError) as expected:
+            validate_envelope(data)
+        with pytest.raises(ValidationError) as exception:
+            validate_envelope(data, executor=executor, parallel_threshold=1)
+    assert str(exception.value) == str(expected.value)
+
+
+INCOMPLETE_INDICATOR = {
+    "type": "indicator",
+    "spec_version": "2.1",
+    "id": "indicator--c410e480-e42b-47d1-9476-85307c12bcbf",
+    "created": "2016-04-06T20:03:48.000Z",
+    "modified": "2016-04-06T20:03:48.000Z",
+}
+
+
+@pytest.mark.parametrize(
+    ["obj", "level", "error"],
+    [
+        pytest.param(INCOMPLETE_INDICATOR, "full", "No values for required", id="full"),
+        pytest.param(INCOMPLETE_INDICATOR, "structural", None, id="structural"),
+        pytest.param(INCOMPLETE_INDICATOR, "none", None, id="none"),
+        pytest.param(
+            {**INCOMPLETE_INDICATOR, "id": "indicator--1"},
+            "structural",
+            "Invalid 'id' property, must be 'indicator--<uuid>'",
+            id="structural, bad id",
+        ),
+        pytest.param(
+            {**INCOMPLETE_INDICATOR, "id": "indicator--1"},
+            "none",
+            None,
+            id="none, bad id",
+        ),
+        pytest.param(
+            {**INCOMPLETE_INDICATOR, "type": "Indicator"},
+            "structural",
+            "Invalid 'type' property",
+            id="structural, bad type",
+        ),
+        pytest.param(
+            {**INCOMPLETE_INDICATOR, "spec_version": "3.0"},
+            "structural",
+            "Unsupported 'spec_version' property",
+            id="structural, bad spec_version",
+        ),
+        pytest.param(
+            {k: v for k, v in INCOMPLETE_INDICATOR.items() if k != "spec_version"},
+            "none",
+            "Missing or invalid 'spec_version' property",
+            id="none, no spec_version",
+        ),
+        pytest.param(
+            {**INCOMPLETE_INDICATOR, "modified": "2016-04-06"},
+            "none",
+            "Invalid 'modified' property",
+            id="none, bad modified",
+        ),
+    ],
+)
+def test_validate_object_levels(obj, level, error):
+    with conditional(error, pytest.raises(ValidationError)) as exception:
+        validate_object(obj, level=level)
+    if error:
+        assert str(exception.value).startswith("Invalid stix object")
+        assert error in str(exception.value)
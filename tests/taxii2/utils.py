@@ -377,9 +377,10 @@ def GET_MANIFEST_MOCK(
 
 
 def GET_NEXT_PARAM(kwargs: Dict) -> str:
-    return base64.b64encode(
-        f"{kwargs['date_added'].isoformat()}|{kwargs['id']}".encode("utf-8")
-    ).decode()
+    value = f"{kwargs['date_added'].isoformat()}|{kwargs['id']}"
+    if kwargs.get("version") is not None:
+        value = f"{value}|{kwargs['version'].isoformat()}"
+    return base64.b64encode(value.encode("utf-8")).decode()
 
 
 def GET_OBJECTS_MOCK(
@@ -424,7 +425,11 @@ def GET_OBJECTS_MOCK(
             response.append(stix_object)
     if more:
         next_param = GET_NEXT_PARAM(
-            {"id": response[-1].id, "date_added": response[-1].date_added}
+            {
+                "id": response[-1].id,
+                "date_added": response[-1].date_added,
+                "version": response[-1].version,
+            }
         )
     else:
         next_param = None
@@ -472,7 +477,11 @@ def GET_OBJECT_MOCK(
             response.append(stix_object)
     if more:
         next_param = GET_NEXT_PARAM(
-            {"id": response[-1].id, "date_added": response[-1].date_added}
+            {
+                "id": response[-1].id,
+                "date_added": response[-1].date_added,
+                "version": response[-1].version,
+            }
         )
     else:
         next_param = None
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from flask import Flask, request
+
+from opentaxii.common.asgi import ASGIAdapter, build_environ
+
+
+def http_scope(path, method="GET", query_string=b"", headers=(), raw_path=None):
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "query_string": query_string,
+        "root_path": "",
+        "headers": [(name.lower(), value) for name, value in headers],
+        "server": ("localhost", 9000),
+        "client": ("127.0.0.1", 12345),
+    }
+    if raw_path is not None:
+        scope["raw_path"] = raw_path
+    return scope
+
+
+def call(adapter, scope, body_chunks=(b"",), disconnect_after=None):
+    """Call ``adapter`` and collect the messages it sends."""
+    sent = []
+
+    async def run():
+        messages = [
+            {
+                "type": "http.request",
+                "body": chunk,
+                "more_body": index < len(body_chunks) - 1,
+            }
+            for index, chunk in enumerate(body_chunks)
+        ]
+        disconnected = asyncio.Event()
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if disconnect_after is not None and len(sent) >= disconnect_after:
+                disconnected.set()
+            # a slow client
+            await asyncio.sleep(0)
+
+        await adapter(scope, receive, send)
+
+    asyncio.run(run())
+    return sent
+
+
+def response_of(sent):
+    start = sent[0]
+    assert start["type"] == "http.response.start"
+    assert not sent[-1].get("more_body", False)
+    headers = {name.decode(): value.decode() for name, value in start["headers"]}
+    return start["status"], headers, b"".join(m["body"] for m in sent[1:])
+
+
+@pytest.fixture()
+def echo_app():
+    app = Flask(__name__)
+
+    @app.route("/echo/<name>", methods=["GET", "POST"])
+    def echo(name):
+        return {
+            "name": name,
+            "args": request.args.to_dict(),
+            "body": request.get_data().decode(),
+            "content_type": request.content_type,
+            "accept": request.headers.get("Accept"),
+        }
+
+    return app
+
+
+def test_build_environ():
+    scope = http_scope(
+        "/a b",
+        query_string=b"x=1",
+        headers=[(b"Accept", b"a"), (b"Accept", b"b"), (b"Content-Length", b"9")],
+    )
+    environ = build_environ(scope, b"body")
+    assert environ["PATH_INFO"] == "/a b"
+    assert environ["QUERY_STRING"] == "x=1"
+    assert environ["HTTP_ACCEPT"] == "a,b"
+    assert environ["CONTENT_LENGTH"] == "4"
+    assert environ["wsgi.input"].read() == b"body"
+    scope = http_scope("/root/echo/ü x", raw_path=b"/root/echo/%C3%BC%20x", headers=[])
+    scope["root_path"] = "/root"
+    environ = build_environ(scope, b"")
+    assert environ["SCRIPT_NAME"] == "/root"
+    assert environ["PATH_INFO"] == "/echo/ü x".encode("utf-8").decode("latin-1")
+
+
+@pytest.mark.parametrize(
+    "raw_path", [None, b"/echo/%C3%BCnicode%20x", b"/echo/\xc3\xbcnicode x"]
+)
+def test_request(echo_app, raw_path):
+    adapter = ASGIAdapter(echo_app.wsgi_app, threads=2)
+    sent = call(
+        adapter,
+        http_scope(
+            "/echo/ünicode x",
+            method="POST",
+            query_string=b"q=1",
+            headers=[(b"Content-Type", b"text/plain"), (b"Accept", b"*/*")],
+            raw_path=raw_path,
+        ),
+        body_chunks=(b"hello ", b"world"),
+    )
+    status, headers, body = response_of(sent)
+    assert status == 200
+    assert headers["content-type"] == "application/json"
+    assert json.loads(body) == {
+        "name": "ünicode x",
+        "args": {"q": "1"},
+        "body": "hello world",
+        "content_type": "text/plain",
+        "accept": "*/*",
+    }
+    adapter.shutdown()
+
+
+def test_request_too_large(echo_app):
+    adapter = ASGIAdapter(echo_app.wsgi_app, max_request_size=8)
+    sent = call(
+        adapter,
+        http_scope("/echo/x", method="POST"),
+        body_chunks=(b"hello ", b"world"),
+    )
+    assert response_of(sent)[0] == 413
+    assert adapter._executor is None
+
+
+def test_streamed_response():
+    chunks = [b"chunk %d," % i for i in range(100)]
+    app = Flask(__name__)
+    app.add_url_rule("/", "stream", lambda: app.response_class(iter(chunks)))
+    adapter = ASGIAdapter(app.wsgi_app, response_buffer=1)
+    status, _, body = response_of(call(adapter, http_scope("/")))
+    assert status == 200
+    assert body == b"".join(chunks)
+    adapter.shutdown()
+
+
+def test_disconnect_stops_response():
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                yield b"chunk"
+        finally:
+            closed.set()
+
+    app = Flask(__name__)
+    app.add_url_rule("/", "stream", lambda: app.response_class(endless()))
+    adapter = ASGIAdapter(app.wsgi_app, response_buffer=2)
+    sent = call(adapter, http_scope("/"), disconnect_after=5)
+    assert sent[0]["status"] == 200
+    assert closed.is_set()
+    adapter.shutdown()
+
+
+def test_lifespan(echo_app):
+    adapter = ASGIAdapter(echo_app.wsgi_app)
+    adapter.executor
+    sent = []
+
+    async def run():
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await adapter({"type": "lifespan"}, receive, send)
+
+    asyncio.run(run())
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert adapter._executor is None
+
+
+def test_taxii2(app, db_api_roots):
+    adapter = ASGIAdapter(app.wsgi_app)
+    sent = call(
+        adapter,
+        http_scope(
+            "/taxii2/",
+            headers=[(b"Accept", b"application/taxii+json;version=2.1")],
+        ),
+    )
+    status, headers, body = response_of(sent)
+    assert status == 200
+    assert headers["content-type"] == "application/taxii+json;version=2.1"
+    assert "api_roots" in json.loads(body)
+    adapter.shutdown()
@@ -1,6 +1,9 @@
+from unittest import mock
+
 import pytest
 
 from opentaxii.auth.sqldb.models import Account
+from opentaxii.entities import Account as AccountEntity
 
 
 def test_account_permissions(app):
@@ -32,3 +35,45 @@ def test_account_permissions(app):
         match=r"Unknown TAXII2 permission '\['read', 'bad'\]' specified for collection 'taxii2-fail'",
     ):
         account.permissions = {"taxii2-fail": ["read", "bad"]}
+
+
+def test_account_cache(app):
+    api = app.taxii_server.auth.api
+    api.create_account("cached", "secret")
+    token = api.authenticate("cached", "secret")
+
+    account = api.get_account(token)
+    assert account.username == "cached"
+    assert account.permissions == {}
+    # changes of a caller do not leak into the cache
+    account.permissions["taxii2-read"] = ["read"]
+    assert api.get_account(token).permissions == {}
+    assert api.account_cache.hits == 1
+
+    api.update_account(
+        AccountEntity(None, "cached", {"taxii2-write": ["write"]}, is_admin=False)
+    )
+    assert api.get_account(token).permissions == {"taxii2-write": ["write"]}
+
+    api.delete_account("cached")
+    assert api.get_account(token) is None
+
+
+def test_credentials_cache(app):
+    api = app.taxii_server.auth.api
+    account = api.create_account("cached", "secret")
+    token = api.authenticate("cached", "secret")
+    assert token
+
+    with mock.patch.object(Account, "is_password_valid") as is_password_valid:
+        assert api.authenticate("cached", "secret") == token
+    is_password_valid.assert_not_called()
+    assert (api.credentials_cache.hits, api.credentials_cache.misses) == (1, 1)
+
+    assert api.authenticate("cached", "wrong") is None
+    assert api.authenticate("other", "secret") is None
+    assert len(api.credentials_cache) == 1
+
+    api.update_account(account, password="changed")
+    assert api.authenticate("cached", "secret") is None
+    assert api.authenticate("cached", "changed")
@@ -0,0 +1,36 @@
+from unittest import mock
+
+from opentaxii.common.cache import TTLCache
+
+
+def test_ttl_cache_lru():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert (cache.hits, cache.misses) == (3, 1)
+    cache.clear()
+    assert cache.get("a") is None
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(maxsize=2, ttl=60)
+    with mock.patch("opentaxii.common.cache.time.time", return_value=1000):
+        cache.set("a", 1)
+        cache.set("b", 2, expires_at=1010)
+    with mock.patch("opentaxii.common.cache.time.time", return_value=1030):
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+    with mock.patch("opentaxii.common.cache.time.time", return_value=1060):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_disabled():
+    cache = TTLCache(maxsize=2, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
@@ -7,9 +7,14 @@ from opentaxii.cli.auth import create_account, update_account
 from opentaxii.cli.persistence import (
     add_api_root,
     add_collection,
+    backfill_version_flags,
+    backfill_watermarks,
     delete_content_blocks,
     job_cleanup,
+    recompress,
+    run_job_worker,
     sync_data_configuration,
+    upgrade_db,
 )
 from tests.fixtures import ACCOUNT, COLLECTION_OPEN
 from tests.taxii2.utils import API_ROOTS
@@ -629,3 +634,99 @@ def test_job_cleanup(app, capsys):
         captured = capsys.readouterr()
         assert captured.out == "2 removed\n"
         assert captured.err == ""
+
+
+def test_upgrade_db(app, capsys):
+    with (
+        mock.patch("opentaxii.cli.persistence.app", app),
+        mock.patch.object(
+            app.taxii_server.servers.taxii2.persistence.api,
+            "upgrade_schema",
+            return_value=["raw_data"],
+        ) as mock_upgrade,
+    ):
+        upgrade_db()
+        mock_upgrade.assert_called_once_with()
+        captured = capsys.readouterr()
+        assert captured.out == "raw_data added\n1 columns and indexes added\n"
+        assert captured.err == ""
+
+
+def test_backfill_version_flags(app, capsys):
+    with (
+        mock.patch("opentaxii.cli.persistence.app", app),
+        mock.patch.object(
+            app.taxii_server.servers.taxii2.persistence.api,
+            "backfill_version_flags",
+            return_value=3,
+        ) as mock_backfill,
+    ):
+        backfill_version_flags()
+        mock_backfill.assert_called_once_with()
+        captured = capsys.readouterr()
+        assert captured.out == "3 objects processed\n"
+        assert captured.err == ""
+
+
+def test_backfill_watermarks(app, capsys):
+    with (
+        mock.patch("opentaxii.cli.persistence.app", app),
+        mock.patch.object(
+            app.taxii_server.servers.taxii1.persistence.api,
+            "backfill_watermarks",
+            return_value=2,
+        ) as mock_taxii1,
+        mock.patch.object(
+            app.taxii_server.servers.taxii2.persistence.api,
+            "backfill_watermarks",
+            return_value=3,
+        ) as mock_taxii2,
+    ):
+        backfill_watermarks()
+        mock_taxii1.assert_called_once_with()
+        mock_taxii2.assert_called_once_with()
+        captured = capsys.readouterr()
+        assert captured.out == (
+            "2 taxii1 collections processed\n3 taxii2 collections processed\n"
+        )
+        assert captured.err == ""
+
+
+def test_run_job_worker(app):
+    job_ids = [API_ROOTS[0].id, None]
+    with (
+        mock.patch("opentaxii.cli.persistence.app", app),
+        mock.patch("sys.argv", ["prog", "--once"]),
+        mock.patch.object(
+            app.taxii_server.servers.taxii2,
+            "process_pending_job",
+            side_effect=job_ids,
+        ) as mock_process,
+    ):
+        run_job_worker()
+        assert mock_process.call_count == 2
+
+
+def test_recompress(app, capsys):
+    with (
+        mock.patch("opentaxii.cli.persistence.app", app),
+        mock.patch("sys.argv", ["prog", "--batch-size", "10"]),
+        mock.patch.object(
+            app.taxii_server.servers.taxii1.persistence.api,
+            "recompress_content_blocks",
+            return_value=2,
+        ) as mock_content_blocks,
+        mock.patch.object(
+            app.taxii_server.servers.taxii2.persistence.api,
+            "recompress_objects",
+            return_value=3,
+        ) as mock_objects,
+    ):
+        recompress()
+        mock_content_blocks.assert_called_once_with(batch_size=10)
+        mock_objects.assert_called_once_with(batch_size=10)
+        captured = capsys.readouterr()
+        assert captured.out == (
+            "2 content blocks rewritten\n3 stix objects rewritten\n"
+        )
+        assert captured.err == ""
@@ -0,0 +1,131 @@
+import datetime
+import zlib
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import LargeBinary, type_coerce
+
+from opentaxii.persistence.sqldb.compression import (
+    DICTIONARIES,
+    MAGIC,
+    compress,
+    decompress,
+    is_compressed,
+    is_compressed_with,
+)
+from opentaxii.persistence.sqldb.models import ContentBlock
+from opentaxii.taxii.entities import ContentBindingEntity, ContentBlockEntity
+
+from .fixtures import CB_STIX_XML_111
+
+CONTENT = (
+    b'<stix:STIX_Package xmlns:stix="http://stix.mitre.org/stix-1" version="1.1.1">'
+    b"<stix:Indicators><stix:Indicator>" + b"x" * 100 + b"</stix:Indicator>"
+    b"</stix:Indicators></stix:STIX_Package>"
+)
+
+
+@pytest.mark.parametrize("dictionary_id", list(DICTIONARIES))
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_compress(codec, dictionary_id):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    compressed = compress(CONTENT, codec, dictionary_id)
+    assert is_compressed(compressed)
+    assert is_compressed_with(compressed, codec, dictionary_id)
+    assert not is_compressed_with(CONTENT, codec, dictionary_id)
+    assert len(compressed) < len(CONTENT)
+    assert decompress(compressed) == CONTENT
+    # compressed values are payloads like any other
+    assert decompress(compress(compressed, codec, dictionary_id)) == compressed
+    assert decompress(compress(compressed, None)) == compressed
+
+
+def test_decompress_uncompressed():
+    assert not is_compressed(CONTENT)
+    assert is_compressed_with(CONTENT, None, 0)
+    assert decompress(CONTENT) == CONTENT
+    assert decompress(b"") == b""
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        MAGIC,
+        MAGIC + b"\x09\x00hello",
+        MAGIC + b"z\x00" + zlib.compress(b"hello"),
+        MAGIC + b"n\x00hello",
+    ],
+)
+def test_payload_starting_with_magic(value):
+    stored = compress(value, None)
+    assert stored != value
+    assert not is_compressed(stored)
+    assert is_compressed_with(stored, None, 0)
+    assert decompress(stored) == value
+    assert decompress(compress(value, "zlib")) == value
+
+
+def test_decompress_unknown_header():
+    # not written by compress, returned as stored
+    assert decompress(MAGIC + b"\x09\x00hello") == MAGIC + b"\x09\x00hello"
+    assert decompress(MAGIC + b"z\xff") == MAGIC + b"z\xff"
+
+
+def test_decompress_max_size():
+    compressed = compress(b"x" * 2048, "zlib")
+    assert decompress(compressed, max_size=2048) == b"x" * 2048
+    with pytest.raises(ValueError):
+        decompress(compressed, max_size=1024)
+
+
+def test_compress_invalid_codec():
+    with pytest.raises(ValueError):
+        compress(CONTENT, "nope")
+
+
+def test_compressed_content_blocks(server):
+    api = server.servers.taxii1.persistence.api
+    stored_content = type_coerce(ContentBlock.content, LargeBinary)
+    block = ContentBlockEntity(
+        content=CONTENT,
+        timestamp_label=datetime.datetime.now(datetime.timezone.utc),
+        content_binding=ContentBindingEntity(CB_STIX_XML_111),
+    )
+    uncompressed = api.create_content_block(block)
+    with patch.object(api, "compression", "zlib"):
+        compressed = api.create_content_block(block)
+    assert uncompressed.content == compressed.content == CONTENT
+    assert [block.content for block in api.get_content_blocks(None)] == [
+        CONTENT,
+        CONTENT,
+    ]
+    stored = dict(api.db.session.query(ContentBlock.id, stored_content))
+    assert stored[uncompressed.id] == CONTENT
+    assert is_compressed_with(stored[compressed.id], "zlib", 2)
+
+    with patch.object(api, "compression", "zlib"):
+        assert api.recompress_content_blocks(batch_size=1) == 1
+    stored = dict(api.db.session.query(ContentBlock.id, stored_content))
+    assert all(is_compressed(content) for content in stored.values())
+
+    assert api.recompress_content_blocks(batch_size=1) == 2
+    stored = dict(api.db.session.query(ContentBlock.id, stored_content))
+    assert list(stored.values()) == [CONTENT, CONTENT]
+
+
+def test_content_block_starting_with_magic(server):
+    api = server.servers.taxii1.persistence.api
+    content = MAGIC + b"\x09\x00hello"
+    block = api.create_content_block(
+        ContentBlockEntity(
+            content=content,
+            timestamp_label=datetime.datetime.now(datetime.timezone.utc),
+            content_binding=ContentBindingEntity(CB_STIX_XML_111),
+        )
+    )
+    assert block.content == content
+    assert [block.content for block in api.get_content_blocks(None)] == [content]
+    with patch.object(api, "compression", "zlib"):
+        assert api.recompress_content_blocks() == 1
+    assert [block.content for block in api.get_content_blocks(None)] == [content]
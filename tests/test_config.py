@@ -66,6 +66,16 @@ DEFAULT_BASE_VALUES = {
     "domain": "localhost:9000",
     "support_basic_auth": True,
     "return_server_error_details": False,
+    "http_compression": {
+        "responses": False,
+        "requests": True,
+        "min_size": 1024,
+        "level": 6,
+        "max_request_size": 209715200,
+    },
+    "asgi": {"threads": 32, "max_request_size": 209715200, "response_buffer": 16},
+    "metrics": False,
+    "query_profiler": {"enabled": False, "max_queries": 100, "max_duration_ms": 1000},
     "logging": {"opentaxii": "info", "root": "info"},
     "auth_api": {
         "class": "other.test.AuthClass",
@@ -84,6 +94,7 @@ DEFAULT_TAXII1_VALUES = {
     "unauthorized_status": "UNAUTHORIZED",
     "hooks": None,
     "count_blocks_in_poll_responses": False,
+    "services_cache_ttl": 60,
 }
 DEFAULT_TAXII2_VALUES = {
     "persistence_api": {
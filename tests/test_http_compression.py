@@ -0,0 +1,142 @@
+import gzip
+import zlib
+from unittest.mock import patch
+
+import pytest
+from flask import Flask
+from libtaxii.constants import ST_SUCCESS
+
+from opentaxii.common.http_compression import CompressionMiddleware
+
+from .fixtures import DISCOVERY_A, INBOX_A, MESSAGE_ID
+from .utils import as_tm, prepare_headers
+
+
+@pytest.fixture()
+def compression(app):
+    with patch.multiple(app.wsgi_app, responses=True, min_size=0):
+        yield app.wsgi_app
+
+
+@pytest.mark.parametrize(
+    ["accept_encoding", "expected"],
+    [
+        (None, None),
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("deflate, gzip", "gzip"),
+        ("gzip;q=0.5, deflate", "deflate"),
+        ("gzip;q=0, deflate;q=0", None),
+        ("*", "gzip"),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    with patch("opentaxii.common.http_compression._brotli", return_value=None):
+        middleware = CompressionMiddleware(None, responses=True)
+    assert middleware.choose_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize(
+    ["encoding", "decompress"],
+    [("gzip", gzip.decompress), ("deflate", zlib.decompress)],
+)
+def test_taxii1_response(client, services, compression, encoding, decompress):
+    version = 11
+    headers = prepare_headers(version, https=False)
+    request = as_tm(version).DiscoveryRequest(message_id=MESSAGE_ID)
+    response = client.post(
+        DISCOVERY_A["address"],
+        data=request.to_xml(),
+        headers={**headers, "Accept-Encoding": encoding},
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == encoding
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) == len(response.data)
+    message = as_tm(version).get_message_from_xml(decompress(response.data))
+    assert isinstance(message, as_tm(version).DiscoveryResponse)
+
+
+def test_response_not_compressed(client, services, compression):
+    headers = prepare_headers(11, https=False)
+    request = as_tm(11).DiscoveryRequest(message_id=MESSAGE_ID).to_xml()
+    response = client.post(DISCOVERY_A["address"], data=request, headers=headers)
+    assert "Content-Encoding" not in response.headers
+    with patch.object(compression, "min_size", 1024 * 1024):
+        response = client.post(
+            DISCOVERY_A["address"],
+            data=request,
+            headers={**headers, "Accept-Encoding": "gzip"},
+        )
+    assert "Content-Encoding" not in response.headers
+    as_tm(11).get_message_from_xml(response.data)
+
+
+def test_taxii1_inbox_gzip_request(client, services):
+    version = 11
+    headers = prepare_headers(version, https=False)
+    message = as_tm(version).InboxMessage(message_id=MESSAGE_ID)
+    response = client.post(
+        INBOX_A["address"],
+        data=gzip.compress(message.to_xml()),
+        headers={**headers, "Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    message = as_tm(version).get_message_from_xml(response.data)
+    assert message.status_type == ST_SUCCESS
+    assert message.in_response_to == MESSAGE_ID
+
+
+@pytest.mark.parametrize(
+    ["content_encoding", "body", "expected_status_code"],
+    [
+        pytest.param("br", b"body", 415, id="unsupported"),
+        pytest.param("gzip", b"not gzip", 400, id="invalid"),
+        pytest.param("gzip", gzip.compress(b"body")[:-10], 400, id="truncated"),
+        pytest.param("gzip", gzip.compress(b"x" * 2048), 413, id="too large"),
+    ],
+)
+def test_invalid_request_body(
+    client, services, content_encoding, body, expected_status_code
+):
+    with patch.object(client.application.wsgi_app, "max_request_size", 1024):
+        response = client.post(
+            INBOX_A["address"],
+            data=body,
+            headers={
+                **prepare_headers(11, https=False),
+                "Content-Encoding": content_encoding,
+            },
+        )
+    assert response.status_code == expected_status_code
+
+
+def test_taxii2_response(client, db_api_roots, compression):
+    response = client.get(
+        "/taxii2/",
+        headers={
+            "Accept": "application/taxii+json;version=2.1",
+            "Accept-Encoding": "gzip",
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert b'"api_roots"' in gzip.decompress(response.data)
+
+
+def test_streamed_response():
+    chunks = [b"<chunk>%d</chunk>" % i for i in range(100)]
+    app = Flask(__name__)
+    app.add_url_rule(
+        "/",
+        "stream",
+        lambda: app.response_class(iter(chunks), mimetype="application/xml"),
+    )
+    app.wsgi_app = CompressionMiddleware(  # type: ignore[method-assign]
+        app.wsgi_app, responses=True
+    )
+    response = app.test_client().get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(response.data) == b"".join(chunks)
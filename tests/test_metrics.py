@@ -0,0 +1,110 @@
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+
+from opentaxii import metrics
+from opentaxii.entities import Account
+from opentaxii.middleware import create_app
+from tests.taxii2.utils import API_ROOTS, COLLECTIONS
+
+METRICS_PATH = "/management/metrics"
+ADMIN = Account(str(uuid4()), "admin", {}, is_admin=True)
+
+
+@pytest.fixture()
+def metrics_client(app):
+    server = app.taxii_server
+    with patch.dict(server.config, {"metrics": True}):
+        metrics_app = create_app(server)
+        metrics_app.config["TESTING"] = True
+        with patch("opentaxii.middleware._authenticate", return_value=ADMIN):
+            yield metrics_app.test_client()
+
+
+def test_counter_and_histogram():
+    registry = metrics.MetricsRegistry()
+    counter = registry.counter("test_total", "A counter.", ("label",))
+    histogram = registry.histogram("test_seconds", "A histogram.", buckets=(0.1, 1))
+    counter.inc(label='a "quoted"\nvalue')
+    counter.inc(2, label='a "quoted"\nvalue')
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+    assert histogram.get_count() == 4
+    assert registry.render() == (
+        "# HELP test_total A counter.\n"
+        "# TYPE test_total counter\n"
+        'test_total{label="a \\"quoted\\"\\nvalue"} 3\n'
+        "# HELP test_seconds A histogram.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="0.1"} 2\n'
+        'test_seconds_bucket{le="1"} 3\n'
+        'test_seconds_bucket{le="+Inf"} 4\n'
+        "test_seconds_count 4\n"
+        "test_seconds_sum 3.65\n"
+    )
+
+
+def test_metrics_disabled(client):
+    assert client.get(METRICS_PATH).status_code == 404
+
+
+def test_metrics(metrics_client, db_collections):
+    collection = COLLECTIONS[0]
+    labels = {
+        "handler": "collection_handler",
+        "method": "GET",
+        "status": "200",
+        "collection": str(collection.id),
+    }
+    requests = metrics.REQUESTS.get(**labels)
+    durations = metrics.REQUEST_DURATION.get_count(
+        handler="collection_handler", method="GET"
+    )
+    queries = metrics.REQUEST_DB_QUERIES.get_count(handler="collection_handler")
+
+    response = metrics_client.get(
+        f"/taxii2/{API_ROOTS[0].id}/collections/{collection.id}/",
+        headers={"Accept": "application/taxii+json;version=2.1"},
+    )
+    assert response.status_code == 200
+    assert metrics.REQUESTS.get(**labels) == requests + 1
+    assert (
+        metrics.REQUEST_DURATION.get_count(handler="collection_handler", method="GET")
+        == durations + 1
+    )
+    assert (
+        metrics.REQUEST_DB_QUERIES.get_count(handler="collection_handler")
+        == queries + 1
+    )
+
+    response = metrics_client.get(METRICS_PATH)
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    body = response.get_data(as_text=True)
+    assert (
+        'opentaxii_requests_total{handler="collection_handler",method="GET",'
+        f'status="200",collection="{collection.id}"}} {requests + 1}'
+    ) in body
+    assert "# TYPE opentaxii_db_pool_connections gauge" in body
+    assert 'opentaxii_auth_cache_hits_total{cache="account"}' in body
+
+
+def test_metrics_collection_label(metrics_client, db_collections):
+    collection = COLLECTIONS[5]
+    assert collection.alias
+    unknown = str(uuid4())
+    for collection_id_or_alias in (collection.alias, unknown):
+        response = metrics_client.get(
+            f"/taxii2/{API_ROOTS[0].id}/collections/{collection_id_or_alias}/",
+            headers={"Accept": "application/taxii+json;version=2.1"},
+        )
+        assert response.status_code in (200, 404)
+    body = metrics_client.get(METRICS_PATH).get_data(as_text=True)
+    # labeled with the canonical id, and without it for unknown collections
+    assert f'collection="{collection.id}"' in body
+    assert collection.alias not in body
+    assert unknown not in body
+    assert (
+        'handler="collection_handler",method="GET",status="404",collection=""' in body
+    )
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+from uuid import uuid4
+
+import pytest
+
+from opentaxii import profiler
+from opentaxii.entities import Account
+from opentaxii.middleware import create_app
+from tests.taxii2.utils import API_ROOTS, COLLECTIONS
+
+ADMIN = Account(str(uuid4()), "admin", {}, is_admin=True)
+
+
+@pytest.fixture()
+def profiled_client(app):
+    server = app.taxii_server
+    query_profiler = {"enabled": True, "max_queries": 0, "max_duration_ms": None}
+    with patch.dict(server.config, {"query_profiler": query_profiler}):
+        profiled_app = create_app(server)
+        profiled_app.config["TESTING"] = True
+        with patch("opentaxii.middleware._authenticate", return_value=ADMIN):
+            yield profiled_app.test_client()
+
+
+@pytest.mark.parametrize(
+    ["statement", "expected"],
+    [
+        (
+            "SELECT a.id \n  FROM a\n WHERE a.id = %(id_1)s AND a.n > 10",
+            "SELECT a.id FROM a WHERE a.id = ? AND a.n > ?",
+        ),
+        (
+            "SELECT t1.id FROM t1 WHERE t1.name = 'it''s' AND t1.id IN (?, ?, ?)",
+            "SELECT t1.id FROM t1 WHERE t1.name = ? AND t1.id IN (...)",
+        ),
+        (
+            "INSERT INTO a (x, y) VALUES (:x_m0, :y_m0), (:x_m1, :y_m1)",
+            "INSERT INTO a (x, y) VALUES (...)",
+        ),
+        (
+            "SELECT CAST(a.x AS TEXT)::text FROM a LIMIT $1 OFFSET $2",
+            "SELECT CAST(a.x AS TEXT)::text FROM a LIMIT ? OFFSET ?",
+        ),
+    ],
+)
+def test_normalize_sql(statement, expected):
+    assert profiler.normalize_sql(statement) == expected
+
+
+def test_thresholds():
+    with patch("opentaxii.profiler.log") as log:
+        profiler.record_query("SELECT 1", 1)
+        profiler.start_request()
+        profiler.record_query("SELECT 1", 0.001)
+        profiler.finish_request("handler", "GET", max_queries=1)
+        profiler.finish_request("handler", "GET", max_queries=0)
+        log.warning.assert_not_called()
+
+        profiler.start_request()
+        for value in range(3):
+            profiler.record_query(f"SELECT {value}", 0.001)
+        profiler.record_query("SELECT a FROM b", 0.002)
+        profiler.finish_request("handler", "GET", max_duration_ms=4)
+    log.warning.assert_called_once_with(
+        "request.slow_queries",
+        handler="handler",
+        method="GET",
+        queries=4,
+        duration_ms=5.0,
+        statements=[
+            {"sql": "SELECT ?", "count": 3, "duration_ms": 3.0},
+            {"sql": "SELECT a FROM b", "count": 1, "duration_ms": 2.0},
+        ],
+    )
+
+
+def test_slow_request(profiled_client, db_collections):
+    collection = COLLECTIONS[0]
+    with patch("opentaxii.profiler.log") as log:
+        response = profiled_client.get(
+            f"/taxii2/{API_ROOTS[0].id}/collections/{collection.id}/",
+            headers={"Accept": "application/taxii+json;version=2.1"},
+        )
+        response.close()
+    assert response.status_code == 200
+    log.warning.assert_called_once()
+    event = log.warning.call_args[1]
+    assert event["handler"] == "collection_handler"
+    assert event["queries"] >= 1
+    assert any("?" in statement["sql"] for statement in event["statements"])
@@ -1,4 +1,6 @@
 import concurrent.futures
+import re
+from unittest import mock
 
 import pytest
 
@@ -6,6 +8,7 @@ from opentaxii.persistence import OpenTAXII2PersistenceAPI, Taxii2PersistenceMan
 from opentaxii.persistence.sqldb import Taxii2SQLDatabaseAPI
 from opentaxii.server import TAXII2Server
 from opentaxii.taxii.converters import dict_to_service_entity
+from opentaxii.utils import EndpointRouter
 
 from .fixtures import DOMAIN
 
@@ -60,6 +63,30 @@ def test_services_configured(server, local_services):
     assert all([p.address.startswith(DOMAIN) for p in with_paths])
 
 
+def test_services_cached(server, local_services):
+    taxii1 = server.servers.taxii1
+    with mock.patch.object(
+        taxii1.persistence.api,
+        'get_services',
+        wraps=taxii1.persistence.api.get_services,
+    ) as get_services:
+        endpoint = taxii1.get_endpoint('/relative/path')
+        assert endpoint.keywords['endpoint'].id == INBOX['id']
+        assert taxii1.get_endpoint('/relative/unknown') is None
+        assert len(taxii1.get_services()) == len(SERVICES)
+        assert get_services.call_count == 1
+
+        taxii1.persistence.delete_service(INBOX['id'])
+        assert taxii1.get_endpoint('/relative/path') is None
+        assert get_services.call_count == 2
+
+        with mock.patch.dict(taxii1.config, {'services_cache_ttl': 0}):
+            taxii1.invalidate_services()
+            taxii1.get_services()
+            taxii1.get_services()
+        assert get_services.call_count == 4
+
+
 def test_taxii2_configured(server):
     assert server.servers.taxii2 is not None
     assert isinstance(server.servers.taxii2, TAXII2Server)
@@ -88,3 +115,41 @@ def test_multithreaded_access(server, local_services):
         results = [executor.submit(testfunc) for _ in range(2)]
         for result in concurrent.futures.as_completed(results):
             assert not result.exception(timeout=5)
+
+
+@pytest.mark.parametrize(
+    ["path", "expected"],
+    [
+        ('/taxii2/', ('root', {})),
+        ('/taxii2/a/', ('api_root', {'api_root_id': 'a'})),
+        ('/taxii2/a/collections/b/', ('collection', {'api_root_id': 'a', 'id': 'b'})),
+        ('/taxii2/a/a/', ('same', {'x': 'a'})),
+        ('/prefix/anything', ('prefix', {})),
+        ('/taxii2/a/b/c/', None),
+        ('/other', None),
+    ],
+)
+def test_endpoint_router(path, expected):
+    mapping = [
+        (r'^/taxii2/$', 'root'),
+        (r'^/taxii2/(?P<api_root_id>[^/]+)/$', 'api_root'),
+        (r'^/taxii2/(?P<api_root_id>[^/]+)/collections/(?P<id>[^/]+)/$', 'collection'),
+        # shadowed by api_root
+        (r'^/taxii2/(?P<api_root_id>[^/]+)/$', 'shadowed'),
+        (r'^/taxii2/(?P<x>[^/]+)/(?P=x)/$', 'same'),
+        (r'^/prefix/', 'prefix'),
+    ]
+    router = EndpointRouter((re.compile(regex), handler) for regex, handler in mapping)
+    assert router.match(path) == expected
+
+
+def test_taxii2_endpoint(server):
+    endpoint = server.get_endpoint('/taxii2/api-root/collections/col/objects/')
+    assert endpoint.server is server.servers.taxii2
+    handler = endpoint.args[0]
+    assert handler.func.__name__ == 'objects_handler'
+    assert handler.keywords == {
+        'api_root_id': 'api-root',
+        'collection_id_or_alias': 'col',
+    }
+    assert server.get_endpoint('/taxii2/api-root/unknown/') is None
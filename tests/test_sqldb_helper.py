@@ -0,0 +1,114 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+from opentaxii.persistence.sqldb import Taxii2SQLDatabaseAPI
+from opentaxii.sqldb_helper import (
+    _set_statement_timeout,
+    get_engine,
+    get_engines_pool_stats,
+    get_pool_stats,
+)
+
+
+def test_shared_engines(server):
+    taxii1_api = server.servers.taxii1.persistence.api
+    taxii2_api = server.servers.taxii2.persistence.api
+    # taxii1 and taxii2 are configured with the same database
+    assert taxii1_api.db.engine is taxii2_api.db.engine
+    assert get_engine("sqlite://", pool={"pre_ping": True}) is get_engine(
+        "sqlite://", pool={"pre_ping": True}
+    )
+    assert get_engine("sqlite://", pool={"pre_ping": True}) is not get_engine(
+        "sqlite://", pool={"pre_ping": False}
+    )
+    names = [name for name in get_engines_pool_stats() if name.startswith("sqlite://")]
+    assert len(names) >= 2
+
+
+def test_pool_settings(dbconn):
+    engine = get_engine(
+        dbconn,
+        pool={"size": 1, "max_overflow": 0, "timeout": 1, "recycle": 10},
+        poolclass=QueuePool,
+    )
+    assert engine.pool.size() == 1
+    assert engine.pool._recycle == 10
+    with engine.connect():
+        stats = get_pool_stats(engine)
+        assert stats["checked_out"] == 1
+        assert stats["max_connections"] == 1
+        assert stats["saturated_checkouts"] == 1
+    assert get_pool_stats(engine)["checked_in"] == 1
+    assert get_pool_stats(get_engine(dbconn, poolclass=NullPool)) == {
+        "saturated_checkouts": 0
+    }
+
+
+def test_pool_settings_without_queue_pool():
+    engine = get_engine(
+        "sqlite://", pool={"size": 1, "pre_ping": True}, poolclass=StaticPool
+    )
+    assert engine.pool._pre_ping
+    with pytest.raises(ValueError):
+        get_engine("sqlite://", pool={"nope": 1})
+
+
+def test_statement_timeout_unsupported():
+    with patch("opentaxii.sqldb_helper.log") as log:
+        get_engine("sqlite://", statement_timeout_secs=1.5)
+    log.warning.assert_called_once_with(
+        "db.statement_timeout.unsupported", dialect="sqlite"
+    )
+
+
+def test_set_statement_timeout():
+    dbapi_connection = Mock()
+    _set_statement_timeout("SET statement_timeout = 1500")(dbapi_connection, None)
+    dbapi_connection.cursor().execute.assert_called_once_with(
+        "SET statement_timeout = 1500"
+    )
+    dbapi_connection.commit.assert_called_once_with()
+
+
+@pytest.fixture()
+def replicated_api(tmp_path):
+    api = Taxii2SQLDatabaseAPI(
+        f"sqlite:///{tmp_path}/primary.db",
+        create_tables=True,
+        replica_connections=[
+            f"sqlite:///{tmp_path}/missing/replica.db",
+            f"sqlite:///{tmp_path}/replica.db",
+        ],
+    )
+    api.db.metadata.create_all(bind=api.db.replicas[1])
+    yield api
+    api.db.session.remove()
+
+
+def test_read_replicas(replicated_api):
+    api = replicated_api
+    api_root = api.add_api_root(title="primary only")
+    with patch("opentaxii.sqldb_helper.log") as log:
+        # the first replica cannot be reached, the second one is empty
+        assert api.get_api_roots() == []
+    assert log.warning.call_args[0][0] == "db.replica.down"
+    assert not api.db.is_replica_up(api.db.replicas[0])
+    # reads that are part of writes stay on the primary
+    assert api.get_api_root(api_root.id) == api_root
+    assert api.db.session.info["replica"] is api.db.replicas[1]
+
+    api.db.mark_replica_down(api.db.replicas[1])
+    assert api.get_api_roots() == [api_root]
+
+
+def test_iterate_from_replica(replicated_api):
+    db = replicated_api.db
+
+    def binds():
+        for _ in range(2):
+            yield db.get_read_bind()
+
+    assert list(db.iterate_from(db.replicas[1], binds())) == [db.replicas[1]] * 2
+    assert db.get_read_bind() is None
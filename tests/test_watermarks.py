@@ -0,0 +1,57 @@
+import datetime
+from unittest.mock import patch
+
+from opentaxii.persistence.sqldb.models import CollectionWatermark
+from opentaxii.taxii.entities import ContentBindingEntity, ContentBlockEntity
+
+from .fixtures import CB_STIX_XML_111, COLLECTION_OPEN, COLLECTIONS_A
+
+
+def test_collection_watermarks(server):
+    api = server.servers.taxii1.persistence.api
+    collection = api.create_collection(COLLECTIONS_A[0])
+
+    def watermark():
+        row = api.db.session.query(CollectionWatermark).get(collection.id)
+        api.db.session.refresh(row)
+        return row.count, row.sequence
+
+    def assert_past_watermark(**kwargs):
+        with patch.object(api, "_get_content_query", side_effect=AssertionError):
+            assert api.get_content_blocks(collection.id, **kwargs) == []
+            assert api.get_content_blocks_count(collection.id, **kwargs) == 0
+
+    assert watermark() == (0, 0)
+    assert_past_watermark()
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    blocks = [
+        ContentBlockEntity(
+            content=b"<content/>",
+            timestamp_label=now - datetime.timedelta(minutes=minutes),
+            content_binding=ContentBindingEntity(CB_STIX_XML_111),
+        )
+        for minutes in (2, 1)
+    ]
+    api.create_content_block(blocks[0], collection_ids=[collection.id])
+    api.create_content_blocks([(blocks[1], [collection.id])])
+    assert watermark() == (2, 2)
+    last = blocks[1].timestamp_label
+    assert_past_watermark(start_time=last)
+    assert (
+        len(
+            api.get_content_blocks(
+                collection.id, start_time=last - datetime.timedelta(seconds=1)
+            )
+        )
+        == 1
+    )
+    assert len(api.get_content_blocks(collection.id)) == 2
+
+    api.delete_content_blocks(COLLECTION_OPEN, start_time=blocks[0].timestamp_label)
+    assert watermark() == (1, 3)
+
+    api.db.session.query(CollectionWatermark).delete()
+    api.db.session.commit()
+    assert api.backfill_watermarks() == 1
+    assert watermark() == (1, 1)